@@ -0,0 +1,117 @@
+# analytics.py - Revenue reports for the Invoice Generator
+"""
+Reports behind the /analytics page and the dashboard counters. They read
+pre-aggregated rows only: invoice_monthly_rollup for the time series,
+status totals and collection rate, and the per-currency client rollups
+for top clients. A chart over years of invoices therefore touches a few rows per
+month instead of every invoice.
+"""
+from datetime import date
+
+from models import db, Client, ClientCurrencyRollup, InvoiceMonthlyRollup, OUTSTANDING_STATUSES, add_months, month_of
+
+# Months offered on the analytics page; None means all history
+ANALYTICS_RANGES = [6, 12, 24, 60, None]
+BASIC_ANALYTICS_MONTHS = 12
+
+
+def rollup_currencies(user_id):
+    """Currencies the user has invoiced in, most used first"""
+    invoices = db.func.sum(InvoiceMonthlyRollup.invoice_count)
+    rows = db.session.execute(
+        db.select(InvoiceMonthlyRollup.currency)
+        .where(InvoiceMonthlyRollup.user_id == user_id, InvoiceMonthlyRollup.invoice_count > 0)
+        .group_by(InvoiceMonthlyRollup.currency)
+        .order_by(invoices.desc())
+    )
+    return [currency for currency, in rows]
+
+
+def status_totals(user_id):
+    """{status: (invoice count, amount)} over all of a user's invoices"""
+    rollup = InvoiceMonthlyRollup
+    rows = db.session.execute(
+        db.select(rollup.status, db.func.sum(rollup.invoice_count), db.func.sum(rollup.total_amount))
+        .where(rollup.user_id == user_id)
+        .group_by(rollup.status)
+    )
+    return {status: (count or 0, amount or 0.0) for status, count, amount in rows}
+
+
+def revenue_series(user_id, currency, months=12, today=None):
+    """Invoiced, collected and outstanding amounts per month, oldest first.
+
+    Drafts are left out. Every month in the range is present, with zeros
+    for months without invoices. `months=None` starts at the first month
+    with invoices.
+    """
+    last = month_of(today or date.today())
+    rollup = InvoiceMonthlyRollup
+    query = (
+        db.select(rollup.month, rollup.status,
+                  db.func.sum(rollup.invoice_count), db.func.sum(rollup.total_amount))
+        .where(rollup.user_id == user_id, rollup.currency == currency, rollup.status != 'draft')
+        .group_by(rollup.month, rollup.status)
+    )
+    if months:
+        first = add_months(last, 1 - months)
+        query = query.where(rollup.month >= first)
+
+    by_month = {}
+    for month, status, count, amount in db.session.execute(query):
+        entry = by_month.setdefault(month, {'invoices': 0, 'invoiced': 0.0, 'collected': 0.0, 'outstanding': 0.0})
+        entry['invoices'] += count or 0
+        entry['invoiced'] += amount or 0
+        if status == 'paid':
+            entry['collected'] += amount or 0
+        elif status in OUTSTANDING_STATUSES + ('overdue',):
+            entry['outstanding'] += amount or 0
+
+    if not months:
+        first = min(by_month, default=last)
+    series, month = [], first
+    while month <= last:
+        entry = by_month.get(month, {'invoices': 0, 'invoiced': 0.0, 'collected': 0.0, 'outstanding': 0.0})
+        series.append({'month': month, **entry})
+        month = add_months(month, 1)
+    return series
+
+
+def collection_rate(series):
+    """Share of the invoiced amount that has been paid, or None with nothing invoiced"""
+    invoiced = sum(point['invoiced'] for point in series)
+    if not invoiced:
+        return None
+    return sum(point['collected'] for point in series) / invoiced
+
+
+def top_clients(user_id, currency, limit=10):
+    """Clients by lifetime value in one currency, from the per-currency client rollups"""
+    rollup = ClientCurrencyRollup
+    return db.session.execute(
+        db.select(Client.id, Client.name, rollup.invoice_count, rollup.outstanding, rollup.lifetime_value)
+        .select_from(rollup)
+        .join(Client, Client.id == rollup.client_id)
+        .where(rollup.user_id == user_id, rollup.currency == currency, rollup.lifetime_value > 0)
+        .order_by(rollup.lifetime_value.desc())
+        .limit(limit)
+    ).all()
+
+
+def analytics_report(user, currency=None, months=12, today=None, include_clients=True):
+    """Everything the analytics page shows for one user and currency"""
+    currencies = rollup_currencies(user.id)
+    if currency not in currencies:
+        currency = user.default_currency if user.default_currency in currencies or not currencies else currencies[0]
+    series = revenue_series(user.id, currency, months, today)
+    return {
+        'currency': currency,
+        'currencies': currencies,
+        'months': months,
+        'series': series,
+        'invoiced': sum(point['invoiced'] for point in series),
+        'collected': sum(point['collected'] for point in series),
+        'outstanding': sum(point['outstanding'] for point in series),
+        'collection_rate': collection_rate(series),
+        'top_clients': top_clients(user.id, currency) if include_clients else []
+    }
@@ -2,43 +2,70 @@
 import warnings
 warnings.filterwarnings('ignore')
 
-from flask import Flask, render_template_string, redirect, url_for, flash, request, send_file, jsonify, session
-from flask_sqlalchemy import SQLAlchemy
-from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
-from flask_wtf.csrf import CSRFProtect
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import Flask, Blueprint, current_app, render_template, stream_template, redirect, url_for, flash, request, send_file, jsonify, session, make_response, has_request_context, g, get_flashed_messages
+from flask_login import LoginManager, login_user, logout_user, login_required, current_user
+from flask_wtf.csrf import CSRFProtect, generate_csrf
+from jinja2 import ChoiceLoader, DictLoader
+from werkzeug.security import generate_password_hash
 from datetime import datetime, timedelta
+from types import SimpleNamespace
+from collections import deque
+from functools import wraps
+import importlib.util
 import os
 import secrets
-import re
 import io
 import logging
 import uuid
-from decimal import Decimal
+import hashlib
+import json
+import gzip
+import shutil
+import click
+import threading
+import time
+import asyncio
+import csv
+import math
+import signal
+import itertools
+import tempfile
+import multiprocessing
+from werkzeug.http import is_resource_modified
+from werkzeug.middleware.proxy_fix import ProxyFix
+from sqlalchemy import event, exc as sa_exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool, QueuePool
+
+from models import (
+    db, CURRENCIES, SCHEMA_VERSION, User, Invoice, InvoiceItem,
+    validate_email, sanitize_input, build_invoice, get_supported_currencies, format_currency, get_exchange_rate, convert_currency,
+    can_create_invoice, get_invoice_usage, get_membership_tier, membership_tiers, downgrade_expired_subscriptions,
+    get_schema_version, upgrade_schema, begin_write, WRITE_TRANSACTION, VERSION_1_SCHEMA, schema_differences,
+    RoutingSession, REPLICA_BIND, USE_REPLICA,
+    RecurringInvoice, RECURRING_FREQUENCIES, generate_recurring_invoices,
+    InvoiceAging, AGING_BUCKETS, mark_overdue_invoices, refresh_invoice_aging,
+    Client, Job, InvoicePdf, InvoiceEmail, Webhook, WebhookDelivery, WEBHOOK_EVENTS, webhook_event, assign_client, backfill_invoice_clients, rebuild_monthly_rollups,
+    invoice_list_query, invoice_rows, invoice_item_rows
+)
+from logconfig import ACCESS_LOGGER, configure_logging, dropped_records
+from entitlements import FEATURES, configure_entitlements, entitlements, load_tiers
+from pdffonts import HELVETICA, configure_fonts, pdf_fonts
+from analytics import ANALYTICS_RANGES, BASIC_ANALYTICS_MONTHS, analytics_report, status_totals
+from jobs import JobResult, enqueue, job_counts, job_handler, oldest_queued_age, work
+from mailer import build_message, deliver
+from webhooks import WEBHOOKS_AVAILABLE, dispatch, webhook_url_error
+from throttling import dummy_password_check, login_throttle
 
 # Load environment variables
 try:
     from dotenv import load_dotenv
     load_dotenv()
 except ImportError:
-    print("python-dotenv not available, using default configuration")
+    pass
 
-# Flask Configuration
-app = Flask(__name__)
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///invoices.db')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['WTF_CSRF_TIME_LIMIT'] = 3600
-app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=24)
-
-# Windows-friendly cookie settings
-app.config['SESSION_COOKIE_SECURE'] = os.environ.get('SESSION_COOKIE_SECURE', 'False').lower() == 'true'
-app.config['SESSION_COOKIE_HTTPONLY'] = True
-app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
-
-# Initialize extensions
-db = SQLAlchemy(app)
-csrf = CSRFProtect(app)
+# Extensions are created unbound and attached to each app in create_app()
+csrf = CSRFProtect()
 
 # Rate limiting setup (with better error handling)
 try:
@@ -46,12 +73,11 @@ try:
     from flask_limiter.util import get_remote_address
     
     limiter = Limiter(
-        app=app,
         key_func=get_remote_address,
         default_limits=["1000 per day", "200 per hour"],
         headers_enabled=True
     )
-    print("✅ Rate limiting enabled")
+    RATE_LIMITING_AVAILABLE = True
 except ImportError:
     # Mock limiter when flask-limiter is not available
     class MockLimiter:
@@ -59,416 +85,591 @@ except ImportError:
             def decorator(f):
                 return f
             return decorator
+        
+        def exempt(self, f):
+            return f
+        
+        def init_app(self, app):
+            pass
     limiter = MockLimiter()
-    print("⚠️  Rate limiting disabled (Flask-Limiter not available)")
-except Exception as e:
-    # Mock limiter for any other rate limiting errors
-    class MockLimiter:
-        def limit(self, limit_string):
-            def decorator(f):
-                return f
-            return decorator
-    limiter = MockLimiter()
-    print(f"⚠️  Rate limiting disabled due to error: {e}")
-
-# Logging configuration
-logging.basicConfig(level=logging.INFO)
-app.logger.setLevel(logging.INFO)
-
-# Login Manager
-login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'
-login_manager.login_message = 'Please log in to access this page.'
-login_manager.login_message_category = 'info'
-
-# Check for PDF libraries
-PDF_AVAILABLE = False
-PDF_METHOD = None
+    RATE_LIMITING_AVAILABLE = False
 
+# Static asset pipeline configuration
 try:
-    from reportlab.lib.pagesizes import A4
-    from reportlab.platypus import SimpleDocumentTemplate, Paragraph, Spacer, Table, TableStyle
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.units import inch
-    from reportlab.lib import colors
-    PDF_AVAILABLE = True
-    PDF_METHOD = "reportlab"
-    print("✅ ReportLab available - PDF generation enabled")
+    import brotli
+    BROTLI_AVAILABLE = True
 except ImportError:
-    print("⚠️  ReportLab not available - PDF generation disabled")
-
-# Membership Tiers Configuration
-MEMBERSHIP_TIERS = {
-    'free': {
-        'name': 'Free',
-        'price': 0,
-        'invoice_limit': 5,
-        'features': [
-            'Up to 5 invoices per month',
-            'Basic templates',
-            'PDF export',
-            'Basic currency support'
-        ],
-        'color': 'gray',
-        'popular': False
-    },
-    'starter': {
-        'name': 'Starter',
-        'price': 9,
-        'invoice_limit': 25,
-        'features': [
-            'Up to 25 invoices per month',
-            'All templates',
-            'Advanced PDF export',
-            'Multi-currency support',
-            'Email integration',
-            'Basic analytics'
-        ],
-        'color': 'blue',
-        'popular': False
-    },
-    'professional': {
-        'name': 'Professional',
-        'price': 19,
-        'invoice_limit': 100,
-        'features': [
-            'Up to 100 invoices per month',
-            'Premium templates',
-            'Advanced customization',
-            'Full currency conversion',
-            'Advanced analytics',
-            'Priority support',
-            'Custom branding'
-        ],
-        'color': 'purple',
-        'popular': True
-    },
-    'business': {
-        'name': 'Business',
-        'price': 39,
-        'invoice_limit': -1,  # Unlimited
-        'features': [
-            'Unlimited invoices',
-            'All premium features',
-            'API access',
-            'Team collaboration',
-            'Advanced integrations',
-            'Custom workflows',
-            'White-label solution',
-            'Dedicated support'
-        ],
-        'color': 'green',
-        'popular': False
+    BROTLI_AVAILABLE = False
+
+ASSET_BUILD_DIR = 'dist'
+ASSET_MANIFEST = 'manifest.json'
+ASSET_EXTENSIONS = ('.css', '.js', '.svg', '.png', '.jpg', '.gif', '.ico', '.woff', '.woff2')
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg')
+
+# Database connection pool
+# Pools are per process: a gunicorn deployment can open up to
+# workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections to the database.
+class PoolStats:
+    """Counters for connection checkouts, collected from pool events"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_count = 0
+        self.wait_seconds = 0.0
+        self.wait_max = 0.0
+
+    def record_wait(self, seconds, timed_out=False):
+        with self.lock:
+            self.wait_count += 1
+            self.wait_seconds += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            if timed_out:
+                self.timeouts += 1
+
+    def increment(self, counter):
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waits for a connection"""
+    stats = None
+
+    def _do_get(self):
+        start = time.perf_counter()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except sa_exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            if self.stats is not None:
+                self.stats.record_wait(time.perf_counter() - start, timed_out)
+
+    def recreate(self):
+        # engine.dispose() swaps in a fresh pool; keep counting into the same stats
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+def env_flag(name, default):
+    return os.environ.get(name, str(default)).lower() in ('1', 'true', 'yes', 'on')
+
+def database_engine_options(config, url=None):
+    """SQLAlchemy engine options for the pool settings in `config`"""
+    url = make_url(url or config['SQLALCHEMY_DATABASE_URI'])
+    backend = url.get_backend_name()
+    options = {}
+    
+    if backend == 'sqlite' and url.database in (None, '', ':memory:'):
+        # Flask-SQLAlchemy pins in-memory SQLite to a single StaticPool connection
+        return options
+    
+    if config['DB_PGBOUNCER']:
+        # PgBouncer owns the pool; hold no idle connections in the app
+        options['poolclass'] = NullPool
+        return options
+    
+    options.update(
+        poolclass=InstrumentedQueuePool,
+        pool_size=config['DB_POOL_SIZE'],
+        max_overflow=config['DB_MAX_OVERFLOW'],
+        pool_timeout=config['DB_POOL_TIMEOUT'],
+        pool_recycle=config['DB_POOL_RECYCLE'],
+        pool_pre_ping=config['DB_POOL_PRE_PING']
+    )
+    if backend == 'postgresql' and config['DB_STATEMENT_TIMEOUT']:
+        options['connect_args'] = {'options': f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT']}"}
+    return options
+
+def count_statement(conn, cursor, statement, parameters, context, executemany):
+    """Count the request's SQL statements for its access log record"""
+    if has_request_context():
+        g.sql_count = g.get('sql_count', 0) + 1
+
+def instrument_engine(engine, config):
+    """Attach pool metrics and, behind PgBouncer, the per-transaction statement timeout"""
+    stats = PoolStats()
+    event.listen(engine, 'connect', lambda dbapi_conn, record: stats.increment('connects'))
+    event.listen(engine, 'checkout', lambda dbapi_conn, record, proxy: stats.increment('checkouts'))
+    event.listen(engine, 'before_cursor_execute', count_statement)
+    if isinstance(engine.pool, InstrumentedQueuePool):
+        engine.pool.stats = stats
+    
+    timeout = config['DB_STATEMENT_TIMEOUT']
+    if config['DB_PGBOUNCER'] and timeout and engine.dialect.name == 'postgresql':
+        # Startup parameters are rejected in transaction pooling mode, and a
+        # session-level SET would leak to other clients of the server connection
+        @event.listens_for(engine, 'begin')
+        def set_statement_timeout(conn):
+            conn.exec_driver_sql(f'SET LOCAL statement_timeout = {int(timeout)}')
+    return stats
+
+def pool_status(engine, stats):
+    """Live pool occupancy plus the counters collected since start-up"""
+    pool = engine.pool
+    status = {
+        'pool_class': type(pool).__name__,
+        'connections_opened': stats.connects,
+        'checkouts': stats.checkouts,
+        'checkout_timeouts': stats.timeouts,
+        'checkout_wait_count': stats.wait_count,
+        'checkout_wait_seconds': stats.wait_seconds,
+        'checkout_wait_max_seconds': stats.wait_max
     }
-}
-
-# Enhanced Currency Configuration
-CURRENCIES = {
-    # Major Currencies
-    'USD': {'name': 'US Dollar', 'symbol': '$', 'code': 'USD', 'decimal_places': 2},
-    'EUR': {'name': 'Euro', 'symbol': '€', 'code': 'EUR', 'decimal_places': 2},
-    'GBP': {'name': 'British Pound', 'symbol': '£', 'code': 'GBP', 'decimal_places': 2},
-    'JPY': {'name': 'Japanese Yen', 'symbol': '¥', 'code': 'JPY', 'decimal_places': 0},
-    'CHF': {'name': 'Swiss Franc', 'symbol': 'CHF', 'code': 'CHF', 'decimal_places': 2},
-    
-    # Americas
-    'CAD': {'name': 'Canadian Dollar', 'symbol': 'C$', 'code': 'CAD', 'decimal_places': 2},
-    'BRL': {'name': 'Brazilian Real', 'symbol': 'R$', 'code': 'BRL', 'decimal_places': 2},
-    'MXN': {'name': 'Mexican Peso', 'symbol': '$', 'code': 'MXN', 'decimal_places': 2},
-    'ARS': {'name': 'Argentine Peso', 'symbol': '$', 'code': 'ARS', 'decimal_places': 2},
-    
-    # Asia Pacific
-    'CNY': {'name': 'Chinese Yuan', 'symbol': '¥', 'code': 'CNY', 'decimal_places': 2},
-    'INR': {'name': 'Indian Rupee', 'symbol': '₹', 'code': 'INR', 'decimal_places': 2},
-    'KRW': {'name': 'South Korean Won', 'symbol': '₩', 'code': 'KRW', 'decimal_places': 0},
-    'AUD': {'name': 'Australian Dollar', 'symbol': 'A$', 'code': 'AUD', 'decimal_places': 2},
-    'NZD': {'name': 'New Zealand Dollar', 'symbol': 'NZ$', 'code': 'NZD', 'decimal_places': 2},
-    'SGD': {'name': 'Singapore Dollar', 'symbol': 'S$', 'code': 'SGD', 'decimal_places': 2},
-    'HKD': {'name': 'Hong Kong Dollar', 'symbol': 'HK$', 'code': 'HKD', 'decimal_places': 2},
-    'THB': {'name': 'Thai Baht', 'symbol': '฿', 'code': 'THB', 'decimal_places': 2},
-    'MYR': {'name': 'Malaysian Ringgit', 'symbol': 'RM', 'code': 'MYR', 'decimal_places': 2},
-    'PHP': {'name': 'Philippine Peso', 'symbol': '₱', 'code': 'PHP', 'decimal_places': 2},
-    'IDR': {'name': 'Indonesian Rupiah', 'symbol': 'Rp', 'code': 'IDR', 'decimal_places': 0},
-    'VND': {'name': 'Vietnamese Dong', 'symbol': '₫', 'code': 'VND', 'decimal_places': 0},
-    
-    # Europe
-    'NOK': {'name': 'Norwegian Krone', 'symbol': 'kr', 'code': 'NOK', 'decimal_places': 2},
-    'SEK': {'name': 'Swedish Krona', 'symbol': 'kr', 'code': 'SEK', 'decimal_places': 2},
-    'DKK': {'name': 'Danish Krone', 'symbol': 'kr', 'code': 'DKK', 'decimal_places': 2},
-    'PLN': {'name': 'Polish Zloty', 'symbol': 'zł', 'code': 'PLN', 'decimal_places': 2},
-    'CZK': {'name': 'Czech Koruna', 'symbol': 'Kč', 'code': 'CZK', 'decimal_places': 2},
-    'HUF': {'name': 'Hungarian Forint', 'symbol': 'Ft', 'code': 'HUF', 'decimal_places': 0},
-    'RON': {'name': 'Romanian Leu', 'symbol': 'lei', 'code': 'RON', 'decimal_places': 2},
-    'BGN': {'name': 'Bulgarian Lev', 'symbol': 'лв', 'code': 'BGN', 'decimal_places': 2},
-    'HRK': {'name': 'Croatian Kuna', 'symbol': 'kn', 'code': 'HRK', 'decimal_places': 2},
-    'RUB': {'name': 'Russian Ruble', 'symbol': '₽', 'code': 'RUB', 'decimal_places': 2},
-    'UAH': {'name': 'Ukrainian Hryvnia', 'symbol': '₴', 'code': 'UAH', 'decimal_places': 2},
-    'TRY': {'name': 'Turkish Lira', 'symbol': '₺', 'code': 'TRY', 'decimal_places': 2},
-    
-    # Middle East & Africa
-    'AED': {'name': 'UAE Dirham', 'symbol': 'د.إ', 'code': 'AED', 'decimal_places': 2},
-    'SAR': {'name': 'Saudi Riyal', 'symbol': '﷼', 'code': 'SAR', 'decimal_places': 2},
-    'QAR': {'name': 'Qatari Riyal', 'symbol': '﷼', 'code': 'QAR', 'decimal_places': 2},
-    'ILS': {'name': 'Israeli Shekel', 'symbol': '₪', 'code': 'ILS', 'decimal_places': 2},
-    'EGP': {'name': 'Egyptian Pound', 'symbol': '£', 'code': 'EGP', 'decimal_places': 2},
-    'ZAR': {'name': 'South African Rand', 'symbol': 'R', 'code': 'ZAR', 'decimal_places': 2},
-    'NGN': {'name': 'Nigerian Naira', 'symbol': '₦', 'code': 'NGN', 'decimal_places': 2},
-    'KES': {'name': 'Kenyan Shilling', 'symbol': 'KSh', 'code': 'KES', 'decimal_places': 2},
-    
-    # Cryptocurrencies (for progressive businesses)
-    'BTC': {'name': 'Bitcoin', 'symbol': '₿', 'code': 'BTC', 'decimal_places': 8},
-    'ETH': {'name': 'Ethereum', 'symbol': 'Ξ', 'code': 'ETH', 'decimal_places': 6},
-}
-
-# Input validation helpers
-def validate_email(email):
-    pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    return re.match(pattern, email) is not None
-
-def sanitize_input(text, max_length=None):
-    if text is None:
-        return ""
-    text = str(text).strip()
-    if max_length:
-        text = text[:max_length]
-    text = re.sub(r'[<>"\']', '', text)
-    return text
-
-# Currency Helper Functions
-def get_supported_currencies():
-    return CURRENCIES
-
-def format_currency(amount, currency_code):
-    """Format amount according to currency specifications"""
-    if currency_code not in CURRENCIES:
-        currency_code = 'USD'
-    
-    currency = CURRENCIES[currency_code]
-    decimal_places = currency['decimal_places']
-    symbol = currency['symbol']
-    
-    if decimal_places == 0:
-        return f"{symbol}{int(amount):,}"
-    else:
-        return f"{symbol}{amount:,.{decimal_places}f}"
-
-def get_exchange_rate(from_currency, to_currency):
-    """Get exchange rate between currencies - mock implementation"""
-    # In a real app, you'd use an API like exchangerate-api.com or fixer.io
-    # For demo purposes, returning mock rates
-    mock_rates = {
-        ('USD', 'EUR'): 0.85,
-        ('USD', 'GBP'): 0.73,
-        ('USD', 'JPY'): 110.0,
-        ('USD', 'CAD'): 1.25,
-        ('USD', 'AUD'): 1.35,
-        ('EUR', 'USD'): 1.18,
-        ('GBP', 'USD'): 1.37,
+    if isinstance(pool, QueuePool):
+        capacity = pool.size() + max(pool._max_overflow, 0)
+        status.update(
+            size=pool.size(),
+            capacity=capacity,
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            overflow=max(pool.overflow(), 0),
+            saturation=pool.checkedout() / capacity if capacity else 0.0
+        )
+    return status
+
+# SQLite engine profile
+# Applied to every connection. WAL lets readers carry on while a writer
+# commits; writes take the lock up front through begin_write().
+def configure_sqlite(engine, config):
+    """Set pragmas and explicit transaction handling on a SQLite engine"""
+    if config['SQLITE_PROFILE'] != 'production':
+        return
+    in_memory = engine.url.database in (None, '', ':memory:')
+    pragmas = {
+        'busy_timeout': config['SQLITE_BUSY_TIMEOUT'],
+        'synchronous': config['SQLITE_SYNCHRONOUS'],
+        'cache_size': config['SQLITE_CACHE_SIZE'],
+        'mmap_size': config['SQLITE_MMAP_SIZE']
     }
     
-    if from_currency == to_currency:
-        return 1.0
-    
-    rate_key = (from_currency, to_currency)
-    if rate_key in mock_rates:
-        return mock_rates[rate_key]
-    
-    # Try reverse rate
-    reverse_key = (to_currency, from_currency)
-    if reverse_key in mock_rates:
-        return 1.0 / mock_rates[reverse_key]
-    
-    # Default fallback
-    return 1.0
-
-def convert_currency(amount, from_currency, to_currency):
-    """Convert amount between currencies"""
-    rate = get_exchange_rate(from_currency, to_currency)
-    return Decimal(str(amount)) * Decimal(str(rate))
-
-# Membership Helper Functions
-def get_membership_tier(tier_name):
-    """Get membership tier configuration"""
-    return MEMBERSHIP_TIERS.get(tier_name, MEMBERSHIP_TIERS['free'])
-
-def can_create_invoice(user):
-    """Check if user can create another invoice based on their tier"""
-    tier = get_membership_tier(user.membership_tier)
-    if tier['invoice_limit'] == -1:  # Unlimited
-        return True
-    
-    # Count invoices created this month
-    now = datetime.utcnow()
-    start_of_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    invoices_this_month = Invoice.query.filter(
-        Invoice.user_id == user.id,
-        Invoice.created_at >= start_of_month
-    ).count()
-    
-    return invoices_this_month < tier['invoice_limit']
-
-def get_invoice_usage(user):
-    """Get current invoice usage for the user"""
-    tier = get_membership_tier(user.membership_tier)
-    now = datetime.utcnow()
-    start_of_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    used = Invoice.query.filter(
-        Invoice.user_id == user.id,
-        Invoice.created_at >= start_of_month
-    ).count()
-    
-    return {
-        'used': used,
-        'limit': tier['invoice_limit'],
-        'percentage': (used / tier['invoice_limit'] * 100) if tier['invoice_limit'] > 0 else 0
-    }
-
-# Models
-class User(UserMixin, db.Model):
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    email = db.Column(db.String(120), unique=True, nullable=False, index=True)
-    password_hash = db.Column(db.String(255), nullable=False)
-    company_name = db.Column(db.String(200))
-    default_currency = db.Column(db.String(3), default='USD')
-    membership_tier = db.Column(db.String(20), default='free')
-    subscription_expires = db.Column(db.DateTime)
-    is_active = db.Column(db.Boolean, default=True)
-    failed_login_attempts = db.Column(db.Integer, default=0)
-    last_login_attempt = db.Column(db.DateTime)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    invoices = db.relationship('Invoice', backref='user', lazy=True)
-
-    def set_password(self, password):
-        if len(password) < 8:
-            raise ValueError("Password must be at least 8 characters long")
-        self.password_hash = generate_password_hash(password)
-
-    def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
-    
-    @property
-    def is_premium(self):
-        """Backward compatibility property"""
-        return self.membership_tier != 'free'
-    
-    def get_tier_info(self):
-        """Get detailed tier information"""
-        return get_membership_tier(self.membership_tier)
-    
-    def can_access_feature(self, feature):
-        """Check if user can access a specific feature"""
-        tier_features = {
-            'advanced_templates': ['professional', 'business'],
-            'currency_conversion': ['professional', 'business'],
-            'analytics': ['starter', 'professional', 'business'],
-            'api_access': ['business'],
-            'custom_branding': ['professional', 'business'],
-            'priority_support': ['professional', 'business']
-        }
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_conn, record):
+        # Stop the driver from issuing its own deferred BEGIN before writes
+        dbapi_conn.isolation_level = None
+        cursor = dbapi_conn.cursor()
+        if not in_memory:
+            cursor.execute('PRAGMA journal_mode=WAL')
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+    
+    @event.listens_for(engine, 'begin')
+    def begin_sqlite_transaction(conn):
+        mode = 'IMMEDIATE' if conn.get_execution_options().get(WRITE_TRANSACTION) else 'DEFERRED'
+        conn.exec_driver_sql(f'BEGIN {mode}')
+
+# Streaming
+# Long pages render piece by piece while their rows are fetched, instead of
+# being built in memory first. Pieces go out in blocks of about
+# STREAM_BUFFER_SIZE bytes; a STREAM_FLUSH comment in a template sends
+# everything rendered so far at once.
+STREAM_FLUSH = '<!-- flush -->'
+
+def stream_page(template_name, **context):
+    """Stream a page template as a chunked response.
+
+    The session is saved before the body is sent, so flashed messages are
+    read (and removed from the session) up front rather than by the template.
+    """
+    context.setdefault('flashed_messages', get_flashed_messages(with_categories=True))
+    chunks = stream_template(template_name, **context)
+    buffer_size = current_app.config['STREAM_BUFFER_SIZE']
+    logger = current_app.logger
+    
+    def generate():
+        buffer, size = [], 0
+        try:
+            for chunk in chunks:
+                buffer.append(chunk)
+                size += len(chunk)
+                if size >= buffer_size or STREAM_FLUSH in chunk:
+                    yield ''.join(buffer)
+                    buffer, size = [], 0
+        except Exception as e:
+            # Headers are already sent, so all we can do is end the page
+            logger.error(f'Error streaming {template_name}: {str(e)}')
+        if buffer:
+            yield ''.join(buffer)
+    
+    response = current_app.response_class(generate(), mimetype='text/html')
+    response.headers['X-Accel-Buffering'] = 'no'  # let nginx pass chunks straight through
+    return response
+
+# Read replica
+# read_only() views send their queries to the replica bind when
+# REPLICA_DATABASE_URL is set. A user reads from the primary for a while
+# after their own writes, and everyone does while the replica is failing.
+PRIMARY_READS_UNTIL = '_primary_reads_until'
+
+def replica_available():
+    return REPLICA_BIND in db.engines and time.time() >= current_app.extensions['replica_down_until']
+
+def mark_replica_down(error):
+    if time.time() >= current_app.extensions['replica_down_until']:
+        current_app.logger.warning(f'Read replica unavailable, using the primary: {error}')
+    current_app.extensions['replica_down_until'] = time.time() + current_app.config['REPLICA_RETRY_INTERVAL']
+
+def replica_failure(error):
+    """Whether a read_only() view should re-raise `error` so it is retried on the primary"""
+    return isinstance(error, sa_exc.DBAPIError) and db.session.info.get(USE_REPLICA, False)
+
+def read_only(view):
+    """Run a view that only reads against the read replica where possible.
+
+    A database error raised while reading from the replica runs the view
+    again on the primary. Views that catch Exception must re-raise
+    replica_failure() errors so that retry can happen.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if session.get(PRIMARY_READS_UNTIL, 0) > time.time() or not replica_available():
+            return view(*args, **kwargs)
         
-        return self.membership_tier in tier_features.get(feature, [])
-
-class Invoice(db.Model):
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    user_id = db.Column(db.String(36), db.ForeignKey('user.id'), nullable=False)
-    invoice_number = db.Column(db.String(50), nullable=False)
-    client_name = db.Column(db.String(200), nullable=False)
-    client_email = db.Column(db.String(120))
-    client_address = db.Column(db.Text)
-    issue_date = db.Column(db.Date, nullable=False)
-    due_date = db.Column(db.Date, nullable=False)
-    currency = db.Column(db.String(3), default='USD')
-    subtotal = db.Column(db.Float, default=0.0)
-    tax_rate = db.Column(db.Float, default=0.0)
-    tax_amount = db.Column(db.Float, default=0.0)
-    total = db.Column(db.Float, default=0.0)
-    notes = db.Column(db.Text)
-    status = db.Column(db.String(20), default='draft')
-    template_style = db.Column(db.String(20), default='modern')
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    items = db.relationship('InvoiceItem', backref='invoice', lazy=True, cascade='all, delete-orphan')
-
-    def get_currency_info(self):
-        """Get currency information"""
-        return CURRENCIES.get(self.currency, CURRENCIES['USD'])
-
-    def format_amount(self, amount):
-        """Format amount with proper currency symbol and decimal places"""
-        return format_currency(amount, self.currency)
-
-    def convert_to_currency(self, target_currency):
-        """Convert invoice amounts to target currency"""
-        if self.currency == target_currency:
-            return self
+        db_session = db.session()
+        try:
+            # Check out (and pre-ping) a replica connection before the view runs
+            db_session.connection(bind_arguments={'bind': db.engines[REPLICA_BIND]})
+        except sa_exc.DBAPIError as e:
+            mark_replica_down(e)
+            db_session.rollback()
+            return view(*args, **kwargs)
         
-        rate = get_exchange_rate(self.currency, target_currency)
-        converted_invoice = {
-            'subtotal': float(convert_currency(self.subtotal, self.currency, target_currency)),
-            'tax_amount': float(convert_currency(self.tax_amount, self.currency, target_currency)),
-            'total': float(convert_currency(self.total, self.currency, target_currency)),
-            'currency': target_currency,
-            'exchange_rate': rate,
-            'original_currency': self.currency
-        }
-        return converted_invoice
+        db_session.info[USE_REPLICA] = True
+        try:
+            return view(*args, **kwargs)
+        except sa_exc.DBAPIError as e:
+            if not db_session.info.pop(USE_REPLICA, None):
+                raise
+            mark_replica_down(e)
+            db_session.rollback()
+            return view(*args, **kwargs)
+    return wrapper
+
+@event.listens_for(RoutingSession, 'after_flush')
+def remember_write(db_session, flush_context):
+    """Pin the user's reads to the primary until the replica has caught up"""
+    if has_request_context() and current_app.config['REPLICA_DATABASE_URL']:
+        session[PRIMARY_READS_UNTIL] = int(time.time()) + current_app.config['REPLICA_READ_YOUR_WRITES']
 
-class InvoiceItem(db.Model):
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    invoice_id = db.Column(db.String(36), db.ForeignKey('invoice.id'), nullable=False)
-    description = db.Column(db.String(500), nullable=False)
-    quantity = db.Column(db.Float, default=1.0)
-    rate = db.Column(db.Float, nullable=False)
-    amount = db.Column(db.Float, nullable=False)
+# Login Manager
+login_manager = LoginManager()
+login_manager.login_view = 'main.login'
+login_manager.login_message = 'Please log in to access this page.'
+login_manager.login_message_category = 'info'
+
+# Check for PDF libraries without importing them; ReportLab is loaded
+# on the first PDF request so worker start-up doesn't pay for it
+PDF_AVAILABLE = importlib.util.find_spec('reportlab') is not None
+PDF_METHOD = "reportlab" if PDF_AVAILABLE else None
+_reportlab = None
+
+def load_reportlab():
+    """Import the ReportLab components used by generate_pdf() on first use"""
+    global _reportlab
+    if _reportlab is None:
+        from reportlab.lib.pagesizes import A4
+        from reportlab.lib.units import inch
+        from reportlab.pdfgen.canvas import Canvas
+        from reportlab.platypus import SimpleDocTemplate, Frame, Paragraph, Spacer, Table, TableStyle
+        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+        from reportlab.lib import colors
+        from reportlab.lib.utils import simpleSplit
+        _reportlab = SimpleNamespace(
+            A4=A4, inch=inch, Canvas=Canvas, SimpleDocTemplate=SimpleDocTemplate, Frame=Frame,
+            Paragraph=Paragraph, Spacer=Spacer, Table=Table, TableStyle=TableStyle,
+            getSampleStyleSheet=getSampleStyleSheet, ParagraphStyle=ParagraphStyle, colors=colors,
+            simpleSplit=simpleSplit
+        )
+    return _reportlab
+
+bp = Blueprint('main', __name__, cli_group=None)
+
+def create_app(config=None):
+    """Create and configure an application instance"""
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///invoices.db')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['WTF_CSRF_TIME_LIMIT'] = 3600
+    app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=24)
+    
+    # Windows-friendly cookie settings
+    app.config['SESSION_COOKIE_SECURE'] = os.environ.get('SESSION_COOKIE_SECURE', 'False').lower() == 'true'
+    app.config['SESSION_COOKIE_HTTPONLY'] = True
+    app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
+    
+    # Rate limiting can be switched off for local load testing
+    app.config['RATELIMIT_ENABLED'] = os.environ.get('RATELIMIT_ENABLED', 'True').lower() == 'true'
+    
+    # Connection pool, per worker process
+    app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', 5))
+    app.config['DB_MAX_OVERFLOW'] = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    app.config['DB_POOL_TIMEOUT'] = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+    app.config['DB_POOL_RECYCLE'] = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    app.config['DB_POOL_PRE_PING'] = env_flag('DB_POOL_PRE_PING', True)
+    app.config['DB_STATEMENT_TIMEOUT'] = int(os.environ.get('DB_STATEMENT_TIMEOUT', 0))  # milliseconds, Postgres only
+    app.config['DB_PGBOUNCER'] = env_flag('DB_PGBOUNCER', False)
+    
+    # Optional read replica for read_only() views
+    app.config['REPLICA_DATABASE_URL'] = os.environ.get('REPLICA_DATABASE_URL')
+    app.config['REPLICA_READ_YOUR_WRITES'] = int(os.environ.get('REPLICA_READ_YOUR_WRITES', 15))  # seconds
+    app.config['REPLICA_RETRY_INTERVAL'] = int(os.environ.get('REPLICA_RETRY_INTERVAL', 30))  # seconds
+    
+    # SQLite tuning; 'default' keeps the driver's own settings
+    app.config['SQLITE_PROFILE'] = os.environ.get('SQLITE_PROFILE', 'production')
+    app.config['SQLITE_BUSY_TIMEOUT'] = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000))  # milliseconds
+    app.config['SQLITE_SYNCHRONOUS'] = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    app.config['SQLITE_CACHE_SIZE'] = int(os.environ.get('SQLITE_CACHE_SIZE', -64000))  # negative means KiB
+    app.config['SQLITE_MMAP_SIZE'] = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+    
+    # Streamed pages: rows fetched per cursor batch, bytes sent per write
+    app.config['DASHBOARD_STREAMING'] = env_flag('DASHBOARD_STREAMING', True)
+    app.config['DASHBOARD_BATCH_SIZE'] = int(os.environ.get('DASHBOARD_BATCH_SIZE', 200))
+    app.config['STREAM_BUFFER_SIZE'] = int(os.environ.get('STREAM_BUFFER_SIZE', 16384))
+    
+    # Invoice PDFs: past PDF_LARGE_INVOICE_ITEMS items, render page by page (see generate_large_pdf())
+    app.config['PDF_LARGE_INVOICE_ITEMS'] = int(os.environ.get('PDF_LARGE_INVOICE_ITEMS', 200))
+    app.config['PDF_ROWS_PER_TABLE'] = int(os.environ.get('PDF_ROWS_PER_TABLE', 40))
+    app.config['PDF_ITEM_BATCH_SIZE'] = int(os.environ.get('PDF_ITEM_BATCH_SIZE', 500))
+    app.config['PDF_SPOOL_MAX_MEMORY'] = int(os.environ.get('PDF_SPOOL_MAX_MEMORY', 2 * 1024 * 1024))  # bytes, then disk
+    # Unicode fonts for text Helvetica can't draw; .ttf paths separated by os.pathsep (see pdffonts.py)
+    app.config['PDF_FONTS'] = [path for path in os.environ.get('PDF_FONTS', '').split(os.pathsep) if path]
+    
+    # Background jobs (jobs.py): retries back off from BASE to MAX seconds
+    app.config['JOB_MAX_ATTEMPTS'] = int(os.environ.get('JOB_MAX_ATTEMPTS', 5))
+    app.config['JOB_BACKOFF_BASE'] = int(os.environ.get('JOB_BACKOFF_BASE', 10))
+    app.config['JOB_BACKOFF_MAX'] = int(os.environ.get('JOB_BACKOFF_MAX', 3600))
+    app.config['JOB_TIMEOUT'] = int(os.environ.get('JOB_TIMEOUT', 600))  # seconds before a running job is retried
+    app.config['JOB_POLL_INTERVAL'] = float(os.environ.get('JOB_POLL_INTERVAL', 1.0))
+    app.config['JOB_RETENTION_DAYS'] = int(os.environ.get('JOB_RETENTION_DAYS', 7))
+    
+    # Outgoing email (mailer.py). Test against a sink: python -m aiosmtpd -n -l localhost:8025
+    app.config['MAIL_SERVER'] = os.environ.get('MAIL_SERVER', 'localhost')
+    app.config['MAIL_PORT'] = int(os.environ.get('MAIL_PORT', 25))
+    app.config['MAIL_USE_TLS'] = env_flag('MAIL_USE_TLS', False)
+    app.config['MAIL_USE_SSL'] = env_flag('MAIL_USE_SSL', False)
+    app.config['MAIL_USERNAME'] = os.environ.get('MAIL_USERNAME')
+    app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD')
+    app.config['MAIL_DEFAULT_SENDER'] = os.environ.get('MAIL_DEFAULT_SENDER', 'Invoice Generator <invoices@localhost>')
+    app.config['MAIL_TIMEOUT'] = int(os.environ.get('MAIL_TIMEOUT', 30))
+    app.config['MAIL_POOL_SIZE'] = int(os.environ.get('MAIL_POOL_SIZE', 2))  # open connections per process
+    app.config['MAIL_MAX_PER_CONNECTION'] = int(os.environ.get('MAIL_MAX_PER_CONNECTION', 100))
+    app.config['MAIL_IDLE_TIMEOUT'] = int(os.environ.get('MAIL_IDLE_TIMEOUT', 60))
+    app.config['MAIL_BATCH_SIZE'] = int(os.environ.get('MAIL_BATCH_SIZE', 50))  # messages per job
+    app.config['MAIL_RATE_LIMIT'] = float(os.environ.get('MAIL_RATE_LIMIT', 10))  # messages/second per worker
+    
+    # Webhook delivery (webhooks.py); CONCURRENCY is requests in flight per endpoint
+    app.config['WEBHOOK_BATCH_SIZE'] = int(os.environ.get('WEBHOOK_BATCH_SIZE', 20))
+    app.config['WEBHOOK_CONCURRENCY'] = int(os.environ.get('WEBHOOK_CONCURRENCY', 2))
+    app.config['WEBHOOK_MAX_CONNECTIONS'] = int(os.environ.get('WEBHOOK_MAX_CONNECTIONS', 100))
+    app.config['WEBHOOK_CLAIM_LIMIT'] = int(os.environ.get('WEBHOOK_CLAIM_LIMIT', 1000))
+    app.config['WEBHOOK_TIMEOUT'] = float(os.environ.get('WEBHOOK_TIMEOUT', 10))
+    app.config['WEBHOOK_MAX_ATTEMPTS'] = int(os.environ.get('WEBHOOK_MAX_ATTEMPTS', 10))
+    app.config['WEBHOOK_BACKOFF_BASE'] = int(os.environ.get('WEBHOOK_BACKOFF_BASE', 30))
+    app.config['WEBHOOK_BACKOFF_MAX'] = int(os.environ.get('WEBHOOK_BACKOFF_MAX', 6 * 3600))
+    app.config['WEBHOOK_POLL_INTERVAL'] = float(os.environ.get('WEBHOOK_POLL_INTERVAL', 1.0))
+    app.config['WEBHOOK_RETENTION_DAYS'] = int(os.environ.get('WEBHOOK_RETENTION_DAYS', 7))
+    app.config['WEBHOOK_ALLOW_PRIVATE'] = env_flag('WEBHOOK_ALLOW_PRIVATE', False)  # endpoints on internal addresses
+    
+    # Login throttle (throttling.py): failures allowed per account and per IP within the window
+    app.config['LOGIN_THROTTLE_WINDOW'] = int(os.environ.get('LOGIN_THROTTLE_WINDOW', 900))  # seconds
+    app.config['LOGIN_ACCOUNT_MAX_FAILURES'] = int(os.environ.get('LOGIN_ACCOUNT_MAX_FAILURES', 5))
+    app.config['LOGIN_IP_MAX_FAILURES'] = int(os.environ.get('LOGIN_IP_MAX_FAILURES', 50))
+    app.config['LOGIN_THROTTLE_REDIS_URL'] = os.environ.get('LOGIN_THROTTLE_REDIS_URL', os.environ.get('REDIS_URL'))
+    app.config['LOGIN_COUNTER_FLUSH_INTERVAL'] = float(os.environ.get('LOGIN_COUNTER_FLUSH_INTERVAL', 5))
+    # Reverse proxies in front of the app whose X-Forwarded-For/-Proto are trusted (1 behind nginx),
+    # so throttles and rate limits see client addresses rather than the proxy's
+    app.config['TRUSTED_PROXIES'] = int(os.environ.get('TRUSTED_PROXIES', 0))
+    
+    # Bearer token for /metrics; leave unset to rely on the network (nginx denies it)
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+    
+    # Logging (logconfig.py): written by a background thread, to LOG_DIR when set
+    app.config['LOG_LEVEL'] = os.environ.get('LOG_LEVEL', 'INFO').upper()
+    app.config['LOG_FORMAT'] = os.environ.get('LOG_FORMAT', 'json')  # json or text
+    app.config['LOG_DIR'] = os.environ.get('LOG_DIR')
+    app.config['LOG_FILE'] = os.environ.get('LOG_FILE', 'invoicer.log')
+    app.config['LOG_MAX_BYTES'] = int(os.environ.get('LOG_MAX_BYTES', 10 * 1024 * 1024))
+    app.config['LOG_BACKUP_COUNT'] = int(os.environ.get('LOG_BACKUP_COUNT', 5))
+    app.config['LOG_QUEUE_SIZE'] = int(os.environ.get('LOG_QUEUE_SIZE', 10000))  # records held while the writer catches up
+    app.config['LOG_ACCESS_SAMPLE_RATE'] = float(os.environ.get('LOG_ACCESS_SAMPLE_RATE', 1.0))
+    app.config['LOG_SLOW_REQUEST_MS'] = float(os.environ.get('LOG_SLOW_REQUEST_MS', 1000))
+    
+    # Membership tiers: built-in unless TIERS_FILE names a JSON definition (see entitlements.py)
+    app.config['TIERS_FILE'] = os.environ.get('TIERS_FILE')
+    app.config['TIERS_RELOAD_INTERVAL'] = float(os.environ.get('TIERS_RELOAD_INTERVAL', 5))  # seconds between file checks
+    
+    if config:
+        app.config.update(config)
+    
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', database_engine_options(app.config))
+    replica_url = app.config['REPLICA_DATABASE_URL']
+    if replica_url:
+        binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+        binds.setdefault(REPLICA_BIND, {'url': replica_url, **database_engine_options(app.config, replica_url)})
+    
+    # Before the first use of app.logger, so Flask doesn't add its own blocking handler
+    configure_logging(app.config)
+    app.logger.setLevel(app.config['LOG_LEVEL'])
+    configure_entitlements(app.config['TIERS_FILE'], app.config['TIERS_RELOAD_INTERVAL'])
+    configure_fonts(app.config['PDF_FONTS'])
+    
+    # Initialize extensions
+    db.init_app(app)
+    app.extensions['db_pool_stats'] = {}
+    app.extensions['replica_down_until'] = 0
+    app.extensions['asset_manifest'] = load_asset_manifest(app)
+    with app.app_context():
+        for bind_key, engine in db.engines.items():
+            app.extensions['db_pool_stats'][bind_key or 'primary'] = instrument_engine(engine, app.config)
+            if engine.dialect.name == 'sqlite':
+                configure_sqlite(engine, app.config)
+    csrf.init_app(app)
+    login_manager.init_app(app)
+    try:
+        limiter.init_app(app)
+    except Exception as e:
+        app.logger.warning(f'Rate limiting disabled due to error: {e}')
+    
+    # Page templates are compiled once and cached by Jinja, rather than
+    # re-parsed on every render_template_string() call
+    app.jinja_loader = ChoiceLoader([DictLoader(PAGE_TEMPLATES), app.jinja_loader])
+    
+    app.register_blueprint(bp)
+    if app.config['TRUSTED_PROXIES']:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXIES'],
+                                x_proto=app.config['TRUSTED_PROXIES'])
+    return app
+
+def verify_schema(app):
+    """Fail fast when the database schema is missing or older than the code.
+
+    Serving processes run this single query instead of create_all(); the
+    schema itself is created and upgraded by `flask init-db`.
+    """
+    with app.app_context():
+        version = get_schema_version()
+        # Don't hand the check's connection down to forked (--preload) workers
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+    if version is None or version < SCHEMA_VERSION:
+        raise RuntimeError(
+            f'Database schema is at version {version}, expected {SCHEMA_VERSION}. '
+            f'Run "flask --app app init-db" first.'
+        )
+    return version
 
 @login_manager.user_loader
 def load_user(user_id):
     return User.query.get(user_id)
 
 # PDF Generation
+def pdf_styles(rl, font):
+    styles = rl.getSampleStyleSheet()
+    if font is not HELVETICA:
+        # The TrueType fonts have no italic faces; Heading2 loses its slant
+        faces = {'Helvetica': font.regular, 'Helvetica-Oblique': font.regular,
+                 'Helvetica-Bold': font.bold, 'Helvetica-BoldOblique': font.bold}
+        for name in ('Normal', 'Title', 'Heading2', 'Heading3'):
+            styles[name].fontName = faces.get(styles[name].fontName, styles[name].fontName)
+    styles.add(rl.ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Title'],
+        fontSize=24,
+        spaceAfter=30
+    ))
+    return styles
+
+def pdf_texts(invoice):
+    """Invoice text other than the items that a PDF font has to be able to draw"""
+    return (invoice.invoice_number, invoice.client_name, invoice.client_email, invoice.client_address,
+            invoice.notes, invoice.get_currency_info()['symbol'])
+
+def pdf_header(invoice, rl, styles):
+    """Title, invoice details and bill-to block that open every invoice PDF"""
+    story = []
+    
+    # Header
+    story.append(rl.Paragraph("INVOICE", styles['CustomTitle']))
+    story.append(rl.Spacer(1, 20))
+    
+    # Invoice details
+    story.append(rl.Paragraph(f"<b>Invoice #:</b> {invoice.invoice_number}", styles['Normal']))
+    story.append(rl.Paragraph(f"<b>Date:</b> {invoice.issue_date.strftime('%B %d, %Y')}", styles['Normal']))
+    story.append(rl.Paragraph(f"<b>Due Date:</b> {invoice.due_date.strftime('%B %d, %Y')}", styles['Normal']))
+    story.append(rl.Spacer(1, 30))
+    
+    # Client info
+    story.append(rl.Paragraph("<b>Bill To:</b>", styles['Heading2']))
+    story.append(rl.Paragraph(sanitize_input(invoice.client_name, 200), styles['Normal']))
+    if invoice.client_email:
+        story.append(rl.Paragraph(sanitize_input(invoice.client_email, 120), styles['Normal']))
+    if invoice.client_address:
+        story.append(rl.Paragraph(sanitize_input(invoice.client_address, 500), styles['Normal']))
+    
+    story.append(rl.Spacer(1, 30))
+    return story
+
+def pdf_totals(invoice, rl, styles, symbol):
+    """Totals and notes that close every invoice PDF"""
+    story = [rl.Spacer(1, 20)]
+    story.append(rl.Paragraph(f"<b>Subtotal:</b> {format_currency(invoice.subtotal, invoice.currency, symbol)}", styles['Normal']))
+    story.append(rl.Paragraph(f"<b>Tax ({invoice.tax_rate}%):</b> {format_currency(invoice.tax_amount, invoice.currency, symbol)}", styles['Normal']))
+    story.append(rl.Paragraph(f"<b>Total:</b> {format_currency(invoice.total, invoice.currency, symbol)}", styles['Heading2']))
+    
+    if invoice.notes:
+        story.append(rl.Spacer(1, 30))
+        story.append(rl.Paragraph("<b>Notes:</b>", styles['Heading3']))
+        story.append(rl.Paragraph(sanitize_input(invoice.notes, 1000), styles['Normal']))
+    return story
+
+def pdf_table_style(rl, font):
+    return rl.TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), rl.colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), rl.colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 1), (-1, -1), font.regular),
+        ('FONTNAME', (0, 0), (-1, 0), font.bold),
+        ('FONTSIZE', (0, 0), (-1, 0), 14),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), rl.colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, rl.colors.black)
+    ])
+
+def invoice_item_count(invoice):
+    if 'items' in invoice.__dict__:
+        return len(invoice.items)
+    return db.session.scalar(db.select(db.func.count(InvoiceItem.id)).where(InvoiceItem.invoice_id == invoice.id))
+
 def generate_pdf(invoice):
+    """Render an invoice to a PDF file object, rewound.
+
+    Invoices with more than PDF_LARGE_INVOICE_ITEMS items go through
+    generate_large_pdf() instead of one in-memory table.
+    """
     if not PDF_AVAILABLE:
         raise Exception("PDF generation not available - ReportLab not installed")
     
     try:
-        buffer = io.BytesIO()
-        doc = SimpleDocumentTemplate(buffer, pagesize=A4)
-        
-        styles = getSampleStyleSheet()
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Title'],
-            fontSize=24,
-            spaceAfter=30
-        )
-        
-        story = []
-        
-        # Header
-        story.append(Paragraph("INVOICE", title_style))
-        story.append(Spacer(1, 20))
-        
-        # Invoice details
-        story.append(Paragraph(f"<b>Invoice #:</b> {invoice.invoice_number}", styles['Normal']))
-        story.append(Paragraph(f"<b>Date:</b> {invoice.issue_date.strftime('%B %d, %Y')}", styles['Normal']))
-        story.append(Paragraph(f"<b>Due Date:</b> {invoice.due_date.strftime('%B %d, %Y')}", styles['Normal']))
-        story.append(Spacer(1, 30))
+        if invoice_item_count(invoice) > current_app.config['PDF_LARGE_INVOICE_ITEMS']:
+            return generate_large_pdf(invoice)
         
-        # Client info
-        story.append(Paragraph(f"<b>Bill To:</b>", styles['Heading2']))
-        story.append(Paragraph(sanitize_input(invoice.client_name, 200), styles['Normal']))
-        if invoice.client_email:
-            story.append(Paragraph(sanitize_input(invoice.client_email, 120), styles['Normal']))
-        if invoice.client_address:
-            story.append(Paragraph(sanitize_input(invoice.client_address, 500), styles['Normal']))
-        
-        story.append(Spacer(1, 30))
+        rl = load_reportlab()
+        buffer = io.BytesIO()
+        font = pdf_fonts().select(itertools.chain(pdf_texts(invoice), (item.description for item in invoice.items)))
+        doc = rl.SimpleDocTemplate(buffer, pagesize=rl.A4)
+        styles = pdf_styles(rl, font)
+        story = pdf_header(invoice, rl, styles)
         
         # Items table
         currency_info = invoice.get_currency_info()
-        symbol = currency_info['symbol']
+        symbol = font.currency_symbol(currency_info)
         
         item_data = [['Description', 'Qty', 'Rate', 'Amount']]
         for item in invoice.items:
@@ -479,46 +680,353 @@ def generate_pdf(invoice):
                 f"{symbol}{item.amount:.{currency_info['decimal_places']}f}"
             ])
         
-        items_table = Table(item_data)
-        items_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 14),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
+        items_table = rl.Table(item_data)
+        items_table.setStyle(pdf_table_style(rl, font))
         
         story.append(items_table)
-        story.append(Spacer(1, 20))
-        
-        # Totals
-        story.append(Paragraph(f"<b>Subtotal:</b> {invoice.format_amount(invoice.subtotal)}", styles['Normal']))
-        story.append(Paragraph(f"<b>Tax ({invoice.tax_rate}%):</b> {invoice.format_amount(invoice.tax_amount)}", styles['Normal']))
-        story.append(Paragraph(f"<b>Total:</b> {invoice.format_amount(invoice.total)}", styles['Heading2']))
-        
-        if invoice.notes:
-            story.append(Spacer(1, 30))
-            story.append(Paragraph("<b>Notes:</b>", styles['Heading3']))
-            story.append(Paragraph(sanitize_input(invoice.notes, 1000), styles['Normal']))
+        story.extend(pdf_totals(invoice, rl, styles, symbol))
         
         doc.build(story)
         buffer.seek(0)
         return buffer
     except Exception as e:
-        app.logger.error(f"PDF generation error: {str(e)}")
+        current_app.logger.error(f"PDF generation error: {str(e)}")
+        raise
+
+def fill_frame(frame, flowables, canvas):
+    """Draw flowables off the front of a deque until the frame is full.
+
+    The first one that doesn't fit is split, and its remainder left at the
+    front for the next page.
+    """
+    drawn = False
+    while flowables:
+        flowable = flowables.popleft()
+        if frame.add(flowable, canvas):
+            drawn = True
+            continue
+        parts = frame.split(flowable, canvas)
+        if not parts:
+            if not drawn:
+                raise ValueError(f'{type(flowable).__name__} is too large for a page')
+            flowables.appendleft(flowable)
+            return
+        frame.add(parts[0], canvas)
+        flowables.extendleft(reversed(parts[1:]))
+        return
+
+def generate_large_pdf(invoice):
+    """Render an invoice with many items page by page into a spooled temporary file.
+
+    Items are read PDF_ITEM_BATCH_SIZE rows at a time and laid out in tables
+    of PDF_ROWS_PER_TABLE rows with the header row repeated, and only the
+    next couple of tables are built ahead of the page being drawn, so memory
+    stays flat however long the invoice is. The output stays in memory up to
+    PDF_SPOOL_MAX_MEMORY bytes and moves to disk beyond that.
+    """
+    rl = load_reportlab()
+    config = current_app.config
+    # One extra pass over the descriptions, so the font covers every page
+    font = pdf_fonts().select(itertools.chain(
+        pdf_texts(invoice),
+        (row[0] for row in invoice_item_rows(invoice.id, batch_size=config['PDF_ITEM_BATCH_SIZE']))
+    ))
+    styles = pdf_styles(rl, font)
+    currency_info = invoice.get_currency_info()
+    symbol, places = font.currency_symbol(currency_info), currency_info['decimal_places']
+    page_width, page_height = rl.A4
+    margin = rl.inch
+    width = page_width - 2 * margin
+    col_widths = [width * 0.52, width * 0.12, width * 0.18, width * 0.18]
+    # Table cells are 10pt with 6pt padding each side; long
+    # descriptions wrap within their column instead of widening the table
+    description_width = col_widths[0] - 12
+    
+    rows = invoice_item_rows(invoice.id, batch_size=config['PDF_ITEM_BATCH_SIZE'])
+    
+    def next_table():
+        chunk = list(itertools.islice(rows, config['PDF_ROWS_PER_TABLE']))
+        if not chunk:
+            return None
+        item_data = [['Description', 'Qty', 'Rate', 'Amount']]
+        for description, quantity, rate, amount in chunk:
+            item_data.append([
+                '\n'.join(rl.simpleSplit(sanitize_input(description, 500), font.regular, 10, description_width)),
+                str(quantity),
+                f"{symbol}{rate:.{places}f}",
+                f"{symbol}{amount:.{places}f}"
+            ])
+        table = rl.Table(item_data, colWidths=col_widths, repeatRows=1)
+        table.setStyle(pdf_table_style(rl, font))
+        return table
+    
+    output = tempfile.SpooledTemporaryFile(max_size=config['PDF_SPOOL_MAX_MEMORY'])
+    try:
+        canvas = rl.Canvas(output, pagesize=rl.A4, pageCompression=1)
+        pending = deque(pdf_header(invoice, rl, styles))
+        tables_done = False
+        page = 0
+        while True:
+            # Build tables only as the pages reach them
+            while not tables_done and sum(isinstance(f, rl.Table) for f in pending) < 2:
+                table = next_table()
+                if table is None:
+                    pending.extend(pdf_totals(invoice, rl, styles, symbol))
+                    tables_done = True
+                else:
+                    pending.append(table)
+            if not pending:
+                break
+            page += 1
+            fill_frame(rl.Frame(margin, margin, width, page_height - 2 * margin), pending, canvas)
+            canvas.setFont(font.regular, 8)
+            canvas.drawRightString(page_width - margin, margin / 2,
+                                   f'Invoice {invoice.invoice_number} - page {page}')
+            canvas.showPage()
+        canvas.save()
+        output.seek(0)
+        return output
+    except Exception:
+        output.close()
         raise
 
+def pdf_fingerprint(invoice):
+    """Hash of everything generate_pdf() renders, so status changes don't invalidate it.
+
+    Items are read as plain rows in batches rather than loaded as objects.
+    """
+    return etag_of(itertools.chain(
+        (PDF_METHOD, pdf_fonts().signature, invoice.invoice_number, invoice.issue_date, invoice.due_date,
+         invoice.client_name, invoice.client_email, invoice.client_address, invoice.currency,
+         invoice.subtotal, invoice.tax_rate, invoice.tax_amount, invoice.total, invoice.notes),
+        invoice_item_rows(invoice.id, batch_size=current_app.config['PDF_ITEM_BATCH_SIZE'])
+    ))
+
+def stored_pdf(invoice, fingerprint=None):
+    """The invoice's stored PDF if it is still current, else None"""
+    stored = db.session.get(InvoicePdf, invoice.id, options=[db.undefer(InvoicePdf.data)])
+    if stored is not None and stored.etag == (fingerprint or pdf_fingerprint(invoice)):
+        return stored.data
+    return None
+
+def cached_invoice_pdf(invoice):
+    """PDF bytes for an invoice, rendered once and reused for resends and downloads.
+
+    Stores a fresh rendering when the invoice has changed, so call it inside
+    a write transaction.
+    """
+    fingerprint = pdf_fingerprint(invoice)
+    data = stored_pdf(invoice, fingerprint)
+    if data is None:
+        with generate_pdf(invoice) as pdf_file:
+            data = pdf_file.read()
+        db.session.merge(InvoicePdf(invoice_id=invoice.id, etag=fingerprint, data=data))
+    return data
+
+# Conditional request helpers
+def build_etag(*parts):
+    """Build a strong ETag value from the parts that determine a response"""
+    return etag_of(parts)
+
+def etag_of(parts):
+    """build_etag() over any iterable, consumed one part at a time"""
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\x00')
+    return digest.hexdigest()
+
+def invoice_validators(invoice, user, *extra):
+    """Get the (etag, last_modified) pair for a per-user view of an invoice.
+
+    The invoice's updated_at covers edits to the invoice itself, while the
+    user's updated_at acts as the settings version: tier, currency and
+    company changes all bump it and can alter what is rendered. The
+    effective tier's key and feature bits cover a subscription lapsing and
+    a reloaded tier definition.
+    """
+    timestamps = [ts for ts in (invoice.updated_at, user.updated_at) if ts]
+    last_modified = max(timestamps) if timestamps else None
+    etag = build_etag(invoice.id, invoice.updated_at, user.id, user.updated_at,
+                      user.tier.key, user.tier.mask, *extra)
+    return etag, last_modified
+
+def csrf_validators(etag, last_modified=None):
+    """Tie a page's (etag, last_modified) to the CSRF tokens its forms embed.
+
+    Tokens are bound to the session's token seed and expire
+    WTF_CSRF_TIME_LIMIT seconds after they were signed. The ETag covers the
+    seed and a window half the time limit long, and Last-Modified is no
+    earlier than the window's start, so a cached page is only revalidated
+    while its tokens have at least half their lifetime left. The seed is
+    created here if the session has none yet, rather than by the render.
+    """
+    generate_csrf()
+    seed = session.get(current_app.config.get('WTF_CSRF_FIELD_NAME', 'csrf_token'))
+    limit = current_app.config.get('WTF_CSRF_TIME_LIMIT')
+    if not limit:
+        return build_etag(etag, seed), last_modified
+    window = max(1, limit // 2)
+    started = int(time.time()) // window * window
+    window_start = datetime.utcfromtimestamp(started)
+    if last_modified is None or last_modified < window_start:
+        last_modified = window_start
+    return build_etag(etag, seed, started), last_modified
+
+def not_modified_response(etag, last_modified=None):
+    """Return a 304 response if the client's cached copy is still valid.
+
+    Returns None when the full response has to be produced. Requests with
+    pending flash messages are never answered with 304, otherwise the
+    messages would stay queued until some later page.
+    """
+    if request.method not in ('GET', 'HEAD') or session.get('_flashes'):
+        return None
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return None
+    response = current_app.response_class(status=304)
+    return add_cache_validators(response, etag, last_modified)
+
+def add_cache_validators(response, etag, last_modified=None):
+    """Attach ETag/Last-Modified headers to a private, revalidated response"""
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+# Static asset pipeline
+def asset_digest(path):
+    """Get a short content hash for a static file"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+def precompress_asset(path):
+    """Write .gz (and .br when brotli is installed) siblings of a built asset"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    # mtime=0 keeps the gzip output byte-identical across builds
+    with open(path + '.gz', 'wb') as f:
+        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    if BROTLI_AVAILABLE:
+        with open(path + '.br', 'wb') as f:
+            f.write(brotli.compress(data, quality=11))
+
+def build_assets(static_folder=None):
+    """Fingerprint static assets into the build directory and write the manifest.
+
+    Every asset is copied to ``<build dir>/<name>.<hash>.<ext>`` together with
+    precompressed variants, so the web server can serve them as immutable
+    files without compressing on the fly. Files from earlier builds are kept
+    so pages rendered before a deploy can still load their assets.
+    """
+    static_folder = static_folder or current_app.static_folder
+    build_dir = os.path.join(static_folder, ASSET_BUILD_DIR)
+    manifest = {}
+    
+    for root, dirs, files in os.walk(static_folder):
+        rel_root = os.path.relpath(root, static_folder)
+        if rel_root == '.':
+            # Skip build output and user uploads
+            dirs[:] = [d for d in dirs if d not in (ASSET_BUILD_DIR, 'uploads')]
+        for filename in sorted(files):
+            name, ext = os.path.splitext(filename)
+            if ext.lower() not in ASSET_EXTENSIONS:
+                continue
+            source = os.path.join(root, filename)
+            logical_name = os.path.normpath(os.path.join(rel_root, filename)).replace(os.sep, '/')
+            hashed_name = os.path.normpath(os.path.join(rel_root, f'{name}.{asset_digest(source)}{ext}')).replace(os.sep, '/')
+            target = os.path.join(build_dir, hashed_name)
+            
+            if not os.path.exists(target):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.copyfile(source, target)
+                if ext.lower() in COMPRESSIBLE_EXTENSIONS:
+                    precompress_asset(target)
+            manifest[logical_name] = f'{ASSET_BUILD_DIR}/{hashed_name}'
+    
+    os.makedirs(build_dir, exist_ok=True)
+    manifest_path = os.path.join(build_dir, ASSET_MANIFEST)
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+    return manifest
+
+def load_asset_manifest(app):
+    """Read the asset manifest; an app loads it once, at start-up.
+
+    A deploy runs build-assets before starting the workers, so a running
+    process never needs to look for a newer manifest.
+    """
+    manifest_path = os.path.join(app.static_folder, ASSET_BUILD_DIR, ASSET_MANIFEST)
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        app.logger.error(f'Asset manifest error: {str(e)}')
+        return {}
+
+@bp.app_template_global()
+def static_url(filename):
+    """URL for a static file, using its fingerprinted build when available"""
+    return url_for('static', filename=current_app.extensions['asset_manifest'].get(filename, filename))
+
+@bp.cli.command('build-assets')
+def build_assets_command():
+    """Fingerprint and precompress static assets."""
+    manifest = build_assets()
+    current_app.extensions['asset_manifest'] = manifest
+    for logical_name, hashed_name in sorted(manifest.items()):
+        click.echo(f'{logical_name} -> {hashed_name}')
+    if not BROTLI_AVAILABLE:
+        click.echo('⚠️  brotli not installed - skipped .br variants')
+    click.echo(f'✅ Built {len(manifest)} assets')
+
+# Request logging
+access_log = logging.getLogger(ACCESS_LOGGER)
+
+@bp.before_app_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@bp.after_app_request
+def log_request(response):
+    """Write the access record once the response has been sent, streamed bodies included"""
+    state = g._get_current_object()
+    started = state.get('request_started', time.perf_counter())
+    fields = {
+        'method': request.method,
+        'path': request.path,
+        'route': request.url_rule.rule if request.url_rule else None,
+        'user_id': getattr(state.get('_login_user'), 'id', None),
+        'status': response.status_code
+    }
+    slow_ms = current_app.config['LOG_SLOW_REQUEST_MS']
+    
+    def write():
+        latency_ms = (time.perf_counter() - started) * 1000
+        access_log.info(f"{fields['method']} {fields['path']} {fields['status']}",
+                        extra={**fields, 'latency_ms': round(latency_ms, 2), 'sql_count': state.get('sql_count', 0),
+                               'keep': fields['status'] >= 500 or latency_ms >= slow_ms})
+    
+    response.call_on_close(write)
+    return response
+
 # Routes
-@app.route('/')
+@bp.route('/')
 def index():
     if current_user.is_authenticated:
-        return redirect(url_for('dashboard'))
-    return render_template_string(INDEX_TEMPLATE, tiers=MEMBERSHIP_TIERS)
+        return redirect(url_for('main.dashboard'))
+    return render_template('pages/index.html', tiers=membership_tiers())
 
-@app.route('/register', methods=['GET', 'POST'])
+@bp.route('/register', methods=['GET', 'POST'])
 @limiter.limit("5 per minute")
 def register():
     if request.method == 'POST':
@@ -531,24 +1039,24 @@ def register():
             
             if not validate_email(email):
                 flash('Invalid email address.', 'error')
-                return render_template_string(REGISTER_TEMPLATE, 
+                return render_template('pages/register.html', 
                                             currencies=get_supported_currencies(),
-                                            tiers=MEMBERSHIP_TIERS)
+                                            tiers=membership_tiers())
             
             if len(password) < 8:
                 flash('Password must be at least 8 characters long.', 'error')
-                return render_template_string(REGISTER_TEMPLATE, 
+                return render_template('pages/register.html', 
                                             currencies=get_supported_currencies(),
-                                            tiers=MEMBERSHIP_TIERS)
+                                            tiers=membership_tiers())
             
             if User.query.filter_by(email=email).first():
                 flash('Email already registered.', 'error')
-                return render_template_string(REGISTER_TEMPLATE, 
+                return render_template('pages/register.html', 
                                             currencies=get_supported_currencies(),
-                                            tiers=MEMBERSHIP_TIERS)
+                                            tiers=membership_tiers())
             
             # Validate tier
-            if tier not in MEMBERSHIP_TIERS:
+            if tier not in membership_tiers():
                 tier = 'free'
             
             user = User(
@@ -563,25 +1071,26 @@ def register():
                 user.subscription_expires = datetime.utcnow() + timedelta(days=30)
             
             user.set_password(password)
+            begin_write()
             db.session.add(user)
             db.session.commit()
             
             login_user(user)
             session.permanent = True
-            app.logger.info(f'New user registered: {email} ({tier} tier)')
-            flash(f'Registration successful! Welcome to {MEMBERSHIP_TIERS[tier]["name"]} tier!', 'success')
-            return redirect(url_for('dashboard'))
+            current_app.logger.info(f'New user registered: {email} ({tier} tier)')
+            flash(f'Registration successful! Welcome to {get_membership_tier(tier).name} tier!', 'success')
+            return redirect(url_for('main.dashboard'))
             
         except Exception as e:
             db.session.rollback()
-            app.logger.error(f'Registration error: {str(e)}')
+            current_app.logger.error(f'Registration error: {str(e)}')
             flash('Registration failed. Please try again.', 'error')
     
-    return render_template_string(REGISTER_TEMPLATE, 
+    return render_template('pages/register.html', 
                                 currencies=get_supported_currencies(),
-                                tiers=MEMBERSHIP_TIERS)
+                                tiers=membership_tiers())
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 @limiter.limit("10 per minute")
 def login():
     if request.method == 'POST':
@@ -591,156 +1100,117 @@ def login():
             
             if not email or not password:
                 flash('Email and password are required.', 'error')
-                return render_template_string(LOGIN_TEMPLATE)
+                return render_template('pages/login.html')
+            
+            # Refuse throttled identities before touching the database or hashing
+            throttle = login_throttle()
+            ip = request.remote_addr or 'unknown'
+            wait = throttle.retry_after(email, ip)
+            if wait:
+                current_app.logger.warning(f'Throttled login attempt for: {email} from {ip}')
+                flash(f'Too many failed attempts. Please try again in {max(1, math.ceil(wait / 60))} minutes.', 'error')
+                response = make_response(render_template('pages/login.html'), 429)
+                response.headers['Retry-After'] = str(math.ceil(wait))
+                return response
             
             user = User.query.filter_by(email=email).first()
+            valid = user.check_password(password) if user else dummy_password_check(password)
             
-            if user and user.check_password(password) and user.is_active:
+            if valid and user.is_active:
+                throttle.success(email, ip, user)
                 login_user(user, remember=True)
                 session.permanent = True
-                app.logger.info(f'User logged in: {email}')
+                current_app.logger.info(f'User logged in: {email}')
                 
                 next_page = request.args.get('next')
-                return redirect(next_page) if next_page else redirect(url_for('dashboard'))
+                return redirect(next_page) if next_page else redirect(url_for('main.dashboard'))
             else:
-                app.logger.warning(f'Failed login attempt for: {email}')
+                throttle.failure(email, ip, user)
+                current_app.logger.warning(f'Failed login attempt for: {email}')
                 flash('Invalid email or password.', 'error')
                 
         except Exception as e:
-            app.logger.error(f'Login error: {str(e)}')
+            current_app.logger.error(f'Login error: {str(e)}')
             flash('Login failed. Please try again.', 'error')
     
-    return render_template_string(LOGIN_TEMPLATE)
+    return render_template('pages/login.html')
 
-@app.route('/logout')
+@bp.route('/logout')
 @login_required
 def logout():
-    app.logger.info(f'User logged out: {current_user.email}')
+    current_app.logger.info(f'User logged out: {current_user.email}')
     logout_user()
     session.clear()
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
-@app.route('/dashboard')
+@bp.route('/dashboard')
 @login_required
+@read_only
 def dashboard():
     try:
-        invoices = Invoice.query.filter_by(user_id=current_user.id).order_by(Invoice.created_at.desc()).all()
         usage = get_invoice_usage(current_user)
-        tier_info = current_user.get_tier_info()
+        tier_info = current_user.tier
         
-        # Calculate some basic analytics
+        # Basic analytics from the monthly rollups rather than the invoice list
+        totals = status_totals(current_user.id)
         analytics = {
-            'total_invoices': len(invoices),
-            'total_value': sum(inv.total for inv in invoices),
-            'paid_invoices': len([inv for inv in invoices if inv.status == 'paid']),
-            'pending_invoices': len([inv for inv in invoices if inv.status == 'pending']),
-            'draft_invoices': len([inv for inv in invoices if inv.status == 'draft']),
+            'total_invoices': sum(count for count, _ in totals.values()),
+            'total_value': sum(amount for _, amount in totals.values()),
+            'paid_invoices': totals.get('paid', (0, 0))[0],
+            'pending_invoices': totals.get('pending', (0, 0))[0],
+            'draft_invoices': totals.get('draft', (0, 0))[0],
+            'overdue_invoices': totals.get('overdue', (0, 0))[0],
         }
+        aging = InvoiceAging.query.filter_by(user_id=current_user.id).order_by(InvoiceAging.currency).all()
         
-        return render_template_string(DASHBOARD_TEMPLATE, 
-                                    invoices=invoices, 
-                                    current_user=current_user,
-                                    usage=usage,
-                                    tier_info=tier_info,
-                                    analytics=analytics,
-                                    format_currency=format_currency)
+        invoices = invoice_list_query(current_user.id).order_by(Invoice.created_at.desc())
+        context = dict(current_user=current_user,
+                       usage=usage,
+                       tier_info=tier_info,
+                       analytics=analytics,
+                       aging=aging,
+                       aging_buckets=AGING_BUCKETS,
+                       format_currency=format_currency)
+        if current_app.config['DASHBOARD_STREAMING']:
+            return stream_page('pages/dashboard.html',
+                               invoices=invoice_rows(invoices, current_app.config['DASHBOARD_BATCH_SIZE']),
+                               **context)
+        return render_template('pages/dashboard.html', invoices=list(invoice_rows(invoices)), **context)
     except Exception as e:
-        app.logger.error(f'Dashboard error: {str(e)}')
+        if replica_failure(e):
+            raise
+        current_app.logger.error(f'Dashboard error: {str(e)}')
         flash('Error loading dashboard.', 'error')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
 
-@app.route('/create-invoice', methods=['GET', 'POST'])
+@bp.route('/create-invoice', methods=['GET', 'POST'])
 @login_required
 @limiter.limit("20 per hour")
 def create_invoice():
     try:
         # Check if user can create another invoice
         if not can_create_invoice(current_user):
-            tier_info = current_user.get_tier_info()
-            flash(f'You have reached your monthly limit of {tier_info["invoice_limit"]} invoices. Please upgrade your plan.', 'warning')
-            return redirect(url_for('upgrade'))
+            tier_info = current_user.tier
+            flash(f'You have reached your monthly limit of {tier_info.invoice_limit} invoices. Please upgrade your plan.', 'warning')
+            return redirect(url_for('main.upgrade'))
         
         if request.method == 'POST':
-            # Validate and sanitize inputs
-            invoice_number = sanitize_input(request.form.get('invoice_number', ''), 50)
-            client_name = sanitize_input(request.form.get('client_name', ''), 200)
-            client_email = sanitize_input(request.form.get('client_email', ''), 120)
-            client_address = sanitize_input(request.form.get('client_address', ''), 500)
-            notes = sanitize_input(request.form.get('notes', ''), 1000)
-            currency = request.form.get('currency', current_user.default_currency)
-            template_style = request.form.get('template_style', 'modern')
-            
-            if not invoice_number or not client_name:
-                flash('Invoice number and client name are required.', 'error')
-                return redirect(url_for('create_invoice'))
-            
-            if currency not in CURRENCIES:
-                currency = current_user.default_currency
-            
+            items = zip(request.form.getlist('description[]'),
+                        request.form.getlist('quantity[]'),
+                        request.form.getlist('rate[]'))
             try:
-                issue_date = datetime.strptime(request.form['issue_date'], '%Y-%m-%d').date()
-                due_date = datetime.strptime(request.form['due_date'], '%Y-%m-%d').date()
-                tax_rate = float(request.form.get('tax_rate', 0))
-            except (ValueError, TypeError):
-                flash('Invalid date or tax rate format.', 'error')
-                return redirect(url_for('create_invoice'))
-            
-            # Create invoice
-            invoice = Invoice(
-                user_id=current_user.id,
-                invoice_number=invoice_number,
-                client_name=client_name,
-                client_email=client_email,
-                client_address=client_address,
-                issue_date=issue_date,
-                due_date=due_date,
-                currency=currency,
-                tax_rate=tax_rate,
-                notes=notes,
-                template_style=template_style
-            )
+                invoice = build_invoice(current_user, request.form, items)
+            except ValueError as e:
+                flash(str(e), 'error')
+                return redirect(url_for('main.create_invoice'))
             
+            begin_write()
+            assign_client(invoice)
             db.session.add(invoice)
-            db.session.flush()
-            
-            # Add items
-            descriptions = request.form.getlist('description[]')
-            quantities = request.form.getlist('quantity[]')
-            rates = request.form.getlist('rate[]')
-            
-            subtotal = 0
-            for i in range(len(descriptions)):
-                if descriptions[i].strip():
-                    try:
-                        description = sanitize_input(descriptions[i], 500)
-                        quantity = float(quantities[i])
-                        rate = float(rates[i])
-                        amount = quantity * rate
-                        
-                        item = InvoiceItem(
-                            invoice_id=invoice.id,
-                            description=description,
-                            quantity=quantity,
-                            rate=rate,
-                            amount=amount
-                        )
-                        db.session.add(item)
-                        subtotal += amount
-                        
-                    except (ValueError, TypeError):
-                        flash('Invalid quantity or rate values.', 'error')
-                        db.session.rollback()
-                        return redirect(url_for('create_invoice'))
-            
-            # Calculate totals
-            invoice.subtotal = subtotal
-            invoice.tax_amount = subtotal * (tax_rate / 100)
-            invoice.total = subtotal + invoice.tax_amount
-            
             db.session.commit()
-            app.logger.info(f'Invoice created: {invoice_number} by {current_user.email}')
+            current_app.logger.info(f'Invoice created: {invoice.invoice_number} by {current_user.email}')
             flash('Invoice created successfully!', 'success')
-            return redirect(url_for('view_invoice', invoice_id=invoice.id))
+            return redirect(url_for('main.view_invoice', invoice_id=invoice.id))
         
         # Generate next invoice number
         invoice_count = Invoice.query.filter_by(user_id=current_user.id).count()
@@ -748,10 +1218,10 @@ def create_invoice():
         
         # Get available templates based on user tier
         available_templates = ['modern']
-        if current_user.can_access_feature('advanced_templates'):
+        if current_user.tier.has('advanced_templates'):
             available_templates.extend(['professional', 'creative', 'minimal'])
         
-        return render_template_string(CREATE_INVOICE_TEMPLATE, 
+        return render_template('pages/create_invoice.html', 
                                     next_number=next_number,
                                     currencies=get_supported_currencies(),
                                     available_templates=available_templates,
@@ -759,86 +1229,251 @@ def create_invoice():
                              
     except Exception as e:
         db.session.rollback()
-        app.logger.error(f'Create invoice error: {str(e)}')
+        current_app.logger.error(f'Create invoice error: {str(e)}')
         flash('Error creating invoice.', 'error')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
 
-@app.route('/invoice/<invoice_id>')
+@bp.route('/invoice/<invoice_id>')
 @login_required
+@read_only
 def view_invoice(invoice_id):
     try:
         invoice = Invoice.query.filter_by(id=invoice_id, user_id=current_user.id).first()
         if not invoice:
             flash('Invoice not found.', 'error')
-            return redirect(url_for('dashboard'))
+            return redirect(url_for('main.dashboard'))
         
         # Currency conversion option for premium users
         convert_to = request.args.get('convert_to')
+        
+        recurring = RecurringInvoice.query.filter_by(template_invoice_id=invoice.id).first()
+        emails = (InvoiceEmail.query.filter_by(invoice_id=invoice.id)
+                  .order_by(InvoiceEmail.created_at.desc()).limit(5).all())
+        etag, last_modified = invoice_validators(invoice, current_user, 'html', convert_to,
+                                                 recurring and recurring.updated_at,
+                                                 *((email.id, email.status) for email in emails),
+                                                 VIEW_INVOICE_TEMPLATE_VERSION, static_url('css/base.css'))
+        etag, last_modified = csrf_validators(etag, last_modified)
+        cached = not_modified_response(etag, last_modified)
+        if cached is not None:
+            return cached
+        
         converted_invoice = None
-        if convert_to and current_user.can_access_feature('currency_conversion'):
+        if convert_to and current_user.tier.has('currency_conversion'):
             if convert_to in CURRENCIES and convert_to != invoice.currency:
                 converted_invoice = invoice.convert_to_currency(convert_to)
         
-        return render_template_string(VIEW_INVOICE_TEMPLATE, 
+        response = make_response(render_template('pages/view_invoice.html', 
                                     invoice=invoice, 
                                     converted_invoice=converted_invoice,
                                     currencies=get_supported_currencies(),
                                     format_currency=format_currency,
-                                    current_user=current_user)
+                                    current_user=current_user,
+                                    recurring=recurring,
+                                    emails=emails,
+                                    frequencies=RECURRING_FREQUENCIES,
+                                    PDF_AVAILABLE=PDF_AVAILABLE))
+        return add_cache_validators(response, etag, last_modified)
     except Exception as e:
-        app.logger.error(f'View invoice error: {str(e)}')
+        if replica_failure(e):
+            raise
+        current_app.logger.error(f'View invoice error: {str(e)}')
         flash('Invoice not found.', 'error')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
 
-@app.route('/invoice/<invoice_id>/pdf')
+@bp.route('/invoice/<invoice_id>/pdf')
 @login_required
+@read_only
 @limiter.limit("30 per hour")
 def download_pdf(invoice_id):
     try:
         if not PDF_AVAILABLE:
             flash('PDF generation not available. Please install ReportLab.', 'error')
-            return redirect(url_for('view_invoice', invoice_id=invoice_id))
+            return redirect(url_for('main.view_invoice', invoice_id=invoice_id))
             
         invoice = Invoice.query.filter_by(id=invoice_id, user_id=current_user.id).first()
         if not invoice:
             flash('Invoice not found.', 'error')
-            return redirect(url_for('dashboard'))
+            return redirect(url_for('main.dashboard'))
             
-        pdf_buffer = generate_pdf(invoice)
+        etag, last_modified = invoice_validators(invoice, current_user, 'pdf', PDF_METHOD, pdf_fonts().signature)
+        cached = not_modified_response(etag, last_modified)
+        if cached is not None:
+            return cached
+            
+        # Reuse the copy stored by the last send; rendering it stays with the jobs
+        pdf = stored_pdf(invoice)
+        pdf_file = io.BytesIO(pdf) if pdf is not None else generate_pdf(invoice)
+        size = pdf_file.seek(0, io.SEEK_END)
+        pdf_file.seek(0)
         
-        return send_file(
-            pdf_buffer,
+        # Streamed from the file, which send_file closes once it has been sent
+        response = send_file(
+            pdf_file,
             mimetype='application/pdf',
             as_attachment=True,
-            download_name=f'invoice_{invoice.invoice_number}.pdf'
+            download_name=f'invoice_{invoice.invoice_number}.pdf',
+            etag=False
         )
+        response.content_length = size
+        return add_cache_validators(response, etag, last_modified)
     except Exception as e:
-        app.logger.error(f'PDF download error: {str(e)}')
+        if replica_failure(e):
+            raise
+        current_app.logger.error(f'PDF download error: {str(e)}')
         flash('Error generating PDF.', 'error')
-        return redirect(url_for('view_invoice', invoice_id=invoice_id))
+        return redirect(url_for('main.view_invoice', invoice_id=invoice_id))
+
+@bp.route('/invoice/<invoice_id>/recurring', methods=['POST'])
+@login_required
+def set_recurring(invoice_id):
+    try:
+        invoice = Invoice.query.filter_by(id=invoice_id, user_id=current_user.id).first()
+        if not invoice:
+            flash('Invoice not found.', 'error')
+            return redirect(url_for('main.dashboard'))
+        
+        frequency = request.form.get('frequency')
+        if frequency != 'none' and frequency not in RECURRING_FREQUENCIES:
+            flash('Invalid frequency.', 'error')
+            return redirect(url_for('main.view_invoice', invoice_id=invoice.id))
+        
+        begin_write()
+        recurring = RecurringInvoice.query.filter_by(template_invoice_id=invoice.id).first()
+        if frequency == 'none':
+            if recurring:
+                recurring.active = False
+            flash('This invoice will no longer repeat.', 'success')
+        else:
+            if not recurring:
+                recurring = RecurringInvoice(user_id=current_user.id, template_invoice_id=invoice.id)
+                db.session.add(recurring)
+            recurring.frequency = frequency
+            recurring.start_date = invoice.issue_date
+            recurring.due_days = (invoice.due_date - invoice.issue_date).days
+            recurring.next_run_date = recurring.first_period()
+            recurring.active = True
+            flash(f'Invoice will repeat {RECURRING_FREQUENCIES[frequency]["name"].lower()}, '
+                  f'next on {recurring.next_run_date.strftime("%B %d, %Y")}.', 'success')
+        db.session.commit()
+        return redirect(url_for('main.view_invoice', invoice_id=invoice.id))
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'Recurring invoice error: {str(e)}')
+        flash('Error updating the recurring schedule.', 'error')
+        return redirect(url_for('main.dashboard'))
 
-@app.route('/upgrade')
+@bp.route('/clients')
+@login_required
+@read_only
+def clients():
+    try:
+        client_list = (Client.query.filter_by(user_id=current_user.id)
+                       .options(db.selectinload(Client.currency_totals))
+                       .order_by(Client.name).all())
+        return render_template('pages/clients.html',
+                                    clients=client_list,
+                                    current_user=current_user,
+                                    format_currency=format_currency)
+    except Exception as e:
+        if replica_failure(e):
+            raise
+        current_app.logger.error(f'Clients error: {str(e)}')
+        flash('Error loading clients.', 'error')
+        return redirect(url_for('main.dashboard'))
+
+@bp.route('/clients/<client_id>')
+@login_required
+@read_only
+def view_client(client_id):
+    try:
+        client = Client.query.filter_by(id=client_id, user_id=current_user.id).first()
+        if not client:
+            flash('Client not found.', 'error')
+            return redirect(url_for('main.clients'))
+        
+        invoices = list(invoice_rows(
+            invoice_list_query(current_user.id)
+            .where(Invoice.client_id == client.id)
+            .order_by(Invoice.issue_date.desc(), Invoice.created_at.desc())
+        ))
+        return render_template('pages/view_client.html',
+                                    client=client,
+                                    invoices=invoices,
+                                    current_user=current_user,
+                                    format_currency=format_currency)
+    except Exception as e:
+        if replica_failure(e):
+            raise
+        current_app.logger.error(f'View client error: {str(e)}')
+        flash('Client not found.', 'error')
+        return redirect(url_for('main.clients'))
+
+@bp.route('/analytics')
+@login_required
+@read_only
+def analytics():
+    if not current_user.tier.has('analytics'):
+        flash('Analytics require Starter tier or higher.', 'warning')
+        return redirect(url_for('main.upgrade'))
+    try:
+        advanced = current_user.tier.has('advanced_analytics')
+        if request.args.get('months') == 'all':
+            months = None
+        else:
+            months = request.args.get('months', BASIC_ANALYTICS_MONTHS, type=int)
+        if months not in ANALYTICS_RANGES or (not advanced and months != BASIC_ANALYTICS_MONTHS):
+            months = BASIC_ANALYTICS_MONTHS
+        
+        report = analytics_report(current_user, request.args.get('currency'), months,
+                                  include_clients=advanced)
+        if request.args.get('format') == 'json':
+            return jsonify({
+                **report,
+                'series': [{**point, 'month': point['month'].isoformat()} for point in report['series']],
+                'top_clients': [{'id': client.id, 'name': client.name, 'invoices': client.invoice_count,
+                                 'lifetime_value': client.lifetime_value, 'outstanding': client.outstanding}
+                                for client in report['top_clients']]
+            })
+        
+        peak = max([point['invoiced'] for point in report['series']] + [0])
+        return render_template('pages/analytics.html',
+                                    report=report,
+                                    peak=peak,
+                                    advanced=advanced,
+                                    ranges=ANALYTICS_RANGES,
+                                    current_user=current_user,
+                                    format_currency=format_currency)
+    except Exception as e:
+        if replica_failure(e):
+            raise
+        current_app.logger.error(f'Analytics error: {str(e)}')
+        flash('Error loading analytics.', 'error')
+        return redirect(url_for('main.dashboard'))
+
+@bp.route('/upgrade')
 @login_required
 def upgrade():
-    return render_template_string(UPGRADE_TEMPLATE, 
-                                tiers=MEMBERSHIP_TIERS,
-                                current_tier=current_user.membership_tier,
+    return render_template('pages/upgrade.html', 
+                                tiers=membership_tiers(),
+                                current_tier=current_user.tier.key,
                                 usage=get_invoice_usage(current_user))
 
-@app.route('/upgrade/<tier_name>', methods=['POST'])
+@bp.route('/upgrade/<tier_name>', methods=['POST'])
 @login_required
 @limiter.limit("5 per minute")
 def process_upgrade(tier_name):
     try:
-        if tier_name not in MEMBERSHIP_TIERS:
+        if tier_name not in membership_tiers():
             flash('Invalid membership tier.', 'error')
-            return redirect(url_for('upgrade'))
+            return redirect(url_for('main.upgrade'))
         
-        tier_info = MEMBERSHIP_TIERS[tier_name]
+        tier_info = get_membership_tier(tier_name)
         
         # In a real app, you would integrate with a payment processor here
         # For demo purposes, we'll just update the tier
         
+        begin_write()
         current_user.membership_tier = tier_name
         if tier_name != 'free':
             current_user.subscription_expires = datetime.utcnow() + timedelta(days=30)
@@ -847,23 +1482,24 @@ def process_upgrade(tier_name):
         
         db.session.commit()
         
-        app.logger.info(f'User {current_user.email} upgraded to {tier_name}')
-        flash(f'Successfully upgraded to {tier_info["name"]} tier!', 'success')
+        current_app.logger.info(f'User {current_user.email} upgraded to {tier_name}')
+        flash(f'Successfully upgraded to {tier_info.name} tier!', 'success')
         
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
         
     except Exception as e:
         db.session.rollback()
-        app.logger.error(f'Upgrade error: {str(e)}')
+        current_app.logger.error(f'Upgrade error: {str(e)}')
         flash('Error processing upgrade. Please try again.', 'error')
-        return redirect(url_for('upgrade'))
+        return redirect(url_for('main.upgrade'))
 
-@app.route('/settings', methods=['GET', 'POST'])
+@bp.route('/settings', methods=['GET', 'POST'])
 @login_required
 def settings():
     if request.method == 'POST':
         try:
             # Update user settings
+            begin_write()
             current_user.company_name = sanitize_input(request.form.get('company_name', ''), 200)
             current_user.default_currency = request.form.get('default_currency', 'USD')
             
@@ -878,15 +1514,15 @@ def settings():
                         flash('Password updated successfully!', 'success')
                     else:
                         flash('New password must be at least 8 characters long.', 'error')
-                        return render_template_string(SETTINGS_TEMPLATE, 
+                        return render_template('pages/settings.html', 
                                                     currencies=get_supported_currencies(),
-                                                    tiers=MEMBERSHIP_TIERS,
+                                                    tiers=membership_tiers(),
                                                     current_user=current_user)
                 else:
                     flash('Current password is incorrect.', 'error')
-                    return render_template_string(SETTINGS_TEMPLATE, 
+                    return render_template('pages/settings.html', 
                                                 currencies=get_supported_currencies(),
-                                                tiers=MEMBERSHIP_TIERS,
+                                                tiers=membership_tiers(),
                                                 current_user=current_user)
             
             db.session.commit()
@@ -894,22 +1530,22 @@ def settings():
             
         except Exception as e:
             db.session.rollback()
-            app.logger.error(f'Settings update error: {str(e)}')
+            current_app.logger.error(f'Settings update error: {str(e)}')
             flash('Error updating settings.', 'error')
     
-    return render_template_string(SETTINGS_TEMPLATE, 
+    return render_template('pages/settings.html', 
                                 currencies=get_supported_currencies(),
-                                tiers=MEMBERSHIP_TIERS,
+                                tiers=membership_tiers(),
                                 current_user=current_user,
                                 usage=get_invoice_usage(current_user))
 
 # API Routes for currency conversion (for premium users)
-@app.route('/api/convert', methods=['POST'])
+@bp.route('/api/convert', methods=['POST'])
 @login_required
 @limiter.limit("100 per hour")
 def api_convert_currency():
     try:
-        if not current_user.can_access_feature('currency_conversion'):
+        if not current_user.tier.has('currency_conversion'):
             return jsonify({'error': 'Currency conversion requires Professional tier or higher'}), 403
         
         data = request.get_json()
@@ -932,70 +1568,770 @@ def api_convert_currency():
         })
         
     except Exception as e:
-        app.logger.error(f'Currency conversion API error: {str(e)}')
+        current_app.logger.error(f'Currency conversion API error: {str(e)}')
         return jsonify({'error': 'Conversion failed'}), 500
 
+# Background jobs
+# Handlers run in `flask worker` processes, outside any request
+@job_handler('invoice_pdf')
+def invoice_pdf_job(payload, job):
+    invoice = Invoice.query.filter_by(id=payload['invoice_id'], user_id=job.user_id).first()
+    if invoice is None:
+        raise LookupError(f'Invoice {payload["invoice_id"]} not found')
+    begin_write()
+    pdf = cached_invoice_pdf(invoice)
+    return JobResult(pdf, 'application/pdf', f'invoice_{invoice.invoice_number}.pdf',
+                     {'invoice_id': invoice.id, 'bytes': len(pdf)})
+
+INVOICE_EXPORT_COLUMNS = ['invoice_number', 'client_name', 'issue_date', 'due_date', 'currency', 'total', 'status']
+
+@job_handler('invoice_export')
+def invoice_export_job(payload, job):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(INVOICE_EXPORT_COLUMNS)
+    rows = 0
+    query = invoice_list_query(job.user_id).order_by(Invoice.issue_date, Invoice.created_at)
+    for invoice in invoice_rows(query, batch_size=1000):
+        writer.writerow([getattr(invoice, column) for column in INVOICE_EXPORT_COLUMNS])
+        rows += 1
+    return JobResult(buffer.getvalue().encode('utf-8'), 'text/csv', 'invoices.csv', {'rows': rows})
+
+def job_accepted(job, next_url=None):
+    """Response for a freshly queued job: JSON for API clients, else `next_url` or its status page"""
+    if request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json':
+        response = jsonify({**job.to_dict(), 'status_url': url_for('main.job_status', job_id=job.id, format='json')})
+        response.headers['Location'] = url_for('main.job_status', job_id=job.id)
+        return response, 202
+    return redirect(next_url or url_for('main.job_status', job_id=job.id))
+
+@bp.route('/invoice/<invoice_id>/pdf/job', methods=['POST'])
+@login_required
+@limiter.limit("30 per hour")
+def queue_pdf(invoice_id):
+    invoice = Invoice.query.filter_by(id=invoice_id, user_id=current_user.id).first()
+    if not invoice or not PDF_AVAILABLE:
+        flash('Invoice not found.' if not invoice else 'PDF generation not available. Please install ReportLab.', 'error')
+        return redirect(url_for('main.dashboard'))
+    begin_write()
+    job = enqueue('invoice_pdf', {'invoice_id': invoice.id}, user_id=current_user.id)
+    db.session.commit()
+    return job_accepted(job)
+
+@bp.route('/export/invoices', methods=['POST'])
+@login_required
+@limiter.limit("10 per hour")
+def export_invoices():
+    begin_write()
+    job = enqueue('invoice_export', user_id=current_user.id)
+    db.session.commit()
+    return job_accepted(job)
+
+@bp.route('/jobs/<job_id>')
+@login_required
+def job_status(job_id):
+    job = Job.query.filter_by(id=job_id, user_id=current_user.id).first()
+    if job is None:
+        if request.args.get('format') == 'json':
+            return jsonify({'error': 'Job not found'}), 404
+        flash('Job not found.', 'error')
+        return redirect(url_for('main.dashboard'))
+    if request.args.get('format') == 'json':
+        data = job.to_dict()
+        if job.status == 'succeeded' and job.result_type:
+            data['result_url'] = url_for('main.job_result', job_id=job.id)
+        response = jsonify(data)
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+    return render_template('pages/job.html', job=job, current_user=current_user)
+
+@bp.route('/jobs/<job_id>/result')
+@login_required
+def job_result(job_id):
+    job = Job.query.filter_by(id=job_id, user_id=current_user.id, status='succeeded').first()
+    if job is None or not job.result_type:
+        flash('That file is not ready.', 'error')
+        return redirect(url_for('main.dashboard'))
+    return send_file(io.BytesIO(job.result_data), mimetype=job.result_type,
+                     as_attachment=True, download_name=job.result_name)
+
+# Invoice email
+MAX_BULK_EMAILS = 500
+
+def invoice_email_message(invoice, user, recipient, note, pdf):
+    sender_name = user.company_name or user.email
+    body = (
+        f'Hello {invoice.client_name},\n\n'
+        f'Please find attached invoice {invoice.invoice_number} for {invoice.format_amount(invoice.total)}, '
+        f'due {invoice.due_date.strftime("%B %d, %Y")}.\n\n'
+        + (f'{note}\n\n' if note else '')
+        + f'Thank you,\n{sender_name}\n'
+    )
+    return build_message(
+        current_app.config['MAIL_DEFAULT_SENDER'], recipient,
+        f'Invoice {invoice.invoice_number} from {sender_name}', body,
+        reply_to=user.email,
+        attachments=[(f'invoice_{invoice.invoice_number}.pdf', 'application/pdf', pdf)]
+    )
+
+@job_handler('invoice_email')
+def invoice_email_job(payload, job):
+    """Send a batch of queued InvoiceEmails over one pooled SMTP connection.
+
+    PDFs are rendered (or reused) and stored in one short write transaction;
+    nothing is held open while talking to the mail server. Deliveries are
+    recorded even when the batch fails part-way, so a retry only sends the
+    rest.
+    """
+    begin_write()
+    emails = (InvoiceEmail.query
+              .filter(InvoiceEmail.id.in_(payload['email_ids']), InvoiceEmail.status == 'queued')
+              .all())
+    if not emails:
+        db.session.rollback()
+        return {'sent': 0, 'failed': 0}
+    user = db.session.get(User, job.user_id)
+    invoices = {invoice.id: invoice for invoice in
+                Invoice.query.filter(Invoice.id.in_({email.invoice_id for email in emails}),
+                                     Invoice.user_id == user.id)
+                .options(db.selectinload(Invoice.items))}
+    messages, email_ids = [], {}
+    for email in emails:
+        invoice = invoices[email.invoice_id]
+        message = invoice_email_message(invoice, user, email.recipient, email.message, cached_invoice_pdf(invoice))
+        email.message_id = message['Message-ID']
+        email_ids[message['Message-ID']] = (email.id, invoice.id)
+        messages.append(message)
+    db.session.commit()
+    
+    sent, failed = {}, {}
+    try:
+        for message, error in deliver(messages):
+            email_id, invoice_id = email_ids[message['Message-ID']]
+            if error is None:
+                sent[email_id] = invoice_id
+            else:
+                failed[email_id] = error
+    finally:
+        now = datetime.utcnow()
+        begin_write()
+        for email in InvoiceEmail.query.filter(InvoiceEmail.id.in_(list(sent) + list(failed))):
+            email.status = 'sent' if email.id in sent else 'failed'
+            email.sent_at = now if email.id in sent else None
+            email.error = failed.get(email.id)
+        # Through the ORM so the client and monthly rollups follow the status change
+        for invoice in Invoice.query.filter(Invoice.id.in_(set(sent.values())), Invoice.status == 'draft'):
+            invoice.status = 'sent'
+        db.session.commit()
+    return {'sent': len(sent), 'failed': len(failed)}
+
+def queue_invoice_emails(invoices, note=None, recipient=None):
+    """Add an InvoiceEmail per invoice and the jobs that send them in batches.
+
+    Invoices without a recipient are skipped. Returns the jobs; the caller
+    has called begin_write() and commits.
+    """
+    emails = []
+    for invoice in invoices:
+        address = recipient or invoice.client_email
+        if not address:
+            continue
+        email = InvoiceEmail(invoice_id=invoice.id, user_id=invoice.user_id, recipient=address, message=note)
+        db.session.add(email)
+        emails.append(email)
+    db.session.flush()
+    batch_size = current_app.config['MAIL_BATCH_SIZE']
+    return [
+        enqueue('invoice_email', {'email_ids': [email.id for email in emails[i:i + batch_size]]},
+                user_id=current_user.id)
+        for i in range(0, len(emails), batch_size)
+    ]
+
+@bp.route('/invoice/<invoice_id>/send', methods=['POST'])
+@login_required
+@limiter.limit("30 per hour")
+def send_invoice(invoice_id):
+    try:
+        if not current_user.tier.has('email_integration'):
+            flash('Emailing invoices requires a Starter plan or higher.', 'error')
+            return redirect(url_for('main.upgrade'))
+        
+        invoice = Invoice.query.filter_by(id=invoice_id, user_id=current_user.id).first()
+        if not invoice:
+            flash('Invoice not found.', 'error')
+            return redirect(url_for('main.dashboard'))
+        
+        recipient = sanitize_input(request.form.get('recipient', ''), 120).lower() or invoice.client_email
+        if not recipient or not validate_email(recipient):
+            flash('Please enter a valid recipient email address.', 'error')
+            return redirect(url_for('main.view_invoice', invoice_id=invoice.id))
+        note = sanitize_input(request.form.get('message', ''), 1000) or None
+        
+        begin_write()
+        job, = queue_invoice_emails([invoice], note=note, recipient=recipient)
+        db.session.commit()
+        flash(f'Invoice {invoice.invoice_number} is being sent to {recipient}.', 'success')
+        return job_accepted(job, url_for('main.view_invoice', invoice_id=invoice.id))
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'Send invoice error: {str(e)}')
+        flash('Error sending invoice.', 'error')
+        return redirect(url_for('main.view_invoice', invoice_id=invoice_id))
+
+@bp.route('/invoices/send', methods=['POST'])
+@login_required
+@limiter.limit("10 per hour")
+def send_invoices():
+    """Email several invoices to their clients' addresses"""
+    try:
+        if not current_user.tier.has('email_integration'):
+            flash('Emailing invoices requires a Starter plan or higher.', 'error')
+            return redirect(url_for('main.upgrade'))
+        
+        invoice_ids = request.form.getlist('invoice_ids')[:MAX_BULK_EMAILS]
+        invoices = (Invoice.query
+                    .filter(Invoice.id.in_(invoice_ids), Invoice.user_id == current_user.id)
+                    .order_by(Invoice.created_at)
+                    .all()) if invoice_ids else []
+        begin_write()
+        jobs = queue_invoice_emails(invoices)
+        db.session.commit()
+        queued = sum(len(json.loads(job.payload)['email_ids']) for job in jobs)
+        skipped = len(invoices) - queued
+        if queued:
+            flash(f'Sending {queued} invoice{"s" if queued != 1 else ""}'
+                  + (f'; {skipped} without a client email skipped.' if skipped else '.'), 'success')
+        else:
+            flash('No selected invoice has a client email address.', 'error')
+        return redirect(url_for('main.dashboard'))
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'Bulk send error: {str(e)}')
+        flash('Error sending invoices.', 'error')
+        return redirect(url_for('main.dashboard'))
+
+# Webhooks
+MAX_WEBHOOKS = 10
+
+@bp.route('/settings/webhooks', methods=['GET', 'POST'])
+@login_required
+def webhooks():
+    if not current_user.tier.has('api_access'):
+        flash('Webhooks are available on the Business plan.', 'error')
+        return redirect(url_for('main.upgrade'))
+    
+    if request.method == 'POST':
+        try:
+            url = request.form.get('url', '').strip()[:500]
+            events = [event for event in request.form.getlist('events') if event in WEBHOOK_EVENTS]
+            error = webhook_url_error(url)
+            if error is None and not events:
+                error = 'Choose at least one event.'
+            if error is None and Webhook.query.filter_by(user_id=current_user.id).count() >= MAX_WEBHOOKS:
+                error = f'You can have up to {MAX_WEBHOOKS} webhooks.'
+            if error:
+                flash(error, 'error')
+            else:
+                begin_write()
+                db.session.add(Webhook(user_id=current_user.id, url=url, secret=secrets.token_hex(32),
+                                       events=','.join(events)))
+                db.session.commit()
+                flash('Webhook added.', 'success')
+                return redirect(url_for('main.webhooks'))
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f'Webhook create error: {str(e)}')
+            flash('Error adding webhook.', 'error')
+    
+    hooks = Webhook.query.filter_by(user_id=current_user.id).order_by(Webhook.created_at).all()
+    recent = {}
+    for delivery in (WebhookDelivery.query
+                     .filter(WebhookDelivery.webhook_id.in_([hook.id for hook in hooks]))
+                     .order_by(WebhookDelivery.created_at.desc())
+                     .limit(10 * len(hooks))):
+        recent.setdefault(delivery.webhook_id, []).append(delivery)
+    return render_template('pages/webhooks.html', webhooks=hooks, recent=recent, events=WEBHOOK_EVENTS,
+                           current_user=current_user)
+
+@bp.route('/settings/webhooks/<webhook_id>/delete', methods=['POST'])
+@login_required
+def delete_webhook(webhook_id):
+    try:
+        begin_write()
+        webhook = Webhook.query.filter_by(id=webhook_id, user_id=current_user.id).first()
+        if webhook:
+            db.session.execute(db.delete(WebhookDelivery).where(WebhookDelivery.webhook_id == webhook.id))
+            db.session.delete(webhook)
+            db.session.commit()
+            flash('Webhook deleted.', 'success')
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'Webhook delete error: {str(e)}')
+        flash('Error deleting webhook.', 'error')
+    return redirect(url_for('main.webhooks'))
+
+@bp.route('/settings/webhooks/<webhook_id>/test', methods=['POST'])
+@login_required
+@limiter.limit("20 per hour")
+def test_webhook(webhook_id):
+    """Queue a webhook.ping event for one endpoint"""
+    try:
+        begin_write()
+        webhook = Webhook.query.filter_by(id=webhook_id, user_id=current_user.id).first()
+        if webhook:
+            webhook.active = True
+            db.session.add(WebhookDelivery(webhook_id=webhook.id, event='webhook.ping',
+                                           payload=webhook_event('webhook.ping', {'webhook_id': webhook.id})))
+            db.session.commit()
+            flash('Test event queued.', 'success')
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'Webhook test error: {str(e)}')
+        flash('Error queueing test event.', 'error')
+    return redirect(url_for('main.webhooks'))
+
+# Instrumentation
+# Prometheus text format. Each gunicorn worker has its own pool, so samples
+# carry the worker pid; sum or max over it when sizing against worker count.
+POOL_METRICS = [
+    ('size', 'gauge', 'Connections kept in the pool'),
+    ('capacity', 'gauge', 'Pool size plus allowed overflow'),
+    ('checked_out', 'gauge', 'Connections currently checked out'),
+    ('checked_in', 'gauge', 'Idle connections in the pool'),
+    ('overflow', 'gauge', 'Connections open beyond the pool size'),
+    ('saturation', 'gauge', 'Checked-out connections as a fraction of capacity'),
+    ('connections_opened', 'counter', 'New database connections opened'),
+    ('checkouts', 'counter', 'Connection checkouts'),
+    ('checkout_timeouts', 'counter', 'Checkouts that gave up waiting for a connection'),
+    ('checkout_wait_seconds', 'counter', 'Total time spent waiting for a connection'),
+    ('checkout_wait_count', 'counter', 'Checkouts that went through the wait timer'),
+    ('checkout_wait_max_seconds', 'gauge', 'Longest wait for a connection')
+]
+
+@bp.route('/metrics')
+@limiter.exempt
+def metrics():
+    token = current_app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return 'Unauthorized\n', 401
+    
+    pool_stats = current_app.extensions['db_pool_stats']
+    statuses = {bind_key or 'primary': pool_status(engine, pool_stats[bind_key or 'primary'])
+                for bind_key, engine in db.engines.items()}
+    lines = []
+    for name, kind, help_text in POOL_METRICS:
+        samples = [(bind, status) for bind, status in statuses.items() if name in status]
+        if not samples:
+            continue
+        metric = f'invoicer_db_pool_{name}'
+        suffix = '_total' if kind == 'counter' else ''
+        lines.append(f'# HELP {metric}{suffix} {help_text}')
+        lines.append(f'# TYPE {metric}{suffix} {kind}')
+        for bind, status in samples:
+            labels = f'pid="{os.getpid()}",bind="{bind}",pool="{status["pool_class"]}"'
+            lines.append(f'{metric}{suffix}{{{labels}}} {status[name]}')
+    
+    # Queue depth is shared by every process, so it carries no pid label
+    counts = job_counts()
+    lines.append('# HELP invoicer_jobs Background jobs by kind and status')
+    lines.append('# TYPE invoicer_jobs gauge')
+    for kind, status in sorted(counts):
+        lines.append(f'invoicer_jobs{{kind="{kind}",status="{status}"}} {counts[kind, status]}')
+    lines.append('# HELP invoicer_jobs_oldest_queued_seconds Time the longest-waiting due job has waited')
+    lines.append('# TYPE invoicer_jobs_oldest_queued_seconds gauge')
+    lines.append(f'invoicer_jobs_oldest_queued_seconds {oldest_queued_age():.3f}')
+    lines.append('# HELP invoicer_webhook_deliveries Webhook deliveries by status')
+    lines.append('# TYPE invoicer_webhook_deliveries gauge')
+    for status, count in db.session.execute(
+        db.select(WebhookDelivery.status, db.func.count()).group_by(WebhookDelivery.status)
+    ):
+        lines.append(f'invoicer_webhook_deliveries{{status="{status}"}} {count}')
+    lines.append('# HELP invoicer_log_records_dropped_total Log records this process dropped because the writer fell behind')
+    lines.append('# TYPE invoicer_log_records_dropped_total counter')
+    lines.append(f'invoicer_log_records_dropped_total{{pid="{os.getpid()}"}} {dropped_records()}')
+    
+    response = make_response('\n'.join(lines) + '\n')
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
 # Database initialization
-def init_db():
+DEMO_USERS = [
+    ('admin@invoicegen.com', 'SecureAdmin123!', 'Admin Company', 'business', 365),
+    ('test@example.com', 'test1234', 'Test Company', 'free', None),
+    ('starter@example.com', 'starter123', 'Starter Corp', 'starter', 30),
+    ('pro@example.com', 'professional123', 'Professional LLC', 'professional', 30),
+    ('business@example.com', 'business123', 'Business Enterprise', 'business', 30)
+]
+
+def seed_demo_users():
+    """Create the demo account for each tier if missing. Returns the created accounts."""
+    emails = [email for email, *_ in DEMO_USERS]
+    existing = {email for (email,) in db.session.query(User.email).filter(User.email.in_(emails))}
+    created = []
+    for email, password, company, tier, days in DEMO_USERS:
+        if email in existing:
+            continue
+        user = User(
+            email=email,
+            company_name=company,
+            default_currency='USD',
+            membership_tier=tier
+        )
+        user.set_password(password)
+        if days:
+            user.subscription_expires = datetime.utcnow() + timedelta(days=days)
+        db.session.add(user)
+        created.append((email, password, tier))
+    db.session.commit()
+    return created
+
+def init_db(app=None, seed_demo=True):
     """Initialize database and create users"""
     try:
+        app = app or create_app()
         with app.app_context():
-            db.create_all()
-            
-            # Create admin user if not exists
-            admin = User.query.filter_by(email='admin@invoicegen.com').first()
-            if not admin:
-                admin = User(
-                    email='admin@invoicegen.com',
-                    company_name='Admin Company',
-                    default_currency='USD',
-                    membership_tier='business'
-                )
-                admin.set_password('SecureAdmin123!')
-                admin.subscription_expires = datetime.utcnow() + timedelta(days=365)
-                db.session.add(admin)
-                db.session.commit()
-                print("✅ Admin user created: admin@invoicegen.com / SecureAdmin123! (Business tier)")
-            else:
-                print("✅ Admin user already exists")
-                
-            # Create test users for different tiers
-            test_users = [
-                ('test@example.com', 'test1234', 'Test Company', 'free'),
-                ('starter@example.com', 'starter123', 'Starter Corp', 'starter'),
-                ('pro@example.com', 'professional123', 'Professional LLC', 'professional'),
-                ('business@example.com', 'business123', 'Business Enterprise', 'business')
-            ]
-            
-            for email, password, company, tier in test_users:
-                if not User.query.filter_by(email=email).first():
-                    user = User(
-                        email=email,
-                        company_name=company,
-                        default_currency='USD',
-                        membership_tier=tier
-                    )
-                    user.set_password(password)
-                    if tier != 'free':
-                        user.subscription_expires = datetime.utcnow() + timedelta(days=30)
-                    db.session.add(user)
-                    db.session.commit()
-                    print(f"✅ Test user created: {email} / {password} ({tier} tier)")
-            
+            version = upgrade_schema()
+            print(f"✅ Database schema at version {version}")
+            if seed_demo:
+                for email, password, tier in seed_demo_users():
+                    print(f"✅ Demo user created: {email} / {password} ({tier} tier)")
             return True
     except Exception as e:
         print(f"❌ Database initialization error: {e}")
         return False
 
+@bp.cli.command('init-db')
+def init_db_command():
+    """Create the database schema or upgrade it to the current version."""
+    version = upgrade_schema()
+    click.echo(f'✅ Database schema at version {version}')
+
+@bp.cli.command('check-migrations')
+def check_migrations_command():
+    """Upgrade a scratch copy of the version 1 schema and compare it with the models."""
+    with tempfile.TemporaryDirectory() as directory:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{directory}/check.db',
+                          'REPLICA_DATABASE_URL': None})
+        with app.app_context():
+            for statement in VERSION_1_SCHEMA:
+                db.session.execute(db.text(statement))
+            db.session.commit()
+            version = upgrade_schema()
+            differences = schema_differences()
+            db.session.remove()
+            db.engine.dispose()
+    for difference in differences:
+        click.echo(difference)
+    if version != SCHEMA_VERSION or differences:
+        raise click.ClickException(f'Upgrade from version 1 reached version {version} of {SCHEMA_VERSION}, '
+                                   f'{len(differences)} differences')
+    click.echo(f'✅ Version 1 database upgraded to version {version}')
+
+@bp.cli.command('seed-demo')
+def seed_demo_command():
+    """Create the demo accounts for each membership tier. Development only: their passwords are published."""
+    created = seed_demo_users()
+    for email, password, tier in created:
+        click.echo(f'✅ Demo user created: {email} / {password} ({tier} tier)')
+    if not created:
+        click.echo('✅ Demo users already exist')
+
+@bp.cli.command('check-tiers')
+@click.argument('path', required=False)
+def check_tiers_command(path):
+    """Validate a tier definition file (default: the tiers in force) and list its tiers."""
+    try:
+        compiled = load_tiers(path) if path else entitlements()
+    except (OSError, ValueError) as e:
+        raise click.ClickException(str(e))
+    for tier in compiled.tiers.values():
+        limit = 'unlimited' if tier.unlimited else f'{tier.invoice_limit}/month'
+        default = ' (default)' if tier is compiled.default else ''
+        click.echo(f'{tier.key}{default}: {tier.name}, ${tier.price}, {limit} invoices; '
+                   f'{", ".join(tier.entitlements) or "no paid features"}')
+    click.echo(f'✅ {len(compiled.tiers)} tiers, {len(FEATURES)} features')
+
+@bp.cli.command('check-fonts')
+def check_fonts_command():
+    """List the PDF fonts in use and how each currency symbol will be drawn."""
+    manager = pdf_fonts()
+    for font in manager.load():
+        click.echo(f'{font.regular} (bold: {font.bold}): {len(font.glyphs)} characters')
+    for code, currency in CURRENCIES.items():
+        font = manager.select([currency['symbol']])
+        shown = font.currency_symbol(currency)
+        click.echo(f"{code} {currency['symbol']}: {font.regular}" + ('' if shown == currency['symbol'] else f', printed as {code}'))
+    click.echo(f'✅ {len(manager.load())} fonts loaded')
+
+# Synthetic data generation
+SEED_TIER_WEIGHTS = {'free': 55, 'starter': 25, 'professional': 15, 'business': 5}
+SEED_STATUS_WEIGHTS = {'paid': 55, 'sent': 20, 'pending': 15, 'draft': 10}
+SEED_CURRENCY_WEIGHTS = {'USD': 45, 'EUR': 20, 'GBP': 10, 'CAD': 5, 'AUD': 4, 'JPY': 3, 'INR': 3, 'CHF': 2}
+SEED_TAX_RATES = [0, 0, 5, 7.5, 10, 15, 20]
+SEED_ITEM_DESCRIPTIONS = [
+    'Consulting services', 'Design work', 'Development hours', 'Project management',
+    'Hosting (monthly)', 'Support retainer', 'Training session', 'Software license',
+    'Content writing', 'Travel expenses', 'Hardware', 'Maintenance'
+]
+SEED_CLIENT_NAMES = [
+    'Acme Corp', 'Globex', 'Initech', 'Umbrella Ltd', 'Stark Industries', 'Wayne Enterprises',
+    'Hooli', 'Vandelay Industries', 'Soylent Co', 'Tyrell Corp', 'Cyberdyne', 'Wonka Industries'
+]
+
+def seed_uuid(rng):
+    """Deterministic UUID4 string drawn from the given random generator"""
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+def seed_database(users, invoices_per_user, items_per_invoice, seed=0, chunk_size=20000,
+                  password='seedpass123', echo=print):
+    """Bulk-generate users, invoices and items with realistic distributions.
+
+    Rows are built as plain dicts and written with executemany inserts,
+    committing every ``chunk_size`` items, so large datasets never
+    accumulate ORM objects in the session. The same seed always produces
+    the same data.
+    """
+    import random
+    rng = random.Random(seed)
+    # Hashing is deliberately slow, so every generated user shares one hash
+    password_hash = generate_password_hash(password)
+    
+    tiers, tier_weights = zip(*SEED_TIER_WEIGHTS.items())
+    statuses, status_weights = zip(*SEED_STATUS_WEIGHTS.items())
+    currencies, currency_weights = zip(*SEED_CURRENCY_WEIGHTS.items())
+    # Dates are relative to midnight so reruns on the same day match exactly
+    now = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    
+    user_rows, invoice_rows, item_rows = [], [], []
+    totals = {'users': 0, 'invoices': 0, 'items': 0}
+    
+    def flush():
+        if user_rows:
+            db.session.execute(User.__table__.insert(), user_rows)
+        if invoice_rows:
+            db.session.execute(Invoice.__table__.insert(), invoice_rows)
+        if item_rows:
+            db.session.execute(InvoiceItem.__table__.insert(), item_rows)
+        db.session.commit()
+        totals['users'] += len(user_rows)
+        totals['invoices'] += len(invoice_rows)
+        totals['items'] += len(item_rows)
+        user_rows.clear()
+        invoice_rows.clear()
+        item_rows.clear()
+        echo(f"  ... {totals['users']} users, {totals['invoices']} invoices, {totals['items']} items")
+    
+    for user_index in range(users):
+        tier = rng.choices(tiers, tier_weights)[0]
+        user_currency = rng.choices(currencies, currency_weights)[0]
+        user_created = now - timedelta(days=rng.randint(30, 1095))
+        user_id = seed_uuid(rng)
+        user_rows.append({
+            'id': user_id,
+            'email': f'seed{seed}-user{user_index:07d}@example.com',
+            'password_hash': password_hash,
+            'company_name': f'Seed Company {user_index}',
+            'default_currency': user_currency,
+            'membership_tier': tier,
+            'subscription_expires': now + timedelta(days=rng.randint(1, 365)) if tier != 'free' else None,
+            'is_active': True,
+            'failed_login_attempts': 0,
+            'created_at': user_created,
+            'updated_at': user_created,
+        })
+        
+        account_age = max((now - user_created).days, 1)
+        for invoice_index in range(invoices_per_user):
+            invoice_id = seed_uuid(rng)
+            # Most invoices use the account currency, the rest are spread out
+            currency = user_currency if rng.random() < 0.8 else rng.choices(currencies, currency_weights)[0]
+            decimal_places = CURRENCIES[currency]['decimal_places']
+            created_at = user_created + timedelta(days=rng.randint(0, account_age), seconds=rng.randint(0, 86399))
+            issue_date = created_at.date()
+            tax_rate = rng.choice(SEED_TAX_RATES)
+            
+            subtotal = 0.0
+            for _ in range(items_per_invoice):
+                quantity = float(rng.choice((1, 1, 1, 2, 3, 5, 8, 10, 20, 40)))
+                rate = round(rng.lognormvariate(4.5, 1.0), decimal_places)
+                amount = round(quantity * rate, decimal_places)
+                subtotal += amount
+                item_rows.append({
+                    'id': seed_uuid(rng),
+                    'invoice_id': invoice_id,
+                    'description': rng.choice(SEED_ITEM_DESCRIPTIONS),
+                    'quantity': quantity,
+                    'rate': rate,
+                    'amount': amount,
+                })
+            
+            tax_amount = round(subtotal * tax_rate / 100, decimal_places)
+            client_name = rng.choice(SEED_CLIENT_NAMES)
+            invoice_rows.append({
+                'id': invoice_id,
+                'user_id': user_id,
+                'invoice_number': f'INV-{invoice_index + 1:05d}',
+                'client_name': client_name,
+                'client_email': f"billing@{client_name.split()[0].lower()}.example.com",
+                'client_address': f'{rng.randint(1, 9999)} Market Street',
+                'issue_date': issue_date,
+                'due_date': issue_date + timedelta(days=rng.choice((7, 14, 30, 30, 30, 60))),
+                'currency': currency,
+                'subtotal': round(subtotal, decimal_places),
+                'tax_rate': tax_rate,
+                'tax_amount': tax_amount,
+                'total': round(subtotal + tax_amount, decimal_places),
+                'notes': None,
+                'status': rng.choices(statuses, status_weights)[0],
+                'template_style': 'modern',
+                'created_at': created_at,
+                'updated_at': created_at,
+            })
+            
+            if len(item_rows) + len(invoice_rows) >= chunk_size:
+                flush()
+        
+        if len(user_rows) >= chunk_size:
+            flush()
+    
+    if user_rows or invoice_rows or item_rows:
+        flush()
+    backfill_invoice_clients()
+    rebuild_monthly_rollups()
+    db.session.commit()
+    return totals
+
+@bp.cli.command('seed')
+@click.option('--users', default=100, show_default=True, help='Number of users to generate.')
+@click.option('--invoices-per-user', default=20, show_default=True, help='Invoices generated for each user.')
+@click.option('--items-per-invoice', default=5, show_default=True, help='Line items on each invoice.')
+@click.option('--seed', 'seed', default=0, show_default=True, help='Random seed; the same seed gives the same data.')
+@click.option('--chunk-size', default=20000, show_default=True, help='Rows written per commit.')
+@click.option('--password', default='seedpass123', show_default=True, help='Password for every generated user.')
+def seed_command(users, invoices_per_user, items_per_invoice, seed, chunk_size, password):
+    """Generate a large synthetic dataset for benchmarking."""
+    upgrade_schema()
+    if User.query.filter(User.email.like(f'seed{seed}-user%')).first():
+        raise click.ClickException(f'Data for seed {seed} already exists; use a different --seed.')
+    
+    click.echo(f'🌱 Seeding {users} users x {invoices_per_user} invoices x {items_per_invoice} items (seed {seed})')
+    started = datetime.utcnow()
+    totals = seed_database(users, invoices_per_user, items_per_invoice, seed=seed,
+                           chunk_size=chunk_size, password=password, echo=click.echo)
+    elapsed = (datetime.utcnow() - started).total_seconds()
+    rows = totals['users'] + totals['invoices'] + totals['items']
+    click.echo(f"✅ Created {totals['users']} users, {totals['invoices']} invoices, {totals['items']} items "
+               f"in {elapsed:.1f}s ({rows / elapsed if elapsed else rows:,.0f} rows/s)")
+
+@bp.cli.command('generate-recurring')
+@click.option('--date', 'run_date', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='Generate everything due by this date (default: today).')
+@click.option('--chunk-size', default=500, show_default=True, help='Schedules handled per transaction.')
+def generate_recurring_command(run_date, chunk_size):
+    """Generate the invoices of all due recurring schedules; run nightly."""
+    started = time.perf_counter()
+    summary = generate_recurring_invoices(run_date.date() if run_date else None, chunk_size=chunk_size)
+    elapsed = time.perf_counter() - started
+    click.echo(f"✅ Generated {summary['generated']} invoices from {summary['schedules']} due schedules in {elapsed:.2f}s")
+    if summary['already_generated']:
+        click.echo(f"ℹ️  Skipped {summary['already_generated']} periods that already had an invoice")
+    if summary['over_limit']:
+        click.echo(f"⚠️  {summary['over_limit']} schedules held back by their tier's monthly invoice limit")
+    if summary['ended']:
+        click.echo(f"ℹ️  {summary['ended']} schedules ended")
+
+@bp.cli.command('sweep-overdue')
+@click.option('--date', 'today', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='Treat this as the current date (default: today).')
+def sweep_overdue_command(today):
+    """Mark past-due invoices overdue and rebuild the aging report."""
+    today = today.date() if today else None
+    started = time.perf_counter()
+    marked = mark_overdue_invoices(today)
+    rows = refresh_invoice_aging(today)
+    click.echo(f'✅ Marked {marked} invoices overdue, {rows} aging rows rebuilt in {time.perf_counter() - started:.2f}s')
+
+@bp.cli.command('sweep-subscriptions')
+def sweep_subscriptions_command():
+    """Downgrade accounts whose paid subscription has expired."""
+    started = time.perf_counter()
+    downgraded = downgrade_expired_subscriptions()
+    click.echo(f'✅ Downgraded {downgraded} expired subscriptions in {time.perf_counter() - started:.2f}s')
+
+@bp.cli.command('rebuild-analytics')
+def rebuild_analytics_command():
+    """Recompute the monthly analytics rollups from the invoices."""
+    started = time.perf_counter()
+    begin_write()
+    rows = rebuild_monthly_rollups()
+    db.session.commit()
+    click.echo(f'✅ Rebuilt {rows} monthly rollup rows in {time.perf_counter() - started:.2f}s')
+
+def run_worker(burst, max_jobs=None):
+    """Body of one worker process: its own app, engine and connections"""
+    app = create_app()
+    stopping = threading.Event()
+    # Finish the current job on SIGTERM/SIGINT, then exit
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stopping.set())
+    with app.app_context():
+        return work(burst=burst, max_jobs=max_jobs, should_stop=stopping.is_set)
+
+@bp.cli.command('worker')
+@click.option('--concurrency', default=1, show_default=True, help='Worker processes to run.')
+@click.option('--burst', is_flag=True, help='Exit once no job is due instead of polling.')
+@click.option('--max-jobs', type=int, default=None, help='Exit after running this many jobs (per process).')
+def worker_command(concurrency, burst, max_jobs):
+    """Run background jobs (PDFs, exports) until stopped."""
+    started = time.perf_counter()
+    if concurrency <= 1:
+        processed = run_worker(burst, max_jobs)
+        click.echo(f'✅ Worker ran {processed} jobs in {time.perf_counter() - started:.1f}s')
+        return
+    
+    # Don't hand this process's connections to the children
+    for engine in db.engines.values():
+        engine.dispose()
+    workers = [multiprocessing.Process(target=run_worker, args=(burst, max_jobs)) for _ in range(concurrency)]
+    for process in workers:
+        process.start()
+    click.echo(f'🚀 Started {concurrency} workers: {", ".join(str(p.pid) for p in workers)}')
+    
+    def stop_workers(signum, frame):
+        for process in workers:
+            if process.is_alive():
+                process.terminate()
+    signal.signal(signal.SIGTERM, stop_workers)
+    signal.signal(signal.SIGINT, stop_workers)
+    for process in workers:
+        process.join()
+    click.echo(f'✅ Workers stopped after {time.perf_counter() - started:.1f}s')
+
+@bp.cli.command('dispatch-webhooks')
+@click.option('--burst', is_flag=True, help='Exit once nothing is due instead of polling.')
+def dispatch_webhooks_command(burst):
+    """Deliver queued webhook events until stopped."""
+    if not WEBHOOKS_AVAILABLE:
+        raise click.ClickException('Webhook delivery needs httpx: pip install httpx')
+    app = current_app._get_current_object()
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stopping.set())
+    started = time.perf_counter()
+    outcome = asyncio.run(dispatch(app, burst=burst, should_stop=stopping.is_set))
+    click.echo(f"✅ Sent {outcome.get('delivered', 0)} batches, {outcome.get('failed', 0)} failed, "
+               f"in {time.perf_counter() - started:.1f}s")
+
 # Error handlers
-@app.errorhandler(404)
+@bp.app_errorhandler(404)
 def not_found_error(error):
-    return render_template_string(ERROR_404_TEMPLATE), 404
+    return render_template('pages/errors/404.html'), 404
 
-@app.errorhandler(500)
+@bp.app_errorhandler(500)
 def internal_error(error):
     db.session.rollback()
-    return render_template_string(ERROR_500_TEMPLATE), 500
+    return render_template('pages/errors/500.html'), 500
 
 # Enhanced Templates with Tier and Currency Support
 
@@ -1006,93 +2342,36 @@ BASE_TEMPLATE = '''
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>{% block title %}Invoice Generator{% endblock %}</title>
-    <style>
-        * { margin: 0; padding: 0; box-sizing: border-box; }
-        body { font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif; 
-               background: #f8fafc; color: #1a202c; line-height: 1.6; }
-        .container { max-width: 1200px; margin: 0 auto; padding: 20px; }
-        .card { background: white; border-radius: 8px; box-shadow: 0 1px 3px rgba(0,0,0,0.1); 
-                border: 1px solid #e2e8f0; overflow: hidden; margin-bottom: 20px; }
-        .card-header { padding: 20px; border-bottom: 1px solid #e2e8f0; background: #f7fafc; }
-        .card-body { padding: 20px; }
-        .btn { display: inline-block; padding: 12px 24px; border-radius: 6px; text-decoration: none; 
-               font-weight: 500; border: none; cursor: pointer; transition: all 0.2s; text-align: center; }
-        .btn-primary { background: #3182ce; color: white; }
-        .btn-primary:hover { background: #2c5aa0; }
-        .btn-secondary { background: #718096; color: white; }
-        .btn-success { background: #38a169; color: white; }
-        .btn-danger { background: #e53e3e; color: white; }
-        .btn-purple { background: #9f7aea; color: white; }
-        .btn-green { background: #48bb78; color: white; }
-        .btn-outline { background: transparent; border: 2px solid #e2e8f0; color: #4a5568; }
-        .btn-outline:hover { background: #f7fafc; }
-        .form-group { margin-bottom: 20px; }
-        .form-label { display: block; margin-bottom: 8px; font-weight: 500; color: #2d3748; }
-        .form-input, .form-select { width: 100%; padding: 12px; border: 1px solid #cbd5e0; border-radius: 6px; 
-                      font-size: 16px; transition: border-color 0.2s; }
-        .form-input:focus, .form-select:focus { outline: none; border-color: #3182ce; box-shadow: 0 0 0 3px rgba(49,130,206,0.1); }
-        .alert { padding: 16px; border-radius: 6px; margin-bottom: 20px; }
-        .alert-success { background: #c6f6d5; color: #22543d; border: 1px solid #9ae6b4; }
-        .alert-error { background: #fed7d7; color: #742a2a; border: 1px solid #fc8181; }
-        .alert-warning { background: #fef3c7; color: #92400e; border: 1px solid #fde68a; }
-        .navbar { background: white; border-bottom: 1px solid #e2e8f0; padding: 16px 0; margin-bottom: 32px; }
-        .navbar .container { display: flex; justify-content: space-between; align-items: center; }
-        .navbar-brand { font-size: 24px; font-weight: bold; color: #3182ce; text-decoration: none; }
-        .navbar-nav { display: flex; gap: 16px; align-items: center; }
-        .table { width: 100%; border-collapse: collapse; }
-        .table th, .table td { padding: 12px; text-align: left; border-bottom: 1px solid #e2e8f0; }
-        .table th { background: #f7fafc; font-weight: 600; }
-        .status-badge { padding: 4px 12px; border-radius: 20px; font-size: 12px; font-weight: 500; }
-        .status-draft { background: #e2e8f0; color: #4a5568; }
-        .status-sent { background: #bee3f8; color: #2c5aa0; }
-        .status-paid { background: #c6f6d5; color: #22543d; }
-        .tier-badge { padding: 6px 12px; border-radius: 20px; font-size: 11px; font-weight: 600; text-transform: uppercase; }
-        .tier-free { background: #e2e8f0; color: #4a5568; }
-        .tier-starter { background: #bee3f8; color: #2c5aa0; }
-        .tier-professional { background: #d6bcfa; color: #553c9a; }
-        .tier-business { background: #c6f6d5; color: #22543d; }
-        .grid { display: grid; gap: 20px; }
-        .grid-2 { grid-template-columns: 1fr 1fr; }
-        .grid-3 { grid-template-columns: 1fr 1fr 1fr; }
-        .text-center { text-align: center; }
-        .text-right { text-align: right; }
-        .mb-4 { margin-bottom: 16px; }
-        .mt-4 { margin-top: 16px; }
-        .popular-badge { position: absolute; top: -10px; right: 20px; background: #f56565; color: white; 
-                         padding: 4px 12px; border-radius: 12px; font-size: 11px; font-weight: 600; }
-        .pricing-card { position: relative; border: 2px solid #e2e8f0; border-radius: 12px; padding: 24px; }
-        .pricing-card.popular { border-color: #9f7aea; }
-        .usage-bar { background: #e2e8f0; height: 8px; border-radius: 4px; overflow: hidden; }
-        .usage-fill { background: #3182ce; height: 100%; transition: width 0.3s ease; }
-        .feature-list { list-style: none; }
-        .feature-list li { padding: 8px 0; display: flex; align-items: center; }
-        .feature-list li:before { content: "✓"; color: #38a169; font-weight: bold; margin-right: 8px; }
-    </style>
+    <link href="{{ static_url('css/base.css') }}" rel="stylesheet">
 </head>
 <body>
     <nav class="navbar">
         <div class="container">
-            <a href="{{ url_for('index') }}" class="navbar-brand">🧾 InvoiceGen Pro</a>
+            <a href="{{ url_for('main.index') }}" class="navbar-brand">🧾 InvoiceGen Pro</a>
             <div class="navbar-nav">
                 {% if current_user.is_authenticated %}
-                    <span class="tier-badge tier-{{ current_user.membership_tier }}">{{ current_user.get_tier_info()['name'] }}</span>
-                    <a href="{{ url_for('dashboard') }}" class="btn btn-secondary">Dashboard</a>
-                    <a href="{{ url_for('create_invoice') }}" class="btn btn-primary">New Invoice</a>
-                    <a href="{{ url_for('settings') }}" class="btn btn-outline">Settings</a>
-                    {% if current_user.membership_tier == 'free' %}
-                        <a href="{{ url_for('upgrade') }}" class="btn btn-purple">Upgrade</a>
+                    <span class="tier-badge tier-{{ current_user.tier.key }}">{{ current_user.tier.name }}</span>
+                    <a href="{{ url_for('main.dashboard') }}" class="btn btn-secondary">Dashboard</a>
+                    <a href="{{ url_for('main.clients') }}" class="btn btn-secondary">Clients</a>
+                    {% if current_user.tier.has('analytics') %}
+                        <a href="{{ url_for('main.analytics') }}" class="btn btn-secondary">Analytics</a>
                     {% endif %}
-                    <a href="{{ url_for('logout') }}" class="btn btn-secondary">Logout</a>
+                    <a href="{{ url_for('main.create_invoice') }}" class="btn btn-primary">New Invoice</a>
+                    <a href="{{ url_for('main.settings') }}" class="btn btn-outline">Settings</a>
+                    {% if current_user.tier.key == 'free' %}
+                        <a href="{{ url_for('main.upgrade') }}" class="btn btn-purple">Upgrade</a>
+                    {% endif %}
+                    <a href="{{ url_for('main.logout') }}" class="btn btn-secondary">Logout</a>
                 {% else %}
-                    <a href="{{ url_for('login') }}" class="btn btn-secondary">Login</a>
-                    <a href="{{ url_for('register') }}" class="btn btn-primary">Sign Up</a>
+                    <a href="{{ url_for('main.login') }}" class="btn btn-secondary">Login</a>
+                    <a href="{{ url_for('main.register') }}" class="btn btn-primary">Sign Up</a>
                 {% endif %}
             </div>
         </div>
     </nav>
 
     <div class="container">
-        {% with messages = get_flashed_messages(with_categories=true) %}
+        {% with messages = flashed_messages if flashed_messages is defined else get_flashed_messages(with_categories=true) %}
             {% if messages %}
                 {% for category, message in messages %}
                     <div class="alert alert-{{ category }}">{{ message }}</div>
@@ -1118,10 +2397,10 @@ INDEX_TEMPLATE = BASE_TEMPLATE.replace('{% block content %}{% endblock %}', '''
     </p>
     
     <div style="margin-bottom: 64px;">
-        <a href="{{ url_for('register') }}" class="btn btn-primary" style="font-size: 18px; padding: 16px 32px; margin-right: 16px;">
+        <a href="{{ url_for('main.register') }}" class="btn btn-primary" style="font-size: 18px; padding: 16px 32px; margin-right: 16px;">
             Get Started Free
         </a>
-        <a href="{{ url_for('login') }}" class="btn btn-secondary" style="font-size: 18px; padding: 16px 32px;">
+        <a href="{{ url_for('main.login') }}" class="btn btn-secondary" style="font-size: 18px; padding: 16px 32px;">
             Sign In
         </a>
     </div>
@@ -1147,7 +2426,7 @@ INDEX_TEMPLATE = BASE_TEMPLATE.replace('{% block content %}{% endblock %}', '''
                         <li>{{ feature }}</li>
                     {% endfor %}
                 </ul>
-                <a href="{{ url_for('register') }}?tier={{ tier_id }}" class="btn btn-{{ tier.color }}" style="width: 100%;">
+                <a href="{{ url_for('main.register') }}?tier={{ tier_id }}" class="btn btn-{{ tier.color }}" style="width: 100%;">
                     Get Started
                 </a>
             </div>
@@ -1223,7 +2502,7 @@ REGISTER_TEMPLATE = BASE_TEMPLATE.replace('{% block content %}{% endblock %}', '
             
             <div class="text-center mt-4">
                 <p style="color: #718096;">Already have an account? 
-                    <a href="{{ url_for('login') }}" style="color: #3182ce;">Sign in</a>
+                    <a href="{{ url_for('main.login') }}" style="color: #3182ce;">Sign in</a>
                 </p>
             </div>
         </div>
@@ -1259,7 +2538,7 @@ LOGIN_TEMPLATE = BASE_TEMPLATE.replace('{% block content %}{% endblock %}', '''
             
             <div class="text-center mt-4">
                 <p style="color: #718096;">Don't have an account? 
-                    <a href="{{ url_for('register') }}" style="color: #3182ce;">Create one</a>
+                    <a href="{{ url_for('main.register') }}" style="color: #3182ce;">Create one</a>
                 </p>
             </div>
             
@@ -1304,8 +2583,8 @@ DASHBOARD_TEMPLATE = BASE_TEMPLATE.replace('{% block content %}{% endblock %}',
                     <div style="color: #38a169; font-weight: bold;">✨ Unlimited Invoices</div>
                 {% endif %}
                 
-                {% if current_user.membership_tier == 'free' %}
-                    <a href="{{ url_for('upgrade') }}" class="btn btn-purple" style="margin-top: 16px;">
+                {% if current_user.tier.key == 'free' %}
+                    <a href="{{ url_for('main.upgrade') }}" class="btn btn-purple" style="margin-top: 16px;">
                         Upgrade for More Features
                     </a>
                 {% endif %}
@@ -1362,25 +2641,68 @@ DASHBOARD_TEMPLATE = BASE_TEMPLATE.replace('{% block content %}{% endblock %}',
     </div>
 </div>
 
+{% if aging %}
+<!-- Overdue aging, rebuilt by the nightly sweep -->
+<div class="card">
+    <div class="card-body">
+        <h3 style="margin-bottom: 16px;">⏰ Overdue ({{ analytics.overdue_invoices }})</h3>
+        <table class="table">
+            <thead>
+                <tr>
+                    <th>Currency</th>
+                    {% for column, label, first, last in aging_buckets %}
+                    <th class="text-right">{{ label }}</th>
+                    {% endfor %}
+                    <th class="text-right">Total</th>
+                </tr>
+            </thead>
+            <tbody>
+                {% for row in aging %}
+                <tr>
+                    <td>{{ row.currency }}</td>
+                    {% for column, label, first, last in aging_buckets %}
+                    <td class="text-right">{{ format_currency(row[column], row.currency) }}</td>
+                    {% endfor %}
+                    <td class="text-right"><strong>{{ format_currency(row.total, row.currency) }}</strong></td>
+                </tr>
+                {% endfor %}
+            </tbody>
+        </table>
+    </div>
+</div>
+{% endif %}
+
 <!-- Actions -->
 <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 32px;">
     <h2>Recent Invoices</h2>
     <div style="display: flex; gap: 12px;">
+        {% if current_user.tier.has('email_integration') %}
+        <form id="bulk-send" method="POST" action="{{ url_for('main.send_invoices') }}">
+            <input type="hidden" name="csrf_token" value="{{ csrf_token() }}"/>
+            <button type="submit" class="btn btn-secondary">✉️ Email selected</button>
+        </form>
+        {% endif %}
+        <form method="POST" action="{{ url_for('main.export_invoices') }}">
+            <input type="hidden" name="csrf_token" value="{{ csrf_token() }}"/>
+            <button type="submit" class="btn btn-secondary">📤 Export CSV</button>
+        </form>
         {% if usage.used < usage.limit or usage.limit == -1 %}
-            <a href="{{ url_for('create_invoice') }}" class="btn btn-primary">+ New Invoice</a>
+            <a href="{{ url_for('main.create_invoice') }}" class="btn btn-primary">+ New Invoice</a>
         {% else %}
-            <a href="{{ url_for('upgrade') }}" class="btn btn-purple">Upgrade to Create More</a>
+            <a href="{{ url_for('main.upgrade') }}" class="btn btn-purple">Upgrade to Create More</a>
         {% endif %}
     </div>
 </div>
 
-<!-- Invoices Table -->
+<!-- flush -->
+<!-- Invoices Table: rows are streamed as they are fetched -->
 <div class="card">
     <div class="card-body">
-        {% if invoices %}
+        {% if analytics.total_invoices %}
             <table class="table">
                 <thead>
                     <tr>
+                        {% if current_user.tier.has('email_integration') %}<th></th>{% endif %}
                         <th>Invoice #</th>
                         <th>Client</th>
                         <th>Date</th>
@@ -1391,10 +2713,18 @@ DASHBOARD_TEMPLATE = BASE_TEMPLATE.replace('{% block content %}{% endblock %}',
                     </tr>
                 </thead>
                 <tbody>
+                    {% set can_email = current_user.tier.has('email_integration') %}
                     {% for invoice in invoices %}
                     <tr>
+                        {% if can_email %}<td><input type="checkbox" name="invoice_ids" value="{{ invoice.id }}" form="bulk-send"></td>{% endif %}
                         <td style="font-weight: 500;">{{ invoice.invoice_number }}</td>
-                        <td>{{ invoice.client_name }}</td>
+                        <td>
+                            {% if invoice.client_id %}
+                                <a href="{{ url_for('main.view_client', client_id=invoice.client_id) }}">{{ invoice.client_name }}</a>
+                            {% else %}
+                                {{ invoice.client_name }}
+                            {% endif %}
+                        </td>
                         <td>{{ invoice.issue_date.strftime('%b %d, %Y') }}</td>
                         <td style="font-weight: 500;">{{ invoice.format_amount(invoice.total) }}</td>
                         <td>
@@ -1404,7 +2734,7 @@ DASHBOARD_TEMPLATE = BASE_TEMPLATE.replace('{% block content %}{% endblock %}',
                         </td>
                         <td><span class="status-badge status-{{ invoice.status }}">{{ invoice.status.title() }}</span></td>
                         <td>
-                            <a href="{{ url_for('view_invoice', invoice_id=invoice.id) }}" class="btn btn-secondary" style="padding: 6px 12px; font-size: 14px;">View</a>
+                            <a href="{{ url_for('main.view_invoice', invoice_id=invoice.id) }}" class="btn btn-secondary" style="padding: 6px 12px; font-size: 14px;">View</a>
                         </td>
                     </tr>
                     {% endfor %}
@@ -1416,9 +2746,9 @@ DASHBOARD_TEMPLATE = BASE_TEMPLATE.replace('{% block content %}{% endblock %}',
                 <h3 style="margin-bottom: 16px;">No invoices yet</h3>
                 <p style="color: #718096; margin-bottom: 24px;">Get started by creating your first invoice</p>
                 {% if usage.used < usage.limit or usage.limit == -1 %}
-                    <a href="{{ url_for('create_invoice') }}" class="btn btn-primary">Create Invoice</a>
+                    <a href="{{ url_for('main.create_invoice') }}" class="btn btn-primary">Create Invoice</a>
                 {% else %}
-                    <a href="{{ url_for('upgrade') }}" class="btn btn-purple">Upgrade to Create Invoices</a>
+                    <a href="{{ url_for('main.upgrade') }}" class="btn btn-purple">Upgrade to Create Invoices</a>
                 {% endif %}
             </div>
         {% endif %}
@@ -1431,7 +2761,7 @@ CREATE_INVOICE_TEMPLATE = BASE_TEMPLATE.replace('{% block content %}{% endblock
 {% block content %}
 <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 32px;">
     <h1>Create New Invoice</h1>
-    <a href="{{ url_for('dashboard') }}" class="btn btn-secondary">← Back to Dashboard</a>
+    <a href="{{ url_for('main.dashboard') }}" class="btn btn-secondary">← Back to Dashboard</a>
 </div>
 
 <form method="POST">
@@ -1476,7 +2806,7 @@ CREATE_INVOICE_TEMPLATE = BASE_TEMPLATE.replace('{% block content %}{% endblock
                     <input type="number" name="tax_rate" class="form-input" value="0" step="0.01" min="0" max="100">
                 </div>
                 
-                {% if current_user.can_access_feature('advanced_templates') %}
+                {% if current_user.tier.has('advanced_templates') %}
                 <div class="form-group">
                     <label class="form-label">Template Style</label>
                     <select name="template_style" class="form-select">
@@ -1557,7 +2887,7 @@ CREATE_INVOICE_TEMPLATE = BASE_TEMPLATE.replace('{% block content %}{% endblock
     </div>
 
     <div style="display: flex; gap: 16px; justify-content: flex-end; margin-top: 32px;">
-        <a href="{{ url_for('dashboard') }}" class="btn btn-secondary">Cancel</a>
+        <a href="{{ url_for('main.dashboard') }}" class="btn btn-secondary">Cancel</a>
         <button type="submit" class="btn btn-primary">Create Invoice</button>
     </div>
 </form>
@@ -1608,15 +2938,19 @@ VIEW_INVOICE_TEMPLATE = BASE_TEMPLATE.replace('{% block content %}{% endblock %}
         <p style="color: #718096; margin-top: 8px;">Created {{ invoice.created_at.strftime('%B %d, %Y') }}</p>
     </div>
     <div style="display: flex; gap: 12px;">
-        <a href="{{ url_for('dashboard') }}" class="btn btn-secondary">← Back</a>
+        <a href="{{ url_for('main.dashboard') }}" class="btn btn-secondary">← Back</a>
         {% if PDF_AVAILABLE %}
-        <a href="{{ url_for('download_pdf', invoice_id=invoice.id) }}" class="btn btn-primary">📄 Download PDF</a>
+        <a href="{{ url_for('main.download_pdf', invoice_id=invoice.id) }}" class="btn btn-primary">📄 Download PDF</a>
+        <form method="POST" action="{{ url_for('main.queue_pdf', invoice_id=invoice.id) }}" style="display: inline;">
+            <input type="hidden" name="csrf_token" value="{{ csrf_token() }}"/>
+            <button type="submit" class="btn btn-secondary">⏳ Prepare PDF in background</button>
+        </form>
         {% endif %}
     </div>
 </div>
 
 <!-- Currency Conversion (Premium Feature) -->
-{% if current_user.can_access_feature('currency_conversion') and currencies|length > 1 %}
+{% if current_user.tier.has('currency_conversion') and currencies|length > 1 %}
 <div class="card">
     <div class="card-body">
         <div style="display: flex; justify-content: between; align-items: center;">
@@ -1724,10 +3058,62 @@ VIEW_INVOICE_TEMPLATE = BASE_TEMPLATE.replace('{% block content %}{% endblock %}
     </div>
 </div>
 
+<div class="card">
+    <div class="card-body">
+        <form method="POST" action="{{ url_for('main.set_recurring', invoice_id=invoice.id) }}" style="display: flex; justify-content: space-between; align-items: center; gap: 12px;">
+            <input type="hidden" name="csrf_token" value="{{ csrf_token() }}"/>
+            <div>
+                <h3>🔁 Repeat this invoice</h3>
+                {% if recurring and recurring.active %}
+                <p style="color: #718096; margin-top: 4px;">{{ frequencies[recurring.frequency].name }}, next on {{ recurring.next_run_date.strftime('%B %d, %Y') }}</p>
+                {% endif %}
+            </div>
+            <div style="display: flex; gap: 12px; align-items: center;">
+                <select name="frequency" style="padding: 8px; border-radius: 4px; border: 1px solid #cbd5e0;">
+                    <option value="none">Does not repeat</option>
+                    {% for key, frequency in frequencies.items() %}
+                    <option value="{{ key }}" {% if recurring and recurring.active and recurring.frequency == key %}selected{% endif %}>{{ frequency.name }}</option>
+                    {% endfor %}
+                </select>
+                <button type="submit" class="btn btn-secondary">Save</button>
+            </div>
+        </form>
+    </div>
+</div>
+
+{% if current_user.tier.has('email_integration') %}
+<div class="card">
+    <div class="card-body">
+        <form method="POST" action="{{ url_for('main.send_invoice', invoice_id=invoice.id) }}">
+            <input type="hidden" name="csrf_token" value="{{ csrf_token() }}"/>
+            <h3 style="margin-bottom: 16px;">✉️ Email this invoice</h3>
+            <div style="display: flex; gap: 12px; align-items: center;">
+                <input type="email" name="recipient" class="form-input" value="{{ invoice.client_email or '' }}" placeholder="client@example.com" required>
+                <input type="text" name="message" class="form-input" placeholder="Add a note (optional)" maxlength="1000">
+                <button type="submit" class="btn btn-primary">Send</button>
+            </div>
+        </form>
+        {% if emails %}
+        <table class="table" style="margin-top: 16px;">
+            <tbody>
+                {% for email in emails %}
+                <tr>
+                    <td>{{ email.recipient }}</td>
+                    <td>{{ (email.sent_at or email.created_at).strftime('%b %d, %Y %H:%M') }}</td>
+                    <td><span class="status-badge status-{{ 'paid' if email.status == 'sent' else 'overdue' if email.status == 'failed' else 'pending' }}">{{ email.status.title() }}</span></td>
+                </tr>
+                {% endfor %}
+            </tbody>
+        </table>
+        {% endif %}
+    </div>
+</div>
+{% endif %}
+
 <script>
 function convertCurrency(targetCurrency) {
     if (targetCurrency) {
-        window.location.href = '{{ url_for("view_invoice", invoice_id=invoice.id) }}?convert_to=' + targetCurrency;
+        window.location.href = '{{ url_for("main.view_invoice", invoice_id=invoice.id) }}?convert_to=' + targetCurrency;
     }
 }
 </script>
@@ -1798,7 +3184,7 @@ UPGRADE_TEMPLATE = BASE_TEMPLATE.replace('{% block content %}{% endblock %}', ''
             {% if tier_id == current_tier %}
                 <div class="btn btn-outline" style="width: 100%; opacity: 0.6;">Current Plan</div>
             {% else %}
-                <form method="POST" action="{{ url_for('process_upgrade', tier_name=tier_id) }}">
+                <form method="POST" action="{{ url_for('main.process_upgrade', tier_name=tier_id) }}">
                     <input type="hidden" name="csrf_token" value="{{ csrf_token() }}"/>
                     <button type="submit" class="btn btn-{{ tier.color }}" style="width: 100%;">
                         {% if tier.price > tiers[current_tier].price %}Upgrade{% else %}Downgrade{% endif %} Now
@@ -1840,7 +3226,7 @@ SETTINGS_TEMPLATE = BASE_TEMPLATE.replace('{% block content %}{% endblock %}', '
 {% block content %}
 <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 32px;">
     <h1>Account Settings</h1>
-    <a href="{{ url_for('dashboard') }}" class="btn btn-secondary">← Back to Dashboard</a>
+    <a href="{{ url_for('main.dashboard') }}" class="btn btn-secondary">← Back to Dashboard</a>
 </div>
 
 <div class="grid grid-2">
@@ -1900,8 +3286,8 @@ SETTINGS_TEMPLATE = BASE_TEMPLATE.replace('{% block content %}{% endblock %}', '
         </div>
         <div class="card-body">
             <div style="text-align: center; margin-bottom: 24px;">
-                <div class="tier-badge tier-{{ current_user.membership_tier }}" style="font-size: 16px; padding: 12px 24px;">
-                    {{ current_user.get_tier_info().name }} Plan
+                <div class="tier-badge tier-{{ current_user.tier.key }}" style="font-size: 16px; padding: 12px 24px;">
+                    {{ current_user.tier.name }} Plan
                 </div>
             </div>
             
@@ -1923,7 +3309,7 @@ SETTINGS_TEMPLATE = BASE_TEMPLATE.replace('{% block content %}{% endblock %}', '
             <div style="margin-bottom: 24px;">
                 <h4 style="margin-bottom: 12px;">Plan Features</h4>
                 <ul class="feature-list">
-                    {% for feature in current_user.get_tier_info().features %}
+                    {% for feature in current_user.tier.features %}
                         <li>{{ feature }}</li>
                     {% endfor %}
                 </ul>
@@ -1935,8 +3321,8 @@ SETTINGS_TEMPLATE = BASE_TEMPLATE.replace('{% block content %}{% endblock %}', '
             </div>
             {% endif %}
             
-            {% if current_user.membership_tier != 'business' %}
-                <a href="{{ url_for('upgrade') }}" class="btn btn-purple" style="width: 100%;">
+            {% if current_user.tier.key != 'business' %}
+                <a href="{{ url_for('main.upgrade') }}" class="btn btn-purple" style="width: 100%;">
                     Upgrade Plan
                 </a>
             {% else %}
@@ -1948,6 +3334,18 @@ SETTINGS_TEMPLATE = BASE_TEMPLATE.replace('{% block content %}{% endblock %}', '
     </div>
 </div>
 
+{% if current_user.tier.has('api_access') %}
+<div class="card" style="margin-top: 32px;">
+    <div class="card-body" style="display: flex; justify-content: space-between; align-items: center;">
+        <div>
+            <h3>🔔 Webhooks</h3>
+            <p style="color: #718096; margin-top: 4px;">Get invoice events pushed to your own systems</p>
+        </div>
+        <a href="{{ url_for('main.webhooks') }}" class="btn btn-secondary">Manage webhooks</a>
+    </div>
+</div>
+{% endif %}
+
 <!-- Account Statistics -->
 <div class="card" style="margin-top: 32px;">
     <div class="card-header">
@@ -1973,13 +3371,355 @@ SETTINGS_TEMPLATE = BASE_TEMPLATE.replace('{% block content %}{% endblock %}', '
 {% endblock %}
 ''')
 
+CLIENTS_TEMPLATE = BASE_TEMPLATE.replace('{% block content %}{% endblock %}', '''
+{% block content %}
+<div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 32px;">
+    <h1>Clients</h1>
+    <a href="{{ url_for('main.create_invoice') }}" class="btn btn-primary">+ New Invoice</a>
+</div>
+
+<div class="card">
+    <div class="card-body">
+        {% if clients %}
+            <table class="table">
+                <thead>
+                    <tr>
+                        <th>Client</th>
+                        <th>Email</th>
+                        <th class="text-right">Invoices</th>
+                        <th class="text-right">Outstanding</th>
+                        <th class="text-right">Lifetime Value</th>
+                        <th>Last Invoice</th>
+                    </tr>
+                </thead>
+                <tbody>
+                    {% for client in clients %}
+                    <tr>
+                        <td style="font-weight: 500;">
+                            <a href="{{ url_for('main.view_client', client_id=client.id) }}">{{ client.name }}</a>
+                        </td>
+                        <td>{{ client.email or '' }}</td>
+                        <td class="text-right">{{ client.invoice_count }}</td>
+                        <td class="text-right">
+                            {% for total in client.currency_totals if total.outstanding %}
+                            <div>{{ format_currency(total.outstanding, total.currency) }}</div>
+                            {% else %}
+                            {{ format_currency(0, current_user.default_currency) }}
+                            {% endfor %}
+                        </td>
+                        <td class="text-right">
+                            {% for total in client.currency_totals if total.lifetime_value %}
+                            <div>{{ format_currency(total.lifetime_value, total.currency) }}</div>
+                            {% else %}
+                            {{ format_currency(0, current_user.default_currency) }}
+                            {% endfor %}
+                        </td>
+                        <td>{{ client.last_invoice_date.strftime('%b %d, %Y') if client.last_invoice_date else '' }}</td>
+                    </tr>
+                    {% endfor %}
+                </tbody>
+            </table>
+        {% else %}
+            <div class="text-center" style="padding: 64px 0;">
+                <div style="font-size: 64px; margin-bottom: 24px; opacity: 0.5;">👥</div>
+                <h3 style="margin-bottom: 16px;">No clients yet</h3>
+                <p style="color: #718096;">Clients are added automatically from the invoices you create</p>
+            </div>
+        {% endif %}
+    </div>
+</div>
+{% endblock %}
+''')
+
+VIEW_CLIENT_TEMPLATE = BASE_TEMPLATE.replace('{% block content %}{% endblock %}', '''
+{% block content %}
+<div style="margin-bottom: 24px;">
+    <a href="{{ url_for('main.clients') }}" class="btn btn-secondary">← Back to Clients</a>
+</div>
+
+<div class="card">
+    <div class="card-body">
+        <h1>{{ client.name }}</h1>
+        <p style="color: #718096; margin-top: 8px;">
+            {% if client.email %}{{ client.email }}<br>{% endif %}
+            {% if client.address %}{{ client.address }}{% endif %}
+        </p>
+    </div>
+</div>
+
+<div class="grid grid-2" style="margin-bottom: 32px;">
+    <div class="card">
+        <div class="card-body text-center">
+            {% for total in client.currency_totals if total.outstanding %}
+            <h4 style="font-size: 24px;">{{ format_currency(total.outstanding, total.currency) }}</h4>
+            {% else %}
+            <h4 style="font-size: 24px;">{{ format_currency(0, current_user.default_currency) }}</h4>
+            {% endfor %}
+            <p style="color: #718096;">Outstanding</p>
+        </div>
+    </div>
+    <div class="card">
+        <div class="card-body text-center">
+            {% for total in client.currency_totals if total.lifetime_value %}
+            <h4 style="color: #38a169; font-size: 24px;">{{ format_currency(total.lifetime_value, total.currency) }}</h4>
+            {% else %}
+            <h4 style="color: #38a169; font-size: 24px;">{{ format_currency(0, current_user.default_currency) }}</h4>
+            {% endfor %}
+            <p style="color: #718096;">Lifetime value across {{ client.invoice_count }} invoices</p>
+        </div>
+    </div>
+</div>
+
+<div class="card">
+    <div class="card-body">
+        <table class="table">
+            <thead>
+                <tr>
+                    <th>Invoice #</th>
+                    <th>Date</th>
+                    <th>Amount</th>
+                    <th>Status</th>
+                    <th>Actions</th>
+                </tr>
+            </thead>
+            <tbody>
+                {% for invoice in invoices %}
+                <tr>
+                    <td style="font-weight: 500;">{{ invoice.invoice_number }}</td>
+                    <td>{{ invoice.issue_date.strftime('%b %d, %Y') }}</td>
+                    <td style="font-weight: 500;">{{ invoice.format_amount(invoice.total) }}</td>
+                    <td><span class="status-badge status-{{ invoice.status }}">{{ invoice.status.title() }}</span></td>
+                    <td>
+                        <a href="{{ url_for('main.view_invoice', invoice_id=invoice.id) }}" class="btn btn-secondary" style="padding: 6px 12px; font-size: 14px;">View</a>
+                    </td>
+                </tr>
+                {% endfor %}
+            </tbody>
+        </table>
+    </div>
+</div>
+{% endblock %}
+''')
+
+ANALYTICS_TEMPLATE = BASE_TEMPLATE.replace('{% block content %}{% endblock %}', '''
+{% block content %}
+<div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 32px;">
+    <h1>Analytics</h1>
+    <form method="GET" style="display: flex; gap: 12px;">
+        {% if report.currencies|length > 1 %}
+        <select name="currency" class="form-control" onchange="this.form.submit()">
+            {% for code in report.currencies %}
+            <option value="{{ code }}" {% if code == report.currency %}selected{% endif %}>{{ code }}</option>
+            {% endfor %}
+        </select>
+        {% endif %}
+        {% if advanced %}
+        <select name="months" class="form-control" onchange="this.form.submit()">
+            {% for months in ranges %}
+            <option value="{{ months or 'all' }}" {% if months == report.months %}selected{% endif %}>
+                {{ 'Last %d months'|format(months) if months else 'All time' }}
+            </option>
+            {% endfor %}
+        </select>
+        {% endif %}
+    </form>
+</div>
+
+<div class="grid grid-2" style="margin-bottom: 32px;">
+    <div class="card">
+        <div class="card-body text-center">
+            <h3 style="color: #3182ce; font-size: 28px; margin-bottom: 8px;">{{ format_currency(report.invoiced, report.currency) }}</h3>
+            <p style="color: #718096;">Invoiced{% if report.months %} in the last {{ report.months }} months{% endif %}</p>
+        </div>
+    </div>
+    <div class="card">
+        <div class="card-body text-center">
+            <h3 style="color: #38a169; font-size: 28px; margin-bottom: 8px;">
+                {{ '%.0f%%'|format(report.collection_rate * 100) if report.collection_rate is not none else '–' }}
+            </h3>
+            <p style="color: #718096;">Collected ({{ format_currency(report.collected, report.currency) }}), {{ format_currency(report.outstanding, report.currency) }} outstanding</p>
+        </div>
+    </div>
+</div>
+
+<!-- Revenue over time, one bar per month -->
+<div class="card">
+    <div class="card-body">
+        <h3 style="margin-bottom: 16px;">📈 Revenue by month</h3>
+        <div style="display: flex; align-items: flex-end; gap: 2px; height: 200px;">
+            {% for point in report.series %}
+            <div title="{{ point.month.strftime('%b %Y') }}: {{ format_currency(point.invoiced, report.currency) }} invoiced, {{ format_currency(point.collected, report.currency) }} collected"
+                 style="flex: 1; display: flex; flex-direction: column; justify-content: flex-end; height: 100%;">
+                {% if peak %}
+                <div style="background: #bee3f8; height: {{ ((point.invoiced - point.collected) / peak * 100)|round(2) }}%;"></div>
+                <div style="background: #3182ce; height: {{ (point.collected / peak * 100)|round(2) }}%;"></div>
+                {% endif %}
+            </div>
+            {% endfor %}
+        </div>
+        {% if report.series %}
+        <div style="display: flex; justify-content: space-between; color: #718096; font-size: 12px; margin-top: 8px;">
+            <span>{{ report.series[0].month.strftime('%b %Y') }}</span>
+            <span>{{ report.series[-1].month.strftime('%b %Y') }}</span>
+        </div>
+        {% endif %}
+    </div>
+</div>
+
+{% if advanced %}
+<div class="card">
+    <div class="card-body">
+        <h3 style="margin-bottom: 16px;">🏆 Top clients in {{ report.currency }}</h3>
+        {% if report.top_clients %}
+        <table class="table">
+            <thead>
+                <tr>
+                    <th>Client</th>
+                    <th class="text-right">Invoices</th>
+                    <th class="text-right">Outstanding</th>
+                    <th class="text-right">Lifetime Value</th>
+                </tr>
+            </thead>
+            <tbody>
+                {% for client in report.top_clients %}
+                <tr>
+                    <td><a href="{{ url_for('main.view_client', client_id=client.id) }}">{{ client.name }}</a></td>
+                    <td class="text-right">{{ client.invoice_count }}</td>
+                    <td class="text-right">{{ format_currency(client.outstanding, report.currency) }}</td>
+                    <td class="text-right">{{ format_currency(client.lifetime_value, report.currency) }}</td>
+                </tr>
+                {% endfor %}
+            </tbody>
+        </table>
+        {% else %}
+        <p style="color: #718096;">No invoiced clients yet.</p>
+        {% endif %}
+    </div>
+</div>
+{% else %}
+<div class="card">
+    <div class="card-body text-center">
+        <p style="color: #718096; margin-bottom: 16px;">Longer history and top clients come with Advanced analytics.</p>
+        <a href="{{ url_for('main.upgrade') }}" class="btn btn-purple">Upgrade to Professional</a>
+    </div>
+</div>
+{% endif %}
+{% endblock %}
+''')
+
+WEBHOOKS_TEMPLATE = BASE_TEMPLATE.replace('{% block content %}{% endblock %}', '''
+{% block content %}
+<div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 32px;">
+    <h1>Webhooks</h1>
+    <a href="{{ url_for('main.settings') }}" class="btn btn-secondary">← Settings</a>
+</div>
+
+<div class="card">
+    <div class="card-body">
+        <form method="POST">
+            <input type="hidden" name="csrf_token" value="{{ csrf_token() }}"/>
+            <div class="form-group">
+                <label class="form-label">Endpoint URL</label>
+                <input type="url" name="url" class="form-input" placeholder="https://example.com/hooks/invoices" required>
+            </div>
+            <div class="form-group">
+                {% for key, label in events.items() %}
+                <label style="margin-right: 16px;"><input type="checkbox" name="events" value="{{ key }}" checked> {{ label }}</label>
+                {% endfor %}
+            </div>
+            <button type="submit" class="btn btn-primary">Add Webhook</button>
+        </form>
+        <p style="color: #718096; font-size: 14px; margin-top: 16px;">
+            Events are POSTed as <code>{"events": [...]}</code>. Verify the <code>X-Invoicer-Signature</code> header:
+            <code>sha256=</code> HMAC-SHA256 of <code>&lt;X-Invoicer-Timestamp&gt;.&lt;body&gt;</code> keyed with the webhook's secret.
+        </p>
+    </div>
+</div>
+
+{% for webhook in webhooks %}
+<div class="card">
+    <div class="card-body">
+        <div style="display: flex; justify-content: space-between; align-items: center; gap: 12px;">
+            <div>
+                <h3 style="word-break: break-all;">{{ webhook.url }}</h3>
+                <p style="color: #718096; margin-top: 4px;">
+                    {{ webhook.event_list()|join(', ') }} ·
+                    {% if webhook.active %}Active{% else %}<strong>Disabled</strong>{% endif %}
+                    {% if webhook.last_delivery_at %} · last attempt {{ webhook.last_delivery_at.strftime('%b %d, %H:%M') }}
+                    ({{ webhook.last_error or webhook.last_status_code }}){% endif %}
+                </p>
+                <p style="color: #718096; font-size: 13px; margin-top: 4px;">Secret: <code>{{ webhook.secret }}</code></p>
+            </div>
+            <div style="display: flex; gap: 8px;">
+                <form method="POST" action="{{ url_for('main.test_webhook', webhook_id=webhook.id) }}">
+                    <input type="hidden" name="csrf_token" value="{{ csrf_token() }}"/>
+                    <button type="submit" class="btn btn-secondary">Send test</button>
+                </form>
+                <form method="POST" action="{{ url_for('main.delete_webhook', webhook_id=webhook.id) }}">
+                    <input type="hidden" name="csrf_token" value="{{ csrf_token() }}"/>
+                    <button type="submit" class="btn btn-secondary">Delete</button>
+                </form>
+            </div>
+        </div>
+        {% if recent.get(webhook.id) %}
+        <table class="table" style="margin-top: 16px;">
+            <tbody>
+                {% for delivery in recent[webhook.id] %}
+                <tr>
+                    <td>{{ delivery.event }}</td>
+                    <td>{{ delivery.created_at.strftime('%b %d, %H:%M:%S') }}</td>
+                    <td>{{ delivery.attempts }} attempt{{ 's' if delivery.attempts != 1 }}</td>
+                    <td><span class="status-badge status-{{ {'delivered': 'paid', 'failed': 'overdue'}.get(delivery.status, 'pending') }}">{{ delivery.status.title() }}</span></td>
+                </tr>
+                {% endfor %}
+            </tbody>
+        </table>
+        {% endif %}
+    </div>
+</div>
+{% endfor %}
+{% endblock %}
+''')
+
+JOB_TEMPLATE = BASE_TEMPLATE.replace('{% block content %}{% endblock %}', '''
+{% block content %}
+<div style="margin-bottom: 24px;">
+    <a href="{{ url_for('main.dashboard') }}" class="btn btn-secondary">← Back to Dashboard</a>
+</div>
+
+<div class="card">
+    <div class="card-body text-center" style="padding: 48px 0;">
+        {% if job.status in ('queued', 'running') %}
+            <div style="font-size: 64px; margin-bottom: 24px;">⏳</div>
+            <h2 style="margin-bottom: 16px;">{{ 'Working on it…' if job.status == 'running' else 'Waiting for a worker…' }}</h2>
+            <p style="color: #718096;">
+                {% if job.attempts %}Attempt {{ job.attempts }} of {{ job.max_attempts }}. {% endif %}
+                This page refreshes until your file is ready.
+            </p>
+            <script>setTimeout(function () { window.location.reload(); }, 2000);</script>
+        {% elif job.status == 'succeeded' %}
+            <div style="font-size: 64px; margin-bottom: 24px;">✅</div>
+            <h2 style="margin-bottom: 24px;">Ready</h2>
+            {% if job.result_type %}
+            <a href="{{ url_for('main.job_result', job_id=job.id) }}" class="btn btn-primary">Download {{ job.result_name }}</a>
+            {% endif %}
+        {% else %}
+            <div style="font-size: 64px; margin-bottom: 24px;">⚠️</div>
+            <h2 style="margin-bottom: 16px;">This job failed</h2>
+            <p style="color: #718096;">We tried {{ job.attempts }} times. Please try again later.</p>
+        {% endif %}
+    </div>
+</div>
+{% endblock %}
+''')
+
 ERROR_404_TEMPLATE = BASE_TEMPLATE.replace('{% block content %}{% endblock %}', '''
 {% block content %}
 <div class="text-center" style="padding: 64px 0;">
     <div style="font-size: 96px; margin-bottom: 32px; opacity: 0.5;">❓</div>
     <h1 style="font-size: 48px; margin-bottom: 16px;">Page Not Found</h1>
     <p style="color: #718096; margin-bottom: 32px;">The page you're looking for doesn't exist or has been moved.</p>
-    <a href="{{ url_for('index') }}" class="btn btn-primary">Go Home</a>
+    <a href="{{ url_for('main.index') }}" class="btn btn-primary">Go Home</a>
 </div>
 {% endblock %}
 ''')
@@ -1990,23 +3730,47 @@ ERROR_500_TEMPLATE = BASE_TEMPLATE.replace('{% block content %}{% endblock %}',
     <div style="font-size: 96px; margin-bottom: 32px; opacity: 0.5;">⚠️</div>
     <h1 style="font-size: 48px; margin-bottom: 16px;">Server Error</h1>
     <p style="color: #718096; margin-bottom: 32px;">Something went wrong on our end. Please try again later.</p>
-    <a href="{{ url_for('index') }}" class="btn btn-primary">Go Home</a>
+    <a href="{{ url_for('main.index') }}" class="btn btn-primary">Go Home</a>
 </div>
 {% endblock %}
 ''')
 
+# Templates registered with the Jinja loader in create_app()
+PAGE_TEMPLATES = {
+    'pages/index.html': INDEX_TEMPLATE,
+    'pages/register.html': REGISTER_TEMPLATE,
+    'pages/login.html': LOGIN_TEMPLATE,
+    'pages/dashboard.html': DASHBOARD_TEMPLATE,
+    'pages/create_invoice.html': CREATE_INVOICE_TEMPLATE,
+    'pages/view_invoice.html': VIEW_INVOICE_TEMPLATE,
+    'pages/upgrade.html': UPGRADE_TEMPLATE,
+    'pages/settings.html': SETTINGS_TEMPLATE,
+    'pages/clients.html': CLIENTS_TEMPLATE,
+    'pages/view_client.html': VIEW_CLIENT_TEMPLATE,
+    'pages/analytics.html': ANALYTICS_TEMPLATE,
+    'pages/job.html': JOB_TEMPLATE,
+    'pages/webhooks.html': WEBHOOKS_TEMPLATE,
+    'pages/errors/404.html': ERROR_404_TEMPLATE,
+    'pages/errors/500.html': ERROR_500_TEMPLATE
+}
+
+# Part of the view page ETag so a template change invalidates cached copies
+VIEW_INVOICE_TEMPLATE_VERSION = build_etag(VIEW_INVOICE_TEMPLATE)
+
 # Main execution
 if __name__ == '__main__':
     print('='*60)
     print('🧾 ENHANCED INVOICE GENERATOR STARTING')
     print('='*60)
     
+    app = create_app()
+    
     # Initialize database
-    if not init_db():
+    if not init_db(app):
         print("❌ Failed to initialize database. Exiting.")
         exit(1)
     
-    print(f'📱 Application: http://localhost:5000')
+    print('📱 Application: http://localhost:5000')
     print('🔑 Demo Accounts:')
     print('   Admin (Business): admin@invoicegen.com / SecureAdmin123!')
     print('   Free: test@example.com / test1234')
@@ -2014,8 +3778,9 @@ if __name__ == '__main__':
     print('   Professional: pro@example.com / professional123')
     print('   Business: business@example.com / business123')
     print(f'📄 PDF Generation: {"✅ Enabled" if PDF_AVAILABLE else "❌ Disabled (install ReportLab)"}')
-    print(f'🛡️  Rate Limiting: {"✅ Enabled" if hasattr(limiter, "limit") and not isinstance(limiter, type) else "❌ Disabled"}')
-    print(f'💰 Membership Tiers: ✅ 4 tiers (Free, Starter, Professional, Business)')
+    print(f'🛡️  Rate Limiting: {"✅ Enabled" if RATE_LIMITING_AVAILABLE and app.config["RATELIMIT_ENABLED"] else "❌ Disabled"}')
+    tiers = entitlements().tiers
+    print(f'💰 Membership Tiers: ✅ {len(tiers)} tiers ({", ".join(tier.name for tier in tiers.values())})')
     print(f'💱 Currencies: ✅ {len(CURRENCIES)} currencies supported')
     print('🛑 Stop server: Press Ctrl+C')
     print('='*60)
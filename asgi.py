@@ -0,0 +1,485 @@
+# asgi.py - Async JSON API for the Invoice Generator
+"""
+Asyncio implementation of the JSON endpoints, served over ASGI so slow
+database or FX calls only suspend a coroutine instead of blocking a worker.
+It authenticates with the same session cookie as the Flask site and shares
+its models and business rules.
+
+    uvicorn asgi:api           # API only, next to gunicorn serving wsgi:app
+    uvicorn asgi:application   # API plus the Flask site (needs asgiref)
+
+Requires an async database driver: aiosqlite for SQLite, asyncpg for Postgres.
+Responses are encoded with orjson when it is installed.
+
+GET /api/invoices pages through an account newest first. Pass ?limit= (up
+to MAX_PAGE_SIZE) and the previous page's next_cursor as ?cursor=;
+?fields=id,total,status returns only those fields and ?include=items embeds
+line items.
+
+Successful GET responses carry a strong ETag over the response body and are
+sent with `private, no-cache`. A request whose If-None-Match matches gets an
+empty 304 instead of the body. Other responses are `private, no-store`.
+"""
+import base64
+import hashlib
+import json
+import logging
+import re
+from datetime import date, datetime
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs
+
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from app import configure_sqlite, create_app
+from models import (
+    db, CURRENCIES, WRITE_TRANSACTION, Invoice, InvoiceItem, User, build_invoice, client_lookup_query, client_match_key,
+    convert_currency, format_currency, get_exchange_rate, invoices_this_month_query,
+    link_client, within_invoice_limit
+)
+
+logger = logging.getLogger('invoicer.asgi')
+
+API_PREFIX = '/api/'
+MAX_BODY_SIZE = 1024 * 1024
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 1000
+
+# Fields the invoice endpoints can return (select with ?fields=a,b,c) and
+# the related data they can embed (?include=items)
+INVOICE_FIELDS = (
+    'id', 'invoice_number', 'client_id', 'client_name', 'client_email', 'client_address',
+    'issue_date', 'due_date', 'currency', 'subtotal', 'tax_rate', 'tax_amount', 'total',
+    'notes', 'status', 'template_style', 'created_at', 'updated_at'
+)
+ITEM_FIELDS = ('id', 'description', 'quantity', 'rate', 'amount')
+INCLUDES = ('items',)
+
+# Async drivers for the sync URLs the Flask app is configured with
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+    'postgres': 'postgresql+asyncpg'
+}
+
+
+class APIError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def async_database_url(url):
+    """Translate a sync SQLAlchemy URL to the matching async driver"""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f'No async driver configured for {backend} databases')
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+def async_engine_options(url, config):
+    """The app's DB_* pool settings, translated for an async engine"""
+    url = make_url(url)
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        return {}
+
+    asyncpg = url.drivername == 'postgresql+asyncpg'
+    timeout = config['DB_STATEMENT_TIMEOUT']
+    if config['DB_PGBOUNCER']:
+        options = {'poolclass': NullPool}
+        if asyncpg:
+            # Prepared statements don't survive PgBouncer transaction pooling
+            options['connect_args'] = {'statement_cache_size': 0, 'prepared_statement_cache_size': 0}
+        return options
+
+    options = {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING']
+    }
+    if asyncpg and timeout:
+        options['connect_args'] = {'server_settings': {'statement_timeout': str(timeout)}}
+    return options
+
+
+class Request:
+    """The parts of an ASGI HTTP request the handlers need"""
+
+    def __init__(self, scope, body):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.query = {k: v[-1] for k, v in parse_qs(scope.get('query_string', b'').decode('latin-1'),
+                                                     keep_blank_values=True).items()}
+        self.headers = {k.decode('latin-1').lower(): v.decode('latin-1') for k, v in scope.get('headers', [])}
+        self.cookies = {}
+        if 'cookie' in self.headers:
+            cookie = SimpleCookie()
+            cookie.load(self.headers['cookie'])
+            self.cookies = {key: morsel.value for key, morsel in cookie.items()}
+        self.body = body
+
+    def json(self):
+        try:
+            data = json.loads(self.body or b'null')
+        except ValueError:
+            raise APIError(400, 'Invalid JSON body')
+        if not isinstance(data, dict):
+            raise APIError(400, 'Expected a JSON object')
+        return data
+
+
+class AsyncAPI:
+    """Minimal ASGI application routing /api/ requests to async handlers"""
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        with flask_app.app_context():
+            sync_url = db.engine.url
+        url = flask_app.config.get('ASYNC_DATABASE_URL') or async_database_url(sync_url)
+        self.engine = create_async_engine(url, **async_engine_options(url, flask_app.config))
+        if self.engine.dialect.name == 'sqlite':
+            configure_sqlite(self.engine.sync_engine, flask_app.config)
+        self.Session = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.session_serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+        self.session_cookie_name = flask_app.config['SESSION_COOKIE_NAME']
+        self.csrf_serializer = URLSafeTimedSerializer(flask_app.config['SECRET_KEY'], salt='wtf-csrf-token')
+        self.csrf_time_limit = flask_app.config.get('WTF_CSRF_TIME_LIMIT', 3600)
+        self.max_session_age = int(flask_app.permanent_session_lifetime.total_seconds())
+        self.routes = []
+        self.route('POST', '/api/convert', api_convert_currency)
+        self.route('GET', '/api/invoices', api_list_invoices)
+        self.route('POST', '/api/invoices', api_create_invoice)
+        self.route('GET', '/api/invoices/<invoice_id>', api_get_invoice)
+
+    def route(self, method, rule, handler):
+        pattern = re.compile('^' + re.sub(r'<(\w+)>', r'(?P<\1>[^/]+)', rule) + '$')
+        self.routes.append((method, pattern, handler))
+
+    def mount(self, fallback):
+        """ASGI app serving the API and passing every other request to `fallback`"""
+        async def application(scope, receive, send):
+            if scope['type'] == 'http' and not scope['path'].startswith(API_PREFIX):
+                return await fallback(scope, receive, send)
+            return await self(scope, receive, send)
+        return application
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            return
+
+        request = None
+        try:
+            body = await read_body(receive)
+            request = Request(scope, body)
+            handler, params = self.match(request)
+            async with self.Session() as session:
+                user = await self.authenticate(request, session)
+                status, payload = await handler(request, session, user, **params)
+        except APIError as e:
+            status, payload = e.status, {'error': e.message}
+        except Exception as e:
+            logger.error(f'Async API error on {scope.get("path")}: {str(e)}')
+            status, payload = 500, {'error': 'Internal server error'}
+        await send_json(send, status, payload, request)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def match(self, request):
+        allowed = False
+        for method, pattern, handler in self.routes:
+            match = pattern.match(request.path)
+            if match:
+                if method == request.method:
+                    return handler, match.groupdict()
+                allowed = True
+        if allowed:
+            raise APIError(405, 'Method not allowed')
+        raise APIError(404, 'Not found')
+
+    async def authenticate(self, request, session):
+        """Resolve the logged-in user from the Flask session cookie"""
+        cookie = request.cookies.get(self.session_cookie_name)
+        if not cookie:
+            raise APIError(401, 'Authentication required')
+        try:
+            flask_session = self.session_serializer.loads(cookie, max_age=self.max_session_age)
+        except BadSignature:
+            raise APIError(401, 'Authentication required')
+
+        user_id = flask_session.get('_user_id')
+        user = await session.get(User, user_id) if user_id else None
+        if user is None or not user.is_active:
+            raise APIError(401, 'Authentication required')
+
+        if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            self.check_csrf(request, flask_session)
+        return user
+
+    def check_csrf(self, request, flask_session):
+        """Same token check Flask-WTF applies to the WSGI routes"""
+        token = request.headers.get('x-csrftoken') or request.headers.get('x-csrf-token')
+        if not token or 'csrf_token' not in flask_session:
+            raise APIError(400, 'The CSRF token is missing.')
+        try:
+            valid = self.csrf_serializer.loads(token, max_age=self.csrf_time_limit) == flask_session['csrf_token']
+        except BadSignature:
+            valid = False
+        if not valid:
+            raise APIError(400, 'The CSRF token is invalid.')
+
+
+async def begin_write(session):
+    """Async counterpart of models.begin_write()"""
+    if session.bind.dialect.name != 'sqlite':
+        return
+    if session.in_transaction():
+        await session.commit()
+    await session.connection(execution_options={WRITE_TRANSACTION: True})
+
+
+async def read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if len(body) > MAX_BODY_SIZE:
+            raise APIError(413, 'Request body too large')
+        if not message.get('more_body'):
+            return body
+
+
+def json_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def dump_json(payload):
+    """Encode a response body; orjson when installed, same output either way"""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, default=json_default, separators=(',', ':')).encode('utf-8')
+
+
+def body_etag(body):
+    """Strong ETag over an encoded response body"""
+    return '"' + hashlib.sha1(body).hexdigest() + '"'
+
+
+def etag_matches(if_none_match, etag):
+    """Whether an If-None-Match header names `etag`"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    return any(tag.strip().removeprefix('W/') == etag for tag in if_none_match.split(','))
+
+
+async def send_json(send, status, payload, request=None):
+    """Send a JSON response; successful GETs get an ETag and may be answered with 304"""
+    body = dump_json(payload)
+    headers = [(b'content-type', b'application/json')]
+    if request is not None and request.method == 'GET' and status == 200:
+        etag = body_etag(body)
+        headers += [(b'etag', etag.encode('latin-1')), (b'cache-control', b'private, no-cache')]
+        if etag_matches(request.headers.get('if-none-match'), etag):
+            status, body = 304, b''
+    else:
+        headers.append((b'cache-control', b'private, no-store'))
+    if status != 304:
+        headers.append((b'content-length', str(len(body)).encode('latin-1')))
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+# Handlers: (request, session, user, **path params) -> (status, payload)
+async def api_convert_currency(request, session, user):
+    if not user.tier.has('currency_conversion'):
+        raise APIError(403, 'Currency conversion requires Professional tier or higher')
+
+    data = request.json()
+    try:
+        amount = float(data.get('amount', 0))
+    except (TypeError, ValueError):
+        raise APIError(400, 'Invalid amount')
+    from_currency = data.get('from', 'USD')
+    to_currency = data.get('to', 'USD')
+
+    if from_currency not in CURRENCIES or to_currency not in CURRENCIES:
+        raise APIError(400, 'Invalid currency code')
+
+    converted_amount = convert_currency(amount, from_currency, to_currency)
+    return 200, {
+        'amount': float(converted_amount),
+        'rate': get_exchange_rate(from_currency, to_currency),
+        'from': from_currency,
+        'to': to_currency,
+        'formatted': format_currency(float(converted_amount), to_currency)
+    }
+
+
+def require_api_access(user):
+    if not user.tier.has('api_access'):
+        raise APIError(403, 'API access requires Business tier')
+
+
+def requested_fields(request):
+    """The ?fields= subset of INVOICE_FIELDS, in the order given; all by default"""
+    if not request.query.get('fields'):
+        return INVOICE_FIELDS
+    fields = [field.strip() for field in request.query['fields'].split(',') if field.strip()]
+    unknown = [field for field in fields if field not in INVOICE_FIELDS]
+    if unknown:
+        raise APIError(400, f'Unknown field: {unknown[0]}')
+    return tuple(dict.fromkeys(fields))
+
+
+def requested_includes(request, default=()):
+    if 'include' not in request.query:
+        return set(default)
+    includes = {name.strip() for name in request.query['include'].split(',') if name.strip()}
+    unknown = includes - set(INCLUDES)
+    if unknown:
+        raise APIError(400, f'Unknown include: {sorted(unknown)[0]}')
+    return includes
+
+
+def invoice_columns(fields):
+    """Table columns to select for `fields`, plus the id and paging key"""
+    names = dict.fromkeys(('id', 'created_at') + tuple(fields))
+    return [Invoice.__table__.c[name] for name in names]
+
+
+def encode_cursor(row):
+    """Opaque position after `row` in created_at, id descending order"""
+    position = json.dumps([row['created_at'].isoformat(), row['id']])
+    return base64.urlsafe_b64encode(position.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        created_at, invoice_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return datetime.fromisoformat(created_at), str(invoice_id)
+    except (ValueError, TypeError):
+        raise APIError(400, 'Invalid cursor')
+
+
+async def load_items(session, invoice_ids):
+    """{invoice id: [item dicts]} for a page of invoices, in one query"""
+    items = {invoice_id: [] for invoice_id in invoice_ids}
+    if not invoice_ids:
+        return items
+    table = InvoiceItem.__table__
+    rows = await session.execute(
+        db.select(table.c.invoice_id, *[table.c[field] for field in ITEM_FIELDS])
+        .where(table.c.invoice_id.in_(invoice_ids))
+    )
+    for row in rows.mappings():
+        items[row['invoice_id']].append({field: row[field] for field in ITEM_FIELDS})
+    return items
+
+
+async def api_list_invoices(request, session, user):
+    """A page of invoices, newest first, continued with ?cursor=<next_cursor>"""
+    require_api_access(user)
+    try:
+        limit = min(max(int(request.query.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        raise APIError(400, 'Invalid limit')
+    fields = requested_fields(request)
+    includes = requested_includes(request)
+
+    query = db.select(*invoice_columns(fields)).where(Invoice.user_id == user.id)
+    if request.query.get('status'):
+        query = query.where(Invoice.status == request.query['status'])
+    if request.query.get('cursor'):
+        query = query.where(db.tuple_(Invoice.created_at, Invoice.id) < decode_cursor(request.query['cursor']))
+    # Keyset paging over ix_invoice_user_created; one extra row tells us if there is more
+    query = query.order_by(Invoice.created_at.desc(), Invoice.id.desc()).limit(limit + 1)
+
+    rows = (await session.execute(query)).mappings().all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    invoices = [{field: row[field] for field in fields} for row in rows]
+    if 'items' in includes:
+        items = await load_items(session, [row['id'] for row in rows])
+        for invoice, row in zip(invoices, rows):
+            invoice['items'] = items[row['id']]
+    return 200, {
+        'invoices': invoices,
+        'has_more': has_more,
+        'next_cursor': encode_cursor(rows[-1]) if has_more else None
+    }
+
+
+async def api_get_invoice(request, session, user, invoice_id):
+    require_api_access(user)
+    fields = requested_fields(request)
+    row = (await session.execute(
+        db.select(*invoice_columns(fields)).where(Invoice.id == invoice_id, Invoice.user_id == user.id)
+    )).mappings().first()
+    if row is None:
+        raise APIError(404, 'Invoice not found')
+    invoice = {field: row[field] for field in fields}
+    if 'items' in requested_includes(request, default=INCLUDES):
+        invoice['items'] = (await load_items(session, [row['id']]))[row['id']]
+    return 200, invoice
+
+
+async def api_create_invoice(request, session, user):
+    require_api_access(user)
+    if not user.tier.unlimited:
+        used = await session.scalar(invoices_this_month_query(user.id))
+        if not within_invoice_limit(user.tier, used):
+            raise APIError(403, 'Monthly invoice limit reached')
+
+    data = request.json()
+    raw_items = data.get('items') or []
+    if not isinstance(raw_items, list) or not all(isinstance(item, dict) for item in raw_items):
+        raise APIError(400, 'items must be a list of objects')
+    items = [(item.get('description', ''), item.get('quantity', 1), item.get('rate')) for item in raw_items]
+
+    try:
+        invoice = build_invoice(user, data, items)
+    except ValueError as e:
+        raise APIError(400, str(e))
+
+    await begin_write(session)
+    match_key = client_match_key(invoice.client_name, invoice.client_email)
+    link_client(invoice, await session.scalar(client_lookup_query(user.id, match_key)))
+    session.add(invoice)
+    await session.commit()
+    logger.info(f'Invoice created via API: {invoice.invoice_number} by {user.email}')
+    return 201, invoice.to_dict(include_items=True)
+
+
+flask_app = create_app()
+api = AsyncAPI(flask_app)
+
+try:
+    from asgiref.wsgi import WsgiToAsgi
+    application = api.mount(WsgiToAsgi(flask_app))
+except ImportError:
+    application = api
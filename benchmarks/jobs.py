@@ -0,0 +1,106 @@
+# benchmarks/jobs.py - Background job queue throughput
+"""
+Enqueue a batch of jobs, then drain the queue with `flask worker --burst`
+at each concurrency and report jobs per second. The default `noop` job
+measures the queue itself (claim, run, record); `--kind invoice_pdf`
+includes PDF rendering.
+
+Examples:
+    python benchmarks/jobs.py
+    python benchmarks/jobs.py --jobs 5000 --concurrency 1 2 4 8
+    python benchmarks/jobs.py --database-url postgresql://... --json jobs.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in a child process: replaces the queue with `count` fresh jobs
+ENQUEUE = r'''
+import sys
+import app as invoicer
+from jobs import enqueue
+from models import db, Invoice, Job, begin_write
+
+kind, count = sys.argv[1], int(sys.argv[2])
+application = invoicer.create_app({'RATELIMIT_ENABLED': False})
+with application.app_context():
+    begin_write()
+    db.session.execute(db.delete(Job))
+    invoice = db.session.execute(db.select(Invoice.id, Invoice.user_id).limit(1)).first()
+    for i in range(count):
+        if kind == 'invoice_pdf':
+            enqueue(kind, {'invoice_id': invoice.id}, user_id=invoice.user_id)
+        else:
+            enqueue(kind, {'n': i})
+    db.session.commit()
+'''
+
+# Prints one JSON line: {status: count} once the workers have finished
+COUNT = r'''
+import json
+import app as invoicer
+from models import db, Job
+application = invoicer.create_app({'RATELIMIT_ENABLED': False})
+with application.app_context():
+    print(json.dumps(dict(db.session.execute(db.select(Job.status, db.func.count()).group_by(Job.status)).all())))
+'''
+
+
+def flask(env, *command, **kwargs):
+    return subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', *command],
+                          cwd=ROOT_DIR, env=env, check=True, **kwargs)
+
+
+def python(env, script, *args):
+    result = subprocess.run([sys.executable, '-c', script, *args], cwd=ROOT_DIR, env=env,
+                            check=True, capture_output=True, text=True)
+    return result.stdout
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure background job throughput')
+    parser.add_argument('--jobs', type=int, default=2000, help='Jobs per run (default: 2000)')
+    parser.add_argument('--kind', default='noop', choices=('noop', 'invoice_pdf'), help='Job kind (default: noop)')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4], help='Worker processes to try')
+    parser.add_argument('--database-url', help='Database to use (default: a temporary SQLite file)')
+    parser.add_argument('--json', dest='json_path', help='Write results as JSON')
+    args = parser.parse_args(argv)
+
+    env = dict(os.environ)
+    if args.database_url:
+        env['DATABASE_URL'] = args.database_url
+    else:
+        # SQLite serialises writers, so expect little gain beyond one worker there
+        env['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='jobs-'), 'invoices.db')
+        flask(env, 'init-db', stdout=subprocess.DEVNULL)
+        flask(env, 'seed', '--users', '1', '--invoices-per-user', '1', stdout=subprocess.DEVNULL)
+
+    results = []
+    print(f"{'Workers':<10}{'jobs':>8}{'seconds':>10}{'jobs/s':>10}{'failed':>8}")
+    for concurrency in args.concurrency:
+        python(env, ENQUEUE, args.kind, str(args.jobs))
+        start = time.perf_counter()
+        flask(env, 'worker', '--burst', '--concurrency', str(concurrency),
+              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        elapsed = time.perf_counter() - start
+        counts = json.loads(python(env, COUNT).strip().splitlines()[-1])
+        done = counts.get('succeeded', 0)
+        results.append({'concurrency': concurrency, 'jobs': done, 'seconds': round(elapsed, 3),
+                        'jobs_per_second': round(done / elapsed, 1), 'failed': counts.get('failed', 0)})
+        r = results[-1]
+        print(f"{concurrency:<10}{r['jobs']:>8}{r['seconds']:>10.2f}{r['jobs_per_second']:>10.1f}{r['failed']:>8}")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({'config': vars(args), 'results': results}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
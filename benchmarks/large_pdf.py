@@ -0,0 +1,91 @@
+# benchmarks/large_pdf.py - Rendering a long invoice, one table vs page by page
+"""
+Create an invoice with many line items and render its PDF both ways,
+reporting wall time, peak Python memory (tracemalloc) and output size:
+
+    single      every item in one in-memory Table (PDF_LARGE_INVOICE_ITEMS raised)
+    paged       generate_large_pdf(): batched item reads, page-sized tables
+
+tracemalloc slows both modes down; compare the times with --no-memory.
+
+Examples:
+    python benchmarks/large_pdf.py
+    python benchmarks/large_pdf.py --items 20000 --modes paged --json large_pdf.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import date
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+MODES = ('single', 'paged')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure PDF rendering of a long invoice')
+    parser.add_argument('--items', type=int, default=5000, help='Line items on the invoice (default: 5000)')
+    parser.add_argument('--modes', default=','.join(MODES), help='Comma-separated modes to run')
+    parser.add_argument('--no-memory', action='store_true', help='Skip tracemalloc for accurate timings')
+    parser.add_argument('--json', dest='json_path', help='Write results as JSON')
+    args = parser.parse_args(argv)
+
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='pdf-'), 'invoices.db')
+    import app as invoicer
+    from models import db, Invoice, InvoiceItem, User, begin_write
+    application = invoicer.create_app()
+    invoicer.init_db(application)
+
+    with application.app_context():
+        user = User.query.filter_by(email='business@example.com').first()
+        begin_write()
+        invoice = Invoice(user_id=user.id, invoice_number='BENCH-1', client_name='Benchmark Client',
+                          issue_date=date.today(), due_date=date.today(), currency='USD',
+                          subtotal=0, tax_rate=0, tax_amount=0, total=0)
+        db.session.add(invoice)
+        db.session.flush()
+        db.session.execute(db.insert(InvoiceItem), [
+            {'id': str(uuid.uuid4()), 'invoice_id': invoice.id, 'quantity': 1.5, 'rate': 80.0, 'amount': 120.0,
+             'description': f'Timesheet entry {i}: ' + 'development and review ' * (i % 8)}
+            for i in range(args.items)
+        ])
+        db.session.commit()
+        invoice_id = invoice.id
+
+    results = {}
+    for mode in args.modes.split(','):
+        with application.app_context():
+            if mode == 'single':
+                application.config['PDF_LARGE_INVOICE_ITEMS'] = args.items
+            else:
+                application.config['PDF_LARGE_INVOICE_ITEMS'] = 0
+            invoice = db.session.get(Invoice, invoice_id)
+            if not args.no_memory:
+                tracemalloc.start()
+            start = time.perf_counter()
+            with invoicer.generate_pdf(invoice) as pdf_file:
+                size = len(pdf_file.read())
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] if not args.no_memory else None
+            tracemalloc.stop()
+        results[mode] = {'seconds': round(elapsed, 3), 'bytes': size,
+                         'peak_mb': round(peak / 1e6, 1) if peak is not None else None}
+
+    print(f"{'Mode':<10}{'seconds':>10}{'peak MB':>10}{'PDF KB':>10}")
+    for mode, r in results.items():
+        peak = f"{r['peak_mb']:.1f}" if r['peak_mb'] is not None else '-'
+        print(f"{mode:<10}{r['seconds']:>10.2f}{peak:>10}{r['bytes'] / 1024:>10.0f}")
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({'config': vars(args), 'results': results}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
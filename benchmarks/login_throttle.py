@@ -0,0 +1,66 @@
+# benchmarks/login_throttle.py - Cost of a failed login, hashed vs throttled
+"""
+Replay a credential-stuffing burst against /login through the Flask test
+client and report the time per attempt in each phase:
+
+    hashed      attempts before the account window fills: a full password hash
+    unknown     attempts on emails without an account: the dummy hash
+    throttled   attempts after it fills: refused before any lookup or hash
+
+Examples:
+    python benchmarks/login_throttle.py
+    python benchmarks/login_throttle.py --attempts 2000 --json login_throttle.json
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure failed-login cost with the login throttle')
+    parser.add_argument('--attempts', type=int, default=500, help='Throttled attempts to time (default: 500)')
+    parser.add_argument('--json', dest='json_path', help='Write results as JSON')
+    args = parser.parse_args(argv)
+
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='login-'), 'invoices.db')
+    os.environ['RATELIMIT_ENABLED'] = 'false'
+    import app as invoicer
+    application = invoicer.create_app({'LOGIN_THROTTLE_REDIS_URL': None, 'LOGIN_IP_MAX_FAILURES': 10 ** 9})
+    invoicer.init_db(application)
+    client = application.test_client()
+    token = re.search(r'name="csrf_token" value="([^"]+)"', client.get('/login').text).group(1)
+
+    def attempt(email):
+        start = time.perf_counter()
+        client.post('/login', data={'email': email, 'password': 'not-the-password', 'csrf_token': token})
+        return (time.perf_counter() - start) * 1000
+
+    limit = application.config['LOGIN_ACCOUNT_MAX_FAILURES']
+    samples = {
+        'hashed': [attempt('admin@invoicegen.com') for _ in range(limit)],
+        'unknown': [attempt(f'nobody{i}@example.com') for i in range(limit)],
+        'throttled': [attempt('admin@invoicegen.com') for _ in range(args.attempts)],
+    }
+    results = {phase: {'attempts': len(times), 'median_ms': round(statistics.median(times), 3),
+                       'p95_ms': round(sorted(times)[int(len(times) * 0.95) - 1], 3)}
+               for phase, times in samples.items()}
+
+    print(f"{'Phase':<12}{'attempts':>10}{'median ms':>12}{'p95 ms':>10}")
+    for phase, r in results.items():
+        print(f"{phase:<12}{r['attempts']:>10}{r['median_ms']:>12.2f}{r['p95_ms']:>10.2f}")
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({'config': vars(args), 'results': results}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
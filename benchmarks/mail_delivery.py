@@ -0,0 +1,104 @@
+# benchmarks/mail_delivery.py - Pooled vs per-message SMTP delivery
+"""
+Send a batch of invoice-sized messages (a PDF attachment each) to a local
+aiosmtpd sink through mailer.deliver(), once reusing pooled connections and
+once opening a connection per message, and report messages per second.
+Needs `pip install aiosmtpd` unless --server points at a running sink.
+
+    pooled        MAIL_MAX_PER_CONNECTION from the config (default 100)
+    per-message   MAIL_MAX_PER_CONNECTION=1: connect, EHLO, send, QUIT
+
+Examples:
+    python benchmarks/mail_delivery.py
+    python benchmarks/mail_delivery.py --messages 2000 --latency 5
+    python benchmarks/mail_delivery.py --server smtp.test:2525 --json mail_delivery.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+
+class SinkHandler:
+    """Accepts everything; `latency` ms per command stands in for a remote relay"""
+
+    def __init__(self, latency):
+        self.latency = latency / 1000
+        self.received = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        await asyncio.sleep(self.latency)
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        await asyncio.sleep(self.latency)
+        self.received += 1
+        return '250 OK'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare pooled and per-message SMTP delivery')
+    parser.add_argument('--messages', type=int, default=500, help='Messages per mode (default: 500)')
+    parser.add_argument('--attachment-kb', type=int, default=40, help='Size of the attached PDF (default: 40)')
+    parser.add_argument('--latency', type=float, default=2.0, help='Sink delay per EHLO/DATA in ms (default: 2)')
+    parser.add_argument('--server', help='host:port of an existing sink instead of starting aiosmtpd')
+    parser.add_argument('--json', dest='json_path', help='Write results as JSON')
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault('DATABASE_URL', 'sqlite://')
+    import app as invoicer
+    from mailer import build_message, deliver, smtp_pool
+
+    controller = None
+    if args.server:
+        host, port = args.server.rsplit(':', 1)
+    else:
+        from aiosmtpd.controller import Controller
+        host, port = '127.0.0.1', 8025
+        controller = Controller(SinkHandler(args.latency), hostname=host, port=int(port))
+        controller.start()
+
+    pdf = os.urandom(args.attachment_kb * 1024)
+    results = []
+    try:
+        print(f"{'Mode':<14}{'messages':>10}{'seconds':>10}{'msg/s':>10}{'connects':>10}")
+        for mode, per_connection in (('pooled', None), ('per-message', 1)):
+            config = {'MAIL_SERVER': host, 'MAIL_PORT': int(port), 'MAIL_RATE_LIMIT': 0, 'RATELIMIT_ENABLED': False}
+            if per_connection:
+                config['MAIL_MAX_PER_CONNECTION'] = per_connection
+            application = invoicer.create_app(config)
+            with application.app_context():
+                messages = [
+                    build_message('Invoices <invoices@bench.example>', f'client{i}@bench.example',
+                                  f'Invoice BENCH-{i}', 'Please find your invoice attached.\n',
+                                  attachments=[(f'invoice_BENCH-{i}.pdf', 'application/pdf', pdf)])
+                    for i in range(args.messages)
+                ]
+                start = time.perf_counter()
+                sent = sum(1 for message, error in deliver(messages) if error is None)
+                elapsed = time.perf_counter() - start
+                pool = smtp_pool()
+                connects = pool.opened
+                pool.close()
+            results.append({'mode': mode, 'messages': sent, 'seconds': round(elapsed, 3),
+                            'messages_per_second': round(sent / elapsed, 1), 'connections': connects})
+            r = results[-1]
+            print(f"{mode:<14}{r['messages']:>10}{r['seconds']:>10.2f}{r['messages_per_second']:>10.1f}{r['connections']:>10}")
+    finally:
+        if controller:
+            controller.stop()
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({'config': vars(args), 'results': results}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,108 @@
+# benchmarks/read_models.py - ORM instances vs projected rows for invoice lists
+"""
+Load one account's invoice list the way the dashboard used to (full Invoice
+ORM instances) and the way it does now (InvoiceRow tuples holding only the
+listed columns), each in a fresh interpreter. Reports load time, peak
+Python allocations (tracemalloc) and the process's peak RSS.
+
+    orm        Invoice.query ... .all(): every column, identity-map tracked
+    projected  invoice_rows(invoice_list_query(...)): list columns only
+    streamed   projected rows consumed batch by batch, as the dashboard does
+
+Examples:
+    python benchmarks/read_models.py
+    python benchmarks/read_models.py --rows 100000 --runs 5 --json read_models.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ('orm', 'projected', 'streamed')
+
+# Runs in each child process; prints one JSON line with its measurements
+PROBE = r'''
+import json, resource, sys, time, tracemalloc
+import app as invoicer
+from models import db, Invoice, invoice_list_query, invoice_rows
+
+mode = sys.argv[1]
+application = invoicer.create_app({'RATELIMIT_ENABLED': False})
+with application.app_context():
+    user_id = db.session.scalar(db.select(Invoice.user_id).limit(1))
+    tracemalloc.start()
+    start = time.perf_counter()
+    if mode == 'orm':
+        rows = Invoice.query.filter_by(user_id=user_id).order_by(Invoice.created_at.desc()).all()
+        count = len(rows)
+    else:
+        query = invoice_list_query(user_id).order_by(Invoice.created_at.desc())
+        if mode == 'projected':
+            rows = list(invoice_rows(query))
+            count = len(rows)
+        else:
+            count = sum(1 for row in invoice_rows(query, batch_size=200))
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+print(json.dumps({
+    'rows': count,
+    'load_ms': elapsed * 1000,
+    'peak_mb': peak / 1024 / 1024,
+    'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}))
+'''
+
+
+def prepare_database(env, rows):
+    """One account holding `rows` invoices, generated by `flask seed`"""
+    for command in (['init-db'], ['seed', '--users', '1', '--invoices-per-user', str(rows), '--items-per-invoice', '0']):
+        subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', *command],
+                       cwd=ROOT_DIR, env=env, check=True, stdout=subprocess.DEVNULL)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare ORM and projected invoice list loading')
+    parser.add_argument('--rows', type=int, default=50000, help='Invoices on the measured account (default: 50000)')
+    parser.add_argument('--runs', type=int, default=3, help='Fresh interpreters per mode (default: 3)')
+    parser.add_argument('--database-url', help='Database to use (default: a temporary SQLite file)')
+    parser.add_argument('--json', dest='json_path', help='Write raw samples and summary as JSON')
+    args = parser.parse_args(argv)
+
+    env = dict(os.environ)
+    if args.database_url:
+        env['DATABASE_URL'] = args.database_url
+    else:
+        env['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='read-models-'), 'invoices.db')
+        prepare_database(env, args.rows)
+
+    samples, summary = {}, {}
+    print(f"{'Mode':<12}{'rows':>8}{'load ms':>10}{'peak MB':>10}{'RSS MB':>10}")
+    for mode in MODES:
+        samples[mode] = []
+        for _ in range(args.runs):
+            result = subprocess.run([sys.executable, '-c', PROBE, mode], cwd=ROOT_DIR, env=env,
+                                    capture_output=True, text=True)
+            if result.returncode != 0:
+                print(result.stderr, file=sys.stderr)
+                return 1
+            samples[mode].append(json.loads(result.stdout.strip().splitlines()[-1]))
+        summary[mode] = {
+            metric: round(statistics.median(s[metric] for s in samples[mode]), 2)
+            for metric in ('rows', 'load_ms', 'peak_mb', 'max_rss_mb')
+        }
+        s = summary[mode]
+        print(f"{mode:<12}{s['rows']:>8.0f}{s['load_ms']:>10.1f}{s['peak_mb']:>10.1f}{s['max_rss_mb']:>10.1f}")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({'config': vars(args), 'summary': summary, 'samples': samples}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,149 @@
+# benchmarks/sqlite_concurrency.py - SQLite read/write contention for the Invoice Generator
+"""
+Run writer and reader processes against one SQLite file, the way gunicorn
+workers share the default database, once per SQLite profile. Writers create
+invoices through begin_write()/build_invoice(); readers run the dashboard's
+usage and recent-invoice queries. Reports read latency while writes are in
+flight and how many operations failed with "database is locked".
+
+    default     driver defaults: rollback journal, deferred transactions
+    production  WAL, synchronous=NORMAL, busy timeout, BEGIN IMMEDIATE writes
+
+Examples:
+    python benchmarks/sqlite_concurrency.py
+    python benchmarks/sqlite_concurrency.py --writers 4 --readers 8 --duration 20
+    python benchmarks/sqlite_concurrency.py --profiles production --json sqlite.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROFILES = ('default', 'production')
+
+# Runs in each child process; prints one JSON line with its samples
+WORKER = r'''
+import json, sys, time
+from datetime import date
+from sqlalchemy.exc import OperationalError
+import app as invoicer
+from models import db, User, Invoice, begin_write, build_invoice, invoices_this_month_query
+
+role, duration, items_per_invoice, hold = sys.argv[1], float(sys.argv[2]), int(sys.argv[3]), float(sys.argv[4])
+application = invoicer.create_app({'RATELIMIT_ENABLED': False})
+latencies, errors, counter = [], 0, 0
+with application.app_context():
+    user_id = User.query.filter_by(email='pro@example.com').first().id
+    db.session.rollback()
+    deadline = time.time() + duration
+    while time.time() < deadline:
+        start = time.perf_counter()
+        try:
+            if role == 'writer':
+                counter += 1
+                begin_write()
+                user = db.session.get(User, user_id)
+                data = {'invoice_number': f'BENCH-{id(latencies)}-{counter}', 'client_name': 'Bench Client',
+                        'issue_date': date.today().isoformat(), 'due_date': date.today().isoformat()}
+                items = [(f'Item {i}', 1, 10) for i in range(items_per_invoice)]
+                db.session.add(build_invoice(user, data, items))
+                db.session.flush()
+                time.sleep(hold)  # request work done while the transaction is open
+                db.session.commit()
+            else:
+                db.session.scalar(invoices_this_month_query(user_id))
+                Invoice.query.filter_by(user_id=user_id).order_by(Invoice.created_at.desc()).limit(20).all()
+                db.session.rollback()
+            latencies.append((time.perf_counter() - start) * 1000)
+        except OperationalError:
+            db.session.rollback()
+            errors += 1
+print(json.dumps({'role': role, 'latencies': latencies, 'errors': errors}))
+'''
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def prepare_database(env):
+    for command in ('init-db', 'seed-demo'):
+        subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', command],
+                       cwd=ROOT_DIR, env=env, check=True, stdout=subprocess.DEVNULL)
+
+
+def run_profile(profile, args):
+    env = dict(os.environ)
+    env['SQLITE_PROFILE'] = profile
+    env['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix=f'sqlite-{profile}-'), 'invoices.db')
+    prepare_database(env)
+
+    roles = ['writer'] * args.writers + ['reader'] * args.readers
+    workers = [
+        subprocess.Popen([sys.executable, '-c', WORKER, role, str(args.duration),
+                          str(args.items_per_invoice), str(args.hold_ms / 1000)],
+                         cwd=ROOT_DIR, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        for role in roles
+    ]
+
+    results = {'writer': {'latencies': [], 'errors': 0}, 'reader': {'latencies': [], 'errors': 0}}
+    for worker in workers:
+        stdout, stderr = worker.communicate()
+        if worker.returncode != 0:
+            raise RuntimeError(f'{profile} worker failed:\n{stderr}')
+        sample = json.loads(stdout.strip().splitlines()[-1])
+        results[sample['role']]['latencies'].extend(sample['latencies'])
+        results[sample['role']]['errors'] += sample['errors']
+
+    summary = {}
+    for role, data in results.items():
+        values = data['latencies']
+        summary[role] = {
+            'ops_per_sec': round(len(values) / args.duration, 1),
+            'errors': data['errors'],
+            'p50_ms': round(percentile(values, 50), 2),
+            'p95_ms': round(percentile(values, 95), 2),
+            'p99_ms': round(percentile(values, 99), 2),
+            'max_ms': round(max(values), 2) if values else 0.0,
+            'mean_ms': round(statistics.fmean(values), 2) if values else 0.0
+        }
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure SQLite read/write contention per profile')
+    parser.add_argument('--writers', type=int, default=2, help='Writer processes (default: 2)')
+    parser.add_argument('--readers', type=int, default=4, help='Reader processes (default: 4)')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds per profile (default: 10)')
+    parser.add_argument('--items-per-invoice', type=int, default=20, help='Line items per written invoice (default: 20)')
+    parser.add_argument('--hold-ms', type=float, default=5, help='Time a write transaction stays open (default: 5)')
+    parser.add_argument('--profiles', default=','.join(PROFILES), help='Comma-separated profiles to run')
+    parser.add_argument('--json', dest='json_path', help='Write the summary as JSON')
+    args = parser.parse_args(argv)
+
+    report = {}
+    print(f"{'Profile':<12}{'Role':<8}{'ops/s':>9}{'errors':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    for profile in args.profiles.split(','):
+        if profile not in PROFILES:
+            parser.error(f'Unknown profile: {profile}')
+        report[profile] = run_profile(profile, args)
+        for role in ('reader', 'writer'):
+            s = report[profile][role]
+            print(f"{profile:<12}{role:<8}{s['ops_per_sec']:>9.1f}{s['errors']:>8}"
+                  f"{s['p50_ms']:>9.1f}{s['p95_ms']:>9.1f}{s['p99_ms']:>9.1f}{s['max_ms']:>9.1f}")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({'config': vars(args), 'profiles': report}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
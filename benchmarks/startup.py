@@ -0,0 +1,126 @@
+# benchmarks/startup.py - Cold start timings for the Invoice Generator
+"""
+Measure what a freshly spawned worker pays before it can serve traffic:
+importing the app, building it with create_app(), the schema check and the
+first requests. Every sample runs in a new interpreter so nothing is cached.
+
+Examples:
+    python benchmarks/startup.py
+    python benchmarks/startup.py --runs 20 --json startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs inside each child interpreter and prints one JSON line of timings (ms)
+PROBE = r'''
+import json, sys, time
+t0 = time.perf_counter()
+import app as invoicer
+t1 = time.perf_counter()
+application = invoicer.create_app({'RATELIMIT_ENABLED': False, 'WTF_CSRF_ENABLED': False})
+t2 = time.perf_counter()
+invoicer.verify_schema(application)
+t3 = time.perf_counter()
+client = application.test_client()
+client.get('/login')
+t4 = time.perf_counter()
+client.get('/login')
+t5 = time.perf_counter()
+reportlab_at_boot = 'reportlab' in sys.modules
+client.post('/login', data={'email': 'pro@example.com', 'password': 'professional123'})
+with application.app_context():
+    invoice = invoicer.Invoice.query.first()
+pdf_ms = None
+if invoice is not None and invoicer.PDF_AVAILABLE:
+    t6 = time.perf_counter()
+    client.get(f'/invoice/{invoice.id}/pdf')
+    pdf_ms = (time.perf_counter() - t6) * 1000
+print(json.dumps({
+    'import_ms': (t1 - t0) * 1000,
+    'create_app_ms': (t2 - t1) * 1000,
+    'schema_check_ms': (t3 - t2) * 1000,
+    'first_request_ms': (t4 - t3) * 1000,
+    'second_request_ms': (t5 - t4) * 1000,
+    'ready_ms': (t4 - t0) * 1000,
+    'first_pdf_ms': pdf_ms,
+    'reportlab_loaded_at_boot': reportlab_at_boot,
+}))
+'''
+
+METRICS = ['import_ms', 'create_app_ms', 'schema_check_ms', 'first_request_ms',
+           'second_request_ms', 'ready_ms', 'first_pdf_ms']
+
+
+def prepare_database(env):
+    """Create the schema, the demo users and one invoice to render as PDF"""
+    for command in ('init-db', 'seed-demo'):
+        subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', command],
+                       cwd=ROOT_DIR, env=env, check=True, stdout=subprocess.DEVNULL)
+    subprocess.run([sys.executable, '-c', (
+        'from datetime import date\n'
+        'from app import create_app\n'
+        'from models import db, User, Invoice, InvoiceItem\n'
+        'app = create_app()\n'
+        'with app.app_context():\n'
+        '    pro = User.query.filter_by(email="pro@example.com").first()\n'
+        '    invoice = Invoice(user_id=pro.id, invoice_number="BENCH-1", client_name="Bench Client",\n'
+        '                      issue_date=date.today(), due_date=date.today(), subtotal=100, total=100)\n'
+        '    invoice.items = [InvoiceItem(description=f"Item {i}", quantity=1, rate=10, amount=10) for i in range(10)]\n'
+        '    db.session.add(invoice)\n'
+        '    db.session.commit()\n'
+    )], cwd=ROOT_DIR, env=env, check=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure Invoice Generator cold start')
+    parser.add_argument('--runs', type=int, default=10, help='Fresh interpreters to sample (default: 10)')
+    parser.add_argument('--database-url', help='Database to use (default: a temporary SQLite file)')
+    parser.add_argument('--json', dest='json_path', help='Write raw samples and summary as JSON')
+    args = parser.parse_args(argv)
+
+    env = dict(os.environ)
+    if args.database_url:
+        env['DATABASE_URL'] = args.database_url
+    else:
+        env['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='startup-'), 'invoices.db')
+        prepare_database(env)
+
+    samples = []
+    for _ in range(args.runs):
+        result = subprocess.run([sys.executable, '-c', PROBE], cwd=ROOT_DIR, env=env,
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            print(result.stderr, file=sys.stderr)
+            return 1
+        samples.append(json.loads(result.stdout.strip().splitlines()[-1]))
+
+    summary = {}
+    print(f"{'Phase':<20}{'median':>10}{'min':>10}{'max':>10}")
+    for metric in METRICS:
+        values = [s[metric] for s in samples if s[metric] is not None]
+        if not values:
+            continue
+        summary[metric] = {
+            'median': round(statistics.median(values), 2),
+            'min': round(min(values), 2),
+            'max': round(max(values), 2),
+        }
+        print(f"{metric:<20}{summary[metric]['median']:>10.1f}{summary[metric]['min']:>10.1f}{summary[metric]['max']:>10.1f}")
+    summary['reportlab_loaded_at_boot'] = any(s['reportlab_loaded_at_boot'] for s in samples)
+    print(f"ReportLab imported before first PDF: {'yes' if summary['reportlab_loaded_at_boot'] else 'no'}")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({'runs': args.runs, 'summary': summary, 'samples': samples}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
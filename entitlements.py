@@ -0,0 +1,243 @@
+# entitlements.py - Membership tiers and what they unlock
+"""
+Tier definitions (price, monthly invoice limit, the feature list shown on
+the pricing pages and the features the tier unlocks) are compiled once into
+immutable Tier tuples. The unlocked features become a bitset, so
+Tier.has('analytics') is one dict lookup and an AND however many times a
+page asks.
+
+DEFAULT_TIERS are used unless TIERS_FILE names a JSON file of the same
+shape:
+
+    {"default": "free",
+     "tiers": {"free": {"name": "Free", "price": 0, "invoice_limit": 5,
+                        "features": ["Up to 5 invoices per month"],
+                        "entitlements": [], "color": "gray"},
+               ...}}
+
+`entitlements` must name FEATURES; the code decides what each one gates.
+Accounts on a tier the file no longer defines get the default tier.
+
+The file is checked for changes at most every TIERS_RELOAD_INTERVAL
+seconds. A changed file is compiled in full and swapped in with one
+assignment, so a request sees either the old tiers or the new ones; a file
+that fails to load is logged and the running tiers are kept.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+from types import MappingProxyType
+
+logger = logging.getLogger(__name__)
+
+# Features the code gates on, one bit each
+FEATURES = (
+    'advanced_templates', 'currency_conversion', 'analytics', 'advanced_analytics',
+    'email_integration', 'api_access', 'custom_branding', 'priority_support'
+)
+FEATURE_BITS = {feature: 1 << bit for bit, feature in enumerate(FEATURES)}
+
+DEFAULT_TIERS = {
+    'default': 'free',
+    'tiers': {
+        'free': {
+            'name': 'Free',
+            'price': 0,
+            'invoice_limit': 5,
+            'features': [
+                'Up to 5 invoices per month',
+                'Basic templates',
+                'PDF export',
+                'Basic currency support'
+            ],
+            'entitlements': [],
+            'color': 'gray',
+            'popular': False
+        },
+        'starter': {
+            'name': 'Starter',
+            'price': 9,
+            'invoice_limit': 25,
+            'features': [
+                'Up to 25 invoices per month',
+                'All templates',
+                'Advanced PDF export',
+                'Multi-currency support',
+                'Email integration',
+                'Basic analytics'
+            ],
+            'entitlements': ['analytics', 'email_integration'],
+            'color': 'blue',
+            'popular': False
+        },
+        'professional': {
+            'name': 'Professional',
+            'price': 19,
+            'invoice_limit': 100,
+            'features': [
+                'Up to 100 invoices per month',
+                'Premium templates',
+                'Advanced customization',
+                'Full currency conversion',
+                'Advanced analytics',
+                'Priority support',
+                'Custom branding'
+            ],
+            'entitlements': ['advanced_templates', 'currency_conversion', 'analytics', 'advanced_analytics',
+                             'email_integration', 'custom_branding', 'priority_support'],
+            'color': 'purple',
+            'popular': True
+        },
+        'business': {
+            'name': 'Business',
+            'price': 39,
+            'invoice_limit': -1,  # Unlimited
+            'features': [
+                'Unlimited invoices',
+                'All premium features',
+                'API access',
+                'Team collaboration',
+                'Advanced integrations',
+                'Custom workflows',
+                'White-label solution',
+                'Dedicated support'
+            ],
+            'entitlements': list(FEATURES),
+            'color': 'green',
+            'popular': False
+        }
+    }
+}
+
+
+class Tier(namedtuple('Tier', ['key', 'name', 'price', 'invoice_limit', 'features', 'color', 'popular', 'mask'])):
+    """One compiled membership tier"""
+    __slots__ = ()
+
+    def has(self, feature):
+        """Whether this tier unlocks `feature`; unknown features are never unlocked"""
+        return bool(self.mask & FEATURE_BITS.get(feature, 0))
+
+    @property
+    def unlimited(self):
+        return self.invoice_limit == -1
+
+    @property
+    def entitlements(self):
+        return tuple(feature for feature in FEATURES if self.mask & FEATURE_BITS[feature])
+
+
+class Entitlements:
+    """A compiled, read-only set of tiers"""
+
+    def __init__(self, tiers, default):
+        self.tiers = MappingProxyType(tiers)
+        self.default = tiers[default]
+
+    def tier(self, key):
+        return self.tiers.get(key, self.default)
+
+    def has(self, key, feature):
+        return self.tier(key).has(feature)
+
+
+def compile_tier(key, spec):
+    mask = 0
+    for feature in spec.get('entitlements', ()):
+        if feature not in FEATURE_BITS:
+            raise ValueError(f'Tier {key} grants unknown feature {feature!r}')
+        mask |= FEATURE_BITS[feature]
+    invoice_limit = int(spec.get('invoice_limit', -1))
+    if invoice_limit < -1:
+        raise ValueError(f'Tier {key} has an invalid invoice_limit')
+    return Tier(
+        key=key,
+        name=str(spec.get('name', key.title())),
+        price=spec.get('price', 0),
+        invoice_limit=invoice_limit,
+        features=tuple(spec.get('features', ())),
+        color=spec.get('color', 'gray'),
+        popular=bool(spec.get('popular', False)),
+        mask=mask
+    )
+
+
+def compile_tiers(definition):
+    """Compile a tier definition; raises ValueError if any part of it is unusable"""
+    try:
+        specs = definition['tiers']
+        if not specs:
+            raise ValueError('No tiers defined')
+        tiers = {key: compile_tier(key, spec) for key, spec in specs.items()}
+        default = definition.get('default', 'free')
+    except (AttributeError, KeyError, TypeError) as e:
+        raise ValueError(f'Malformed tier definition: {e!r}')
+    if default not in tiers:
+        raise ValueError(f'Default tier {default!r} is not defined')
+    return Entitlements(tiers, default)
+
+
+def load_tiers(path):
+    with open(path) as f:
+        return compile_tiers(json.load(f))
+
+
+class EntitlementStore:
+    """The running tiers, reloaded from `path` when the file changes"""
+
+    def __init__(self, path=None, interval=5):
+        self.path = path
+        self.interval = interval
+        self.mtime = None
+        self.next_check = 0.0
+        self._lock = threading.Lock()
+        # A bad file at startup should stop the deploy, not fall back silently
+        if path:
+            self.mtime = os.path.getmtime(path)
+            self.current = load_tiers(path)
+        else:
+            self.current = compile_tiers(DEFAULT_TIERS)
+
+    def get(self):
+        if self.path and time.monotonic() >= self.next_check:
+            self.check()
+        return self.current
+
+    def check(self):
+        """Reload the file if it changed; returns True when new tiers were swapped in"""
+        # One thread checks; the rest carry on with the current tiers
+        if not self._lock.acquire(blocking=False):
+            return False
+        try:
+            self.next_check = time.monotonic() + self.interval
+            try:
+                mtime = os.path.getmtime(self.path)
+                if mtime == self.mtime:
+                    return False
+                current = load_tiers(self.path)
+            except (OSError, ValueError) as e:
+                logger.error(f'Tier reload error, keeping the current tiers: {str(e)}')
+                return False
+            self.current, self.mtime = current, mtime
+            logger.info(f'Reloaded {len(current.tiers)} membership tiers from {self.path}')
+            return True
+        finally:
+            self._lock.release()
+
+
+_store = EntitlementStore()
+
+
+def configure_entitlements(path=None, interval=5):
+    """Serve tiers from `path` (or the defaults) in this process"""
+    global _store
+    _store = EntitlementStore(path, interval)
+    return _store
+
+
+def entitlements():
+    """The tiers currently in force"""
+    return _store.get()
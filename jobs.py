@@ -0,0 +1,215 @@
+# jobs.py - Background jobs for the Invoice Generator
+"""
+Database-backed job queue. Requests enqueue() work in their own transaction
+and return at once; `flask worker` processes claim due jobs, run the
+handler registered for the job's kind and store what it returns on the job
+row, where the /jobs endpoints read it.
+
+A failing job is retried with exponential backoff until it has used
+max_attempts, and a job whose worker died mid-run is queued again once it
+has been running for JOB_TIMEOUT seconds.
+
+    flask --app app worker                  # one worker process
+    flask --app app worker --concurrency 4  # four, supervised by this one
+    flask --app app worker --burst          # exit once the queue is empty
+"""
+import json
+import os
+import random
+import socket
+import time
+import traceback
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from models import db, Job, begin_write
+
+JOB_STATUSES = ('queued', 'running', 'succeeded', 'failed')
+JOB_HANDLERS = {}
+
+
+class JobResult:
+    """Handler return value that carries a file (a PDF, an export) besides JSON info"""
+
+    def __init__(self, data, content_type, filename, info=None):
+        self.data = data
+        self.content_type = content_type
+        self.filename = filename
+        self.info = info
+
+
+def job_handler(kind):
+    """Register `f(payload, job)` as the handler for jobs of `kind`"""
+    def decorator(f):
+        JOB_HANDLERS[kind] = f
+        return f
+    return decorator
+
+
+@job_handler('noop')
+def noop_job(payload, job):
+    """Does nothing; used to measure the queue itself"""
+    return payload
+
+
+def enqueue(kind, payload=None, user_id=None, delay=0, max_attempts=None):
+    """Add a job to the session; it is queued when the caller commits"""
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f'Unknown job kind: {kind}')
+    job = Job(
+        kind=kind,
+        user_id=user_id,
+        payload=json.dumps(payload),
+        max_attempts=max_attempts or current_app.config['JOB_MAX_ATTEMPTS'],
+        run_at=datetime.utcnow() + timedelta(seconds=delay)
+    )
+    db.session.add(job)
+    return job
+
+
+def retry_delay(attempts, base=None, cap=None):
+    """Seconds to wait before attempt `attempts + 1`: exponential, capped, jittered.
+
+    base and cap default to JOB_BACKOFF_BASE and JOB_BACKOFF_MAX.
+    """
+    config = current_app.config
+    base = config['JOB_BACKOFF_BASE'] if base is None else base
+    cap = config['JOB_BACKOFF_MAX'] if cap is None else cap
+    delay = min(cap, base * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def claim_job(worker_id):
+    """Lock the oldest due job for this worker. Returns it, or None if none is due."""
+    now = datetime.utcnow()
+    begin_write()
+    job = db.session.scalar(
+        db.select(Job)
+        .where(Job.status == 'queued', Job.run_at <= now)
+        .order_by(Job.run_at)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    )
+    if job is not None:
+        job.status = 'running'
+        job.attempts += 1
+        job.locked_by = worker_id
+        job.locked_at = job.started_at = now
+    db.session.commit()
+    return job
+
+
+def finish_job(job_id, outcome=None, error=None):
+    """Record a run's outcome: the result, a retry or the final failure"""
+    now = datetime.utcnow()
+    begin_write()
+    job = db.session.get(Job, job_id)
+    job.locked_by = job.locked_at = None
+    if error is None:
+        job.status = 'succeeded'
+        job.finished_at = now
+        if isinstance(outcome, JobResult):
+            job.result_data = outcome.data
+            job.result_type = outcome.content_type
+            job.result_name = outcome.filename
+            outcome = outcome.info
+        job.result = json.dumps(outcome) if outcome is not None else None
+    elif job.attempts < job.max_attempts:
+        job.status = 'queued'
+        job.run_at = now + timedelta(seconds=retry_delay(job.attempts))
+        job.last_error = error
+    else:
+        job.status = 'failed'
+        job.finished_at = now
+        job.last_error = error
+    db.session.commit()
+    return job
+
+
+def run_job(job):
+    """Run a claimed job's handler and record the outcome"""
+    job_id, kind = job.id, job.kind
+    started = time.perf_counter()
+    try:
+        handler = JOB_HANDLERS.get(kind)
+        if handler is None:
+            raise LookupError(f'No handler for job kind {kind}')
+        outcome = handler(json.loads(job.payload or 'null'), job)
+    except Exception as e:
+        db.session.rollback()
+        job = finish_job(job_id, error=traceback.format_exc()[-4000:])
+        current_app.logger.warning(f'Job {job_id} ({kind}) failed on attempt {job.attempts}: {str(e)}')
+        return job
+    job = finish_job(job_id, outcome)
+    current_app.logger.info(f'Job {job_id} ({kind}) done in {time.perf_counter() - started:.2f}s')
+    return job
+
+
+def recover_stale_jobs():
+    """Requeue jobs whose worker has held them past JOB_TIMEOUT; returns how many"""
+    config = current_app.config
+    now = datetime.utcnow()
+    stale = db.and_(Job.status == 'running', Job.locked_at < now - timedelta(seconds=config['JOB_TIMEOUT']))
+    begin_write()
+    failed = db.session.execute(
+        db.update(Job).where(stale, Job.attempts >= Job.max_attempts)
+        .values(status='failed', finished_at=now, locked_by=None, locked_at=None,
+                last_error='Worker timed out')
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    requeued = db.session.execute(
+        db.update(Job).where(stale)
+        .values(status='queued', run_at=now, locked_by=None, locked_at=None, last_error='Worker timed out')
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    # Finished jobs, and the files they hold, are kept for JOB_RETENTION_DAYS
+    db.session.execute(
+        db.delete(Job)
+        .where(Job.status.in_(('succeeded', 'failed')),
+               Job.finished_at < now - timedelta(days=config['JOB_RETENTION_DAYS']))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return failed + requeued
+
+
+def work(burst=False, max_jobs=None, should_stop=lambda: False):
+    """Claim and run jobs until stopped. Returns the number of jobs run.
+
+    With `burst` the worker returns as soon as no job is due instead of
+    polling every JOB_POLL_INTERVAL seconds.
+    """
+    config = current_app.config
+    worker_id = f'{socket.gethostname()}:{os.getpid()}'
+    processed, last_recovery = 0, 0.0
+    while not should_stop() and (max_jobs is None or processed < max_jobs):
+        if time.monotonic() - last_recovery > config['JOB_TIMEOUT'] / 4:
+            recover_stale_jobs()
+            last_recovery = time.monotonic()
+        job = claim_job(worker_id)
+        if job is None:
+            if burst:
+                break
+            db.session.remove()
+            time.sleep(config['JOB_POLL_INTERVAL'])
+            continue
+        run_job(job)
+        db.session.expunge_all()
+        processed += 1
+    return processed
+
+
+def job_counts():
+    """{(kind, status): count} over the whole queue"""
+    rows = db.session.execute(db.select(Job.kind, Job.status, db.func.count()).group_by(Job.kind, Job.status))
+    return {(kind, status): count for kind, status, count in rows}
+
+
+def oldest_queued_age():
+    """Seconds the longest-waiting due job has been waiting, 0 when none is due"""
+    now = datetime.utcnow()
+    oldest = db.session.scalar(
+        db.select(db.func.min(Job.run_at)).where(Job.status == 'queued', Job.run_at <= now)
+    )
+    return (now - oldest).total_seconds() if oldest else 0.0
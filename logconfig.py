@@ -0,0 +1,208 @@
+# logconfig.py - Logging pipeline for the Invoice Generator
+"""
+Logging calls never wait on a disk or a pipe. Records go to a QueueHandler
+that only puts them on a bounded in-memory queue; a QueueListener thread in
+each process formats them and writes them to stderr and, when LOG_DIR is
+set, to a size-rotated LOG_FILE in that directory. If the writer stalls and
+the queue fills up, records are dropped and counted rather than blocking
+the request; /metrics reports the count.
+
+Records are written one JSON object per line (LOG_FORMAT=text gives plain
+lines):
+
+    {"ts": "2024-05-01T12:00:00.123Z", "level": "INFO", "logger": "invoicer.access",
+     "message": "GET /dashboard 200", "route": "/dashboard", "user_id": "...",
+     "status": 200, "latency_ms": 12.4, "sql_count": 3}
+
+Records logged while handling a request carry its route and user id, and
+fields passed with extra= are written as they are. Each request writes one
+access record with its latency and SQL statement count. Access records are
+sampled at LOG_ACCESS_SAMPLE_RATE; server errors and requests slower than
+LOG_SLOW_REQUEST_MS are always kept.
+"""
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from flask import g, has_request_context, request
+
+ACCESS_LOGGER = 'invoicer.access'
+TEXT_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+STOP_TIMEOUT = 5  # seconds to let queued records drain at shutdown
+
+# Attributes every LogRecord has; anything else came in through extra=
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with any extra= fields alongside the message"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        for key, value in record.__dict__.items():
+            if key not in RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class RequestContextFilter(logging.Filter):
+    """Tag records logged during a request with its route and user id"""
+
+    def filter(self, record):
+        if has_request_context():
+            if not hasattr(record, 'route'):
+                record.route = request.url_rule.rule if request.url_rule else None
+            if not hasattr(record, 'user_id'):
+                # Flask-Login's cached user; reading the session would mark every response Vary: Cookie
+                record.user_id = getattr(g.get('_login_user'), 'id', None)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Pass `rate` of INFO and lower records; warnings and extra={'keep': True} records always pass"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.__dict__.pop('keep', False) or record.levelno > logging.INFO:
+            return True
+        return self.rate >= 1 or random.random() < self.rate
+
+
+class DrainingQueueListener(QueueListener):
+    """QueueListener whose stop() waits for room in a full queue instead of failing"""
+
+    def stop(self):
+        if self._thread is None:
+            return
+        try:
+            self.queue.put(self._sentinel, timeout=STOP_TIMEOUT)
+        except queue.Full:
+            return  # the writer is stuck; don't hang the exit on its daemon thread
+        self._thread.join(STOP_TIMEOUT)
+        self._thread = None
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Hands records to a listener thread; drops them instead of waiting when the queue is full"""
+
+    def __init__(self, handlers, maxsize):
+        super().__init__(queue.Queue(maxsize))
+        self.handlers = handlers
+        self.maxsize = maxsize
+        self.dropped = 0
+        self.listener = None
+        self.pid = None
+        self.start()
+
+    def start(self):
+        self.queue = queue.Queue(self.maxsize)
+        self.listener = DrainingQueueListener(self.queue, *self.handlers, respect_handler_level=True)
+        self.listener.start()
+        self.pid = os.getpid()
+
+    def stop(self):
+        """Write out what is queued and stop the listener"""
+        if self.listener is not None and self.pid == os.getpid():
+            self.listener.stop()
+        self.listener = None
+
+    def prepare(self, record):
+        # Resolve the message and traceback now, while the arguments are
+        # still current, but leave formatting to the listener thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        # A forked worker (gunicorn --preload, flask worker) inherits the handler but not the thread
+        if self.pid != os.getpid():
+            self.start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class SharedRotatingFileHandler(RotatingFileHandler):
+    """RotatingFileHandler for a file several processes write to.
+
+    A process that finds the file was rotated by another one reopens it
+    instead of rotating it again.
+    """
+
+    def shouldRollover(self, record):
+        if self.stream is not None:
+            try:
+                rotated = os.stat(self.baseFilename).st_ino != os.fstat(self.stream.fileno()).st_ino
+            except FileNotFoundError:
+                rotated = True
+            if rotated:
+                self.stream.close()
+                self.stream = self._open()
+        return super().shouldRollover(record)
+
+
+_handler = None
+
+
+def configure_logging(config):
+    """Send all logging through the queue pipeline; returns the queue handler"""
+    global _handler
+    formatter = JsonFormatter() if config['LOG_FORMAT'] == 'json' else logging.Formatter(TEXT_FORMAT)
+    console = logging.StreamHandler()
+    console.setFormatter(formatter)
+    handlers = [console]
+    if config['LOG_DIR']:
+        os.makedirs(config['LOG_DIR'], exist_ok=True)
+        log_file = SharedRotatingFileHandler(
+            os.path.join(config['LOG_DIR'], config['LOG_FILE']),
+            maxBytes=config['LOG_MAX_BYTES'], backupCount=config['LOG_BACKUP_COUNT'],
+            encoding='utf-8', delay=True
+        )
+        log_file.setFormatter(formatter)
+        handlers.append(log_file)
+
+    handler = NonBlockingQueueHandler(handlers, config['LOG_QUEUE_SIZE'])
+    handler.addFilter(RequestContextFilter())
+    root = logging.getLogger()
+    if _handler is not None:
+        root.removeHandler(_handler)
+        _handler.stop()
+    root.addHandler(handler)
+    root.setLevel(config['LOG_LEVEL'])
+    logging.getLogger(ACCESS_LOGGER).filters = [SamplingFilter(config['LOG_ACCESS_SAMPLE_RATE'])]
+    _handler = handler
+    return handler
+
+
+def dropped_records():
+    """Records dropped by this process because the log writer fell behind"""
+    return _handler.dropped if _handler is not None else 0
+
+
+@atexit.register
+def stop_logging():
+    if _handler is not None:
+        _handler.stop()
@@ -0,0 +1,223 @@
+# mailer.py - Outgoing email for the Invoice Generator
+"""
+SMTP delivery over pooled, persistent connections. Each process keeps up
+to MAIL_POOL_SIZE connections to MAIL_SERVER open and reuses them across
+messages, so a batch of invoices pays for one connect, TLS handshake and
+login instead of one per message. A connection is replaced after
+MAIL_MAX_PER_CONNECTION messages, when it fails a NOOP after idling for
+MAIL_IDLE_TIMEOUT seconds, or when the server drops it.
+
+deliver() sends at most MAIL_RATE_LIMIT messages per second and process,
+so bulk sends stay inside the relay's quota.
+
+To try it locally, run an SMTP sink and point MAIL_SERVER/MAIL_PORT at it:
+
+    python -m aiosmtpd -n -l localhost:8025
+"""
+import atexit
+import os
+import smtplib
+import ssl
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from email.message import EmailMessage
+from email.utils import make_msgid, parseaddr
+
+from flask import current_app
+
+# Failures that affect the connection rather than a single message
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError, TimeoutError)
+
+
+class SMTPConnection:
+    """An open SMTP session and how much it has been used"""
+
+    def __init__(self, smtp):
+        self.smtp = smtp
+        self.sent = 0
+        self.last_used = time.monotonic()
+
+    def send(self, message):
+        self.smtp.send_message(message)
+        self.sent += 1
+        self.last_used = time.monotonic()
+
+    def alive(self):
+        try:
+            return self.smtp.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def close(self):
+        try:
+            self.smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            self.smtp.close()
+
+
+class SMTPPool:
+    """Persistent connections to one SMTP server, shared by a process's threads"""
+
+    def __init__(self, host, port, username=None, password=None, use_tls=False, use_ssl=False,
+                 timeout=30, size=2, max_messages=100, idle_timeout=60):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.use_ssl = use_ssl
+        self.timeout = timeout
+        self.max_messages = max_messages
+        self.idle_timeout = idle_timeout
+        self.pid = os.getpid()
+        self.opened = 0
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _connect(self):
+        if self.use_ssl:
+            smtp = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout,
+                                    context=ssl.create_default_context())
+        else:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            if self.use_tls:
+                smtp.starttls(context=ssl.create_default_context())
+        if self.username:
+            smtp.login(self.username, self.password)
+        self.opened += 1
+        return SMTPConnection(smtp)
+
+    def _checkout(self):
+        while True:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                return self._connect()
+            # Servers close idle sessions; check before trusting an old one
+            if time.monotonic() - conn.last_used < self.idle_timeout or conn.alive():
+                return conn
+            conn.close()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection; it is dropped if the block raises, else returned"""
+        self._slots.acquire()
+        try:
+            conn = self._checkout()
+        except BaseException:
+            self._slots.release()
+            raise
+        try:
+            yield conn
+        except BaseException:
+            conn.close()
+            raise
+        else:
+            if conn.sent >= self.max_messages:
+                conn.close()
+            else:
+                with self._lock:
+                    self._idle.append(conn)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for conn in idle:
+            conn.close()
+
+
+def smtp_pool(app=None):
+    """The current process's pool for the app's mail settings"""
+    app = app or current_app._get_current_object()
+    pool = app.extensions.get('smtp_pool')
+    # A forked worker must not share its parent's sockets
+    if pool is None or pool.pid != os.getpid():
+        config = app.config
+        pool = SMTPPool(
+            config['MAIL_SERVER'], config['MAIL_PORT'],
+            username=config['MAIL_USERNAME'], password=config['MAIL_PASSWORD'],
+            use_tls=config['MAIL_USE_TLS'], use_ssl=config['MAIL_USE_SSL'],
+            timeout=config['MAIL_TIMEOUT'], size=config['MAIL_POOL_SIZE'],
+            max_messages=config['MAIL_MAX_PER_CONNECTION'], idle_timeout=config['MAIL_IDLE_TIMEOUT']
+        )
+        app.extensions['smtp_pool'] = pool
+        atexit.register(pool.close)
+    return pool
+
+
+class Throttle:
+    """Spaces calls to wait() out to at most `rate` per second; no limit when falsy"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.next_at = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        if self.next_at > now:
+            time.sleep(self.next_at - now)
+            now = self.next_at
+        self.next_at = now + self.interval
+
+
+def build_message(sender, recipient, subject, body, reply_to=None, attachments=()):
+    """A plain-text message; attachments are (filename, content_type, bytes)"""
+    message = EmailMessage()
+    message['From'] = sender
+    message['To'] = recipient
+    message['Subject'] = subject
+    if reply_to:
+        message['Reply-To'] = reply_to
+    domain = parseaddr(sender)[1].rpartition('@')[2] or None
+    message['Message-ID'] = make_msgid(domain=domain)
+    message.set_content(body)
+    for filename, content_type, data in attachments:
+        maintype, subtype = content_type.split('/', 1)
+        message.add_attachment(data, maintype=maintype, subtype=subtype, filename=filename)
+    return message
+
+
+def deliver(messages):
+    """Send messages over a pooled connection, yielding (message, error) as each is done.
+
+    error is None once the server accepted the message, or the server's
+    reason when it rejected it for good. A dropped connection is retried
+    once on a new one; after that the error propagates and the messages not
+    yet yielded are left for the caller to retry.
+    """
+    pool = smtp_pool()
+    throttle = Throttle(current_app.config['MAIL_RATE_LIMIT'])
+    pending = deque(messages)
+    reconnected = False
+    while pending:
+        try:
+            with pool.connection() as conn:
+                while pending and conn.sent < pool.max_messages:
+                    throttle.wait()
+                    message = pending[0]
+                    try:
+                        conn.send(message)
+                    except smtplib.SMTPRecipientsRefused as e:
+                        error = '; '.join(f'{rcpt}: {code} {reply.decode(errors="replace")}'
+                                          for rcpt, (code, reply) in e.recipients.items())
+                    except smtplib.SMTPResponseException as e:
+                        # 4xx is temporary: let the job retry the rest later
+                        if e.smtp_code < 500:
+                            raise
+                        error = f'{e.smtp_code} {e.smtp_error.decode(errors="replace")}'
+                    else:
+                        error = None
+                    pending.popleft()
+                    reconnected = False
+                    yield message, error
+        except CONNECTION_ERRORS:
+            if reconnected:
+                raise
+            reconnected = True
@@ -0,0 +1,1429 @@
+# models.py - Database models and business rules for the Invoice Generator
+from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from flask_login import UserMixin
+from sqlalchemy import event, inspect
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from sqlalchemy.orm import selectinload
+from werkzeug.security import generate_password_hash, check_password_hash
+from datetime import date, datetime, timedelta
+from collections import namedtuple
+import calendar
+import json
+import re
+import uuid
+from decimal import Decimal
+
+from entitlements import entitlements
+
+# Bind key of the optional read replica, and the session.info flag that
+# routes a session's reads to it (set by read_only() views in app.py)
+REPLICA_BIND = 'replica'
+USE_REPLICA = 'use_replica'
+
+class RoutingSession(Session):
+    """Session that sends reads to the replica bind when flagged to"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.info.get(USE_REPLICA) and not self._flushing:
+            replica = self._db.engines.get(REPLICA_BIND)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+# Bound to the application in create_app()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+# Execution option marking a transaction that will write; on SQLite the
+# engine opens it with BEGIN IMMEDIATE (see configure_sqlite() in app.py)
+WRITE_TRANSACTION = 'sqlite_begin_immediate'
+
+def begin_write(session=None):
+    """Start the session's next transaction as a write transaction.
+
+    Call before changing any objects. On SQLite an open read transaction is
+    ended first and the write lock is taken up front, waiting up to the busy
+    timeout, instead of upgrading a read snapshot part-way through, which
+    fails with "database is locked" without waiting. Other databases are
+    left alone. The rest of the session's queries go to the primary.
+    """
+    session = session or db.session()
+    session.info.pop(USE_REPLICA, None)
+    if session.get_bind().dialect.name != 'sqlite':
+        return
+    if session.in_transaction():
+        session.commit()
+    session.connection(execution_options={WRITE_TRANSACTION: True})
+
+# Enhanced Currency Configuration
+CURRENCIES = {
+    # Major Currencies
+    'USD': {'name': 'US Dollar', 'symbol': '$', 'code': 'USD', 'decimal_places': 2},
+    'EUR': {'name': 'Euro', 'symbol': '€', 'code': 'EUR', 'decimal_places': 2},
+    'GBP': {'name': 'British Pound', 'symbol': '£', 'code': 'GBP', 'decimal_places': 2},
+    'JPY': {'name': 'Japanese Yen', 'symbol': '¥', 'code': 'JPY', 'decimal_places': 0},
+    'CHF': {'name': 'Swiss Franc', 'symbol': 'CHF', 'code': 'CHF', 'decimal_places': 2},
+    
+    # Americas
+    'CAD': {'name': 'Canadian Dollar', 'symbol': 'C$', 'code': 'CAD', 'decimal_places': 2},
+    'BRL': {'name': 'Brazilian Real', 'symbol': 'R$', 'code': 'BRL', 'decimal_places': 2},
+    'MXN': {'name': 'Mexican Peso', 'symbol': '$', 'code': 'MXN', 'decimal_places': 2},
+    'ARS': {'name': 'Argentine Peso', 'symbol': '$', 'code': 'ARS', 'decimal_places': 2},
+    
+    # Asia Pacific
+    'CNY': {'name': 'Chinese Yuan', 'symbol': '¥', 'code': 'CNY', 'decimal_places': 2},
+    'INR': {'name': 'Indian Rupee', 'symbol': '₹', 'code': 'INR', 'decimal_places': 2},
+    'KRW': {'name': 'South Korean Won', 'symbol': '₩', 'code': 'KRW', 'decimal_places': 0},
+    'AUD': {'name': 'Australian Dollar', 'symbol': 'A$', 'code': 'AUD', 'decimal_places': 2},
+    'NZD': {'name': 'New Zealand Dollar', 'symbol': 'NZ$', 'code': 'NZD', 'decimal_places': 2},
+    'SGD': {'name': 'Singapore Dollar', 'symbol': 'S$', 'code': 'SGD', 'decimal_places': 2},
+    'HKD': {'name': 'Hong Kong Dollar', 'symbol': 'HK$', 'code': 'HKD', 'decimal_places': 2},
+    'THB': {'name': 'Thai Baht', 'symbol': '฿', 'code': 'THB', 'decimal_places': 2},
+    'MYR': {'name': 'Malaysian Ringgit', 'symbol': 'RM', 'code': 'MYR', 'decimal_places': 2},
+    'PHP': {'name': 'Philippine Peso', 'symbol': '₱', 'code': 'PHP', 'decimal_places': 2},
+    'IDR': {'name': 'Indonesian Rupiah', 'symbol': 'Rp', 'code': 'IDR', 'decimal_places': 0},
+    'VND': {'name': 'Vietnamese Dong', 'symbol': '₫', 'code': 'VND', 'decimal_places': 0},
+    
+    # Europe
+    'NOK': {'name': 'Norwegian Krone', 'symbol': 'kr', 'code': 'NOK', 'decimal_places': 2},
+    'SEK': {'name': 'Swedish Krona', 'symbol': 'kr', 'code': 'SEK', 'decimal_places': 2},
+    'DKK': {'name': 'Danish Krone', 'symbol': 'kr', 'code': 'DKK', 'decimal_places': 2},
+    'PLN': {'name': 'Polish Zloty', 'symbol': 'zł', 'code': 'PLN', 'decimal_places': 2},
+    'CZK': {'name': 'Czech Koruna', 'symbol': 'Kč', 'code': 'CZK', 'decimal_places': 2},
+    'HUF': {'name': 'Hungarian Forint', 'symbol': 'Ft', 'code': 'HUF', 'decimal_places': 0},
+    'RON': {'name': 'Romanian Leu', 'symbol': 'lei', 'code': 'RON', 'decimal_places': 2},
+    'BGN': {'name': 'Bulgarian Lev', 'symbol': 'лв', 'code': 'BGN', 'decimal_places': 2},
+    'HRK': {'name': 'Croatian Kuna', 'symbol': 'kn', 'code': 'HRK', 'decimal_places': 2},
+    'RUB': {'name': 'Russian Ruble', 'symbol': '₽', 'code': 'RUB', 'decimal_places': 2},
+    'UAH': {'name': 'Ukrainian Hryvnia', 'symbol': '₴', 'code': 'UAH', 'decimal_places': 2},
+    'TRY': {'name': 'Turkish Lira', 'symbol': '₺', 'code': 'TRY', 'decimal_places': 2},
+    
+    # Middle East & Africa
+    'AED': {'name': 'UAE Dirham', 'symbol': 'د.إ', 'code': 'AED', 'decimal_places': 2},
+    'SAR': {'name': 'Saudi Riyal', 'symbol': '﷼', 'code': 'SAR', 'decimal_places': 2},
+    'QAR': {'name': 'Qatari Riyal', 'symbol': '﷼', 'code': 'QAR', 'decimal_places': 2},
+    'ILS': {'name': 'Israeli Shekel', 'symbol': '₪', 'code': 'ILS', 'decimal_places': 2},
+    'EGP': {'name': 'Egyptian Pound', 'symbol': '£', 'code': 'EGP', 'decimal_places': 2},
+    'ZAR': {'name': 'South African Rand', 'symbol': 'R', 'code': 'ZAR', 'decimal_places': 2},
+    'NGN': {'name': 'Nigerian Naira', 'symbol': '₦', 'code': 'NGN', 'decimal_places': 2},
+    'KES': {'name': 'Kenyan Shilling', 'symbol': 'KSh', 'code': 'KES', 'decimal_places': 2},
+    
+    # Cryptocurrencies (for progressive businesses)
+    'BTC': {'name': 'Bitcoin', 'symbol': '₿', 'code': 'BTC', 'decimal_places': 8},
+    'ETH': {'name': 'Ethereum', 'symbol': 'Ξ', 'code': 'ETH', 'decimal_places': 6},
+}
+
+# Input validation helpers
+def validate_email(email):
+    pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
+    return re.match(pattern, email) is not None
+
+def sanitize_input(text, max_length=None):
+    if text is None:
+        return ""
+    text = str(text).strip()
+    if max_length:
+        text = text[:max_length]
+    text = re.sub(r'[<>"\']', '', text)
+    return text
+
+# Currency Helper Functions
+def get_supported_currencies():
+    return CURRENCIES
+
+def format_currency(amount, currency_code, symbol=None):
+    """Format amount according to currency specifications; `symbol` overrides the currency's own"""
+    if currency_code not in CURRENCIES:
+        currency_code = 'USD'
+    
+    currency = CURRENCIES[currency_code]
+    decimal_places = currency['decimal_places']
+    symbol = symbol or currency['symbol']
+    
+    if decimal_places == 0:
+        return f"{symbol}{int(amount):,}"
+    else:
+        return f"{symbol}{amount:,.{decimal_places}f}"
+
+def get_exchange_rate(from_currency, to_currency):
+    """Get exchange rate between currencies - mock implementation"""
+    # In a real app, you'd use an API like exchangerate-api.com or fixer.io
+    # For demo purposes, returning mock rates
+    mock_rates = {
+        ('USD', 'EUR'): 0.85,
+        ('USD', 'GBP'): 0.73,
+        ('USD', 'JPY'): 110.0,
+        ('USD', 'CAD'): 1.25,
+        ('USD', 'AUD'): 1.35,
+        ('EUR', 'USD'): 1.18,
+        ('GBP', 'USD'): 1.37,
+    }
+    
+    if from_currency == to_currency:
+        return 1.0
+    
+    rate_key = (from_currency, to_currency)
+    if rate_key in mock_rates:
+        return mock_rates[rate_key]
+    
+    # Try reverse rate
+    reverse_key = (to_currency, from_currency)
+    if reverse_key in mock_rates:
+        return 1.0 / mock_rates[reverse_key]
+    
+    # Default fallback
+    return 1.0
+
+def convert_currency(amount, from_currency, to_currency):
+    """Convert amount between currencies"""
+    rate = get_exchange_rate(from_currency, to_currency)
+    return Decimal(str(amount)) * Decimal(str(rate))
+
+# Membership Helper Functions
+def membership_tiers():
+    """The tiers currently offered, by key, in display order"""
+    return entitlements().tiers
+
+def get_membership_tier(tier_name):
+    """Get membership tier configuration"""
+    return entitlements().tier(tier_name)
+
+def effective_tier(tier_name, subscription_expires, now=None):
+    """The tier an account is entitled to: its own until a paid subscription lapses, then the default"""
+    if subscription_expires is not None and subscription_expires <= (now or datetime.utcnow()):
+        return entitlements().default
+    return get_membership_tier(tier_name)
+
+def start_of_month(now=None):
+    """Start of the current (UTC) month, the window for tier invoice limits"""
+    now = now or datetime.utcnow()
+    return now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+def invoices_this_month_query(user_id):
+    """Statement counting the invoices a user created this month.
+
+    Shared by the sync views and the async API so both enforce limits the
+    same way; execute it with session.scalar().
+    """
+    return db.select(db.func.count(Invoice.id)).where(
+        Invoice.user_id == user_id,
+        Invoice.created_at >= start_of_month()
+    )
+
+def within_invoice_limit(tier, used):
+    """Check a monthly invoice count against a compiled tier's limit"""
+    return tier.unlimited or used < tier.invoice_limit
+
+def can_create_invoice(user):
+    """Check if user can create another invoice based on their tier"""
+    if user.tier.unlimited:
+        return True
+    
+    invoices_this_month = db.session.scalar(invoices_this_month_query(user.id))
+    return within_invoice_limit(user.tier, invoices_this_month)
+
+def downgrade_expired_subscriptions(now=None):
+    """Move every account whose paid subscription has lapsed to the default tier.
+
+    One UPDATE over the subscription_expires index. updated_at is bumped so
+    cached pages of those accounts (see invoice_validators() in app.py) go
+    stale. Returns the number of accounts downgraded.
+    """
+    now = now or datetime.utcnow()
+    begin_write()
+    result = db.session.execute(
+        db.update(User)
+        .where(User.subscription_expires <= now)
+        .values(membership_tier=entitlements().default.key, subscription_expires=None, updated_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount
+
+def get_invoice_usage(user):
+    """Get current invoice usage for the user"""
+    limit = user.tier.invoice_limit
+    used = db.session.scalar(invoices_this_month_query(user.id))
+    
+    return {
+        'used': used,
+        'limit': limit,
+        'percentage': (used / limit * 100) if limit > 0 else 0
+    }
+
+# Clients
+def client_match_key(name, email=None):
+    """Key that identifies one client among a user's invoices: the email, else the name"""
+    return ((email or '').strip() or (name or '').strip()).lower()[:200]
+
+def client_lookup_query(user_id, match_key):
+    """Statement selecting a user's client by match key; run with session.scalar()"""
+    return db.select(Client).where(Client.user_id == user_id, Client.match_key == match_key)
+
+def link_client(invoice, client=None):
+    """Attach an invoice to `client`, or to a new one, refreshing its details.
+
+    The client's name, email and address follow its most recent invoice.
+    """
+    if client is None:
+        client = Client(user_id=invoice.user_id,
+                        match_key=client_match_key(invoice.client_name, invoice.client_email))
+    client.name = invoice.client_name
+    client.email = invoice.client_email
+    client.address = invoice.client_address
+    invoice.client = client
+    return client
+
+def assign_client(invoice):
+    """Link an invoice to the user's matching client, creating it on first use"""
+    match_key = client_match_key(invoice.client_name, invoice.client_email)
+    return link_client(invoice, db.session.scalar(client_lookup_query(invoice.user_id, match_key)))
+
+def client_rollup_values():
+    """Correlated aggregates over a client's invoices, for UPDATE client SET ..."""
+    invoice = Invoice.__table__
+    own = invoice.c.client_id == Client.__table__.c.id
+    
+    def aggregate(expression, *conditions):
+        return db.select(expression).where(own, *conditions).scalar_subquery()
+    
+    return {
+        'invoice_count': aggregate(db.func.count(invoice.c.id)),
+        'last_invoice_date': aggregate(db.func.max(invoice.c.issue_date))
+    }
+
+def client_currency_totals():
+    """Per-client, per-currency sums over invoices, for INSERT INTO client_currency_rollup"""
+    invoice = Invoice.__table__
+    currency = db.func.coalesce(invoice.c.currency, 'USD')
+    
+    def amount_sum(condition):
+        return db.func.coalesce(db.func.sum(db.case((condition, invoice.c.total), else_=0)), 0.0)
+    
+    return (
+        db.select(invoice.c.client_id, invoice.c.user_id, currency, db.func.count(invoice.c.id),
+                  amount_sum(invoice.c.status.in_(OUTSTANDING_STATUSES + ('overdue',))),
+                  amount_sum(invoice.c.status != 'draft'))
+        .where(invoice.c.client_id.isnot(None))
+        .group_by(invoice.c.client_id, invoice.c.user_id, currency)
+    )
+
+def refresh_client_rollups(client_ids=None, connection=None):
+    """Recompute the rollups of the given clients (all when None).
+
+    One UPDATE for the client counters, then the client's per-currency
+    amounts are replaced with one DELETE and one INSERT ... SELECT.
+    """
+    connection = connection or db.session
+    rollup = ClientCurrencyRollup.__table__
+    statement = db.update(Client.__table__).values(**client_rollup_values())
+    clear = db.delete(rollup)
+    totals = client_currency_totals()
+    if client_ids is not None:
+        client_ids = [client_id for client_id in client_ids if client_id]
+        if not client_ids:
+            return
+        statement = statement.where(Client.__table__.c.id.in_(client_ids))
+        clear = clear.where(rollup.c.client_id.in_(client_ids))
+        totals = totals.where(Invoice.__table__.c.client_id.in_(client_ids))
+    connection.execute(statement)
+    connection.execute(clear)
+    connection.execute(db.insert(rollup).from_select(
+        ['client_id', 'user_id', 'currency', 'invoice_count', 'outstanding', 'lifetime_value'], totals
+    ))
+
+def backfill_invoice_clients(chunk_size=5000):
+    """Create clients for invoices without one, deduplicating by match key.
+
+    Used by the schema migration and after bulk seeding. Each new client
+    takes the details of its most recent invoice. Returns the number of
+    clients created.
+    """
+    invoice = Invoice.__table__
+    clients = {(row.user_id, row.match_key): row.id for row in db.session.execute(
+        db.select(Client.id, Client.user_id, Client.match_key))}
+    new_clients, assignments = [], []
+    rows = db.session.execute(
+        db.select(invoice.c.id, invoice.c.user_id, invoice.c.client_name, invoice.c.client_email,
+                  invoice.c.client_address)
+        .where(invoice.c.client_id.is_(None))
+        .order_by(invoice.c.created_at.desc())
+    )
+    now = datetime.utcnow()
+    for row in rows:
+        key = (row.user_id, client_match_key(row.client_name, row.client_email))
+        if key not in clients:
+            clients[key] = str(uuid.uuid4())
+            new_clients.append({
+                'id': clients[key], 'user_id': row.user_id, 'match_key': key[1],
+                'name': row.client_name, 'email': row.client_email, 'address': row.client_address,
+                'invoice_count': 0,
+                'created_at': now, 'updated_at': now
+            })
+        assignments.append({'invoice_id': row.id, 'new_client_id': clients[key]})
+    
+    for start in range(0, len(new_clients), chunk_size):
+        db.session.execute(db.insert(Client.__table__), new_clients[start:start + chunk_size])
+    assign = (db.update(invoice).where(invoice.c.id == db.bindparam('invoice_id'))
+              .values(client_id=db.bindparam('new_client_id')))
+    for start in range(0, len(assignments), chunk_size):
+        db.session.execute(assign, assignments[start:start + chunk_size])
+    if assignments:
+        refresh_client_rollups({a['new_client_id'] for a in assignments})
+    return len(new_clients)
+
+def build_invoice(user, data, items):
+    """Validate invoice input and build an Invoice with its items and totals.
+
+    `data` is a mapping of the header fields and `items` an iterable of
+    (description, quantity, rate) values, as they arrive from a form or a
+    JSON body. Raises ValueError with a user-facing message. The invoice is
+    not added to any session.
+    """
+    invoice_number = sanitize_input(data.get('invoice_number', ''), 50)
+    client_name = sanitize_input(data.get('client_name', ''), 200)
+    if not invoice_number or not client_name:
+        raise ValueError('Invoice number and client name are required.')
+    
+    currency = data.get('currency') or user.default_currency
+    if currency not in CURRENCIES:
+        currency = user.default_currency
+    
+    try:
+        issue_date = datetime.strptime(str(data['issue_date']), '%Y-%m-%d').date()
+        due_date = datetime.strptime(str(data['due_date']), '%Y-%m-%d').date()
+        tax_rate = float(data.get('tax_rate') or 0)
+    except (KeyError, ValueError, TypeError):
+        raise ValueError('Invalid date or tax rate format.')
+    
+    invoice = Invoice(
+        user_id=user.id,
+        invoice_number=invoice_number,
+        client_name=client_name,
+        client_email=sanitize_input(data.get('client_email', ''), 120),
+        client_address=sanitize_input(data.get('client_address', ''), 500),
+        issue_date=issue_date,
+        due_date=due_date,
+        currency=currency,
+        tax_rate=tax_rate,
+        notes=sanitize_input(data.get('notes', ''), 1000),
+        template_style=data.get('template_style') or 'modern'
+    )
+    
+    subtotal = 0
+    for description, quantity, rate in items:
+        if not str(description).strip():
+            continue
+        try:
+            quantity = float(quantity)
+            rate = float(rate)
+        except (ValueError, TypeError):
+            raise ValueError('Invalid quantity or rate values.')
+        amount = quantity * rate
+        invoice.items.append(InvoiceItem(
+            description=sanitize_input(description, 500),
+            quantity=quantity,
+            rate=rate,
+            amount=amount
+        ))
+        subtotal += amount
+    
+    # Calculate totals
+    invoice.subtotal = subtotal
+    invoice.tax_amount = subtotal * (tax_rate / 100)
+    invoice.total = subtotal + invoice.tax_amount
+    return invoice
+
+# Models
+class User(UserMixin, db.Model):
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    email = db.Column(db.String(120), unique=True, nullable=False, index=True)
+    password_hash = db.Column(db.String(255), nullable=False)
+    company_name = db.Column(db.String(200))
+    default_currency = db.Column(db.String(3), default='USD')
+    membership_tier = db.Column(db.String(20), default='free')
+    subscription_expires = db.Column(db.DateTime, index=True)
+    is_active = db.Column(db.Boolean, default=True)
+    failed_login_attempts = db.Column(db.Integer, default=0)
+    last_login_attempt = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    invoices = db.relationship('Invoice', backref='user', lazy=True)
+
+    def set_password(self, password):
+        if len(password) < 8:
+            raise ValueError("Password must be at least 8 characters long")
+        self.password_hash = generate_password_hash(password)
+
+    def check_password(self, password):
+        return check_password_hash(self.password_hash, password)
+    
+    @property
+    def is_premium(self):
+        """Backward compatibility property"""
+        return self.tier is not entitlements().default
+    
+    @property
+    def tier(self):
+        """The compiled tier in force for this account; tier.has(feature) gates features.
+
+        Resolved from columns already on the row, so it never queries, and
+        kept on the instance (one per session, so one per request) until the
+        tier, expiry or tier definitions change. A lapsed subscription
+        resolves to the default tier before the sweeper has downgraded it.
+        """
+        key = (entitlements(), self.membership_tier, self.subscription_expires)
+        cached = self.__dict__.get('_tier_cache')
+        if cached is None or cached[0] != key:
+            cached = self.__dict__['_tier_cache'] = (key, effective_tier(self.membership_tier, self.subscription_expires))
+        return cached[1]
+    
+    def get_tier_info(self):
+        """Get detailed tier information"""
+        return self.tier
+    
+    def can_access_feature(self, feature):
+        """Check if user can access a specific feature"""
+        return self.tier.has(feature)
+
+class Client(db.Model):
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = db.Column(db.String(36), db.ForeignKey('user.id'), nullable=False)
+    match_key = db.Column(db.String(200), nullable=False)
+    name = db.Column(db.String(200), nullable=False)
+    email = db.Column(db.String(120))
+    address = db.Column(db.Text)
+    # Rollups over the client's invoices, kept current by refresh_client_rollups();
+    # amounts are kept per currency in currency_totals
+    invoice_count = db.Column(db.Integer, default=0, nullable=False)
+    last_invoice_date = db.Column(db.Date)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    invoices = db.relationship('Invoice', back_populates='client', lazy='dynamic')
+    currency_totals = db.relationship('ClientCurrencyRollup', viewonly=True,
+                                      order_by='ClientCurrencyRollup.lifetime_value.desc()')
+    
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'match_key', name='uq_client_user_match_key'),
+        db.Index('ix_client_user_name', 'user_id', 'name'),
+    )
+
+class ClientCurrencyRollup(db.Model):
+    """A client's invoice count, outstanding and lifetime amounts in one currency.
+
+    Amounts in different currencies are never added together. Kept current
+    by refresh_client_rollups().
+    """
+    __tablename__ = 'client_currency_rollup'
+    client_id = db.Column(db.String(36), db.ForeignKey('client.id'), primary_key=True)
+    currency = db.Column(db.String(3), primary_key=True)
+    user_id = db.Column(db.String(36), db.ForeignKey('user.id'), nullable=False)
+    invoice_count = db.Column(db.Integer, default=0, nullable=False)
+    outstanding = db.Column(db.Float, default=0.0, nullable=False)
+    lifetime_value = db.Column(db.Float, default=0.0, nullable=False)
+    
+    __table_args__ = (
+        # Top clients by lifetime value in one currency
+        db.Index('ix_client_currency_rollup_top', 'user_id', 'currency', 'lifetime_value'),
+    )
+
+class Invoice(db.Model):
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = db.Column(db.String(36), db.ForeignKey('user.id'), nullable=False)
+    invoice_number = db.Column(db.String(50), nullable=False)
+    client_id = db.Column(db.String(36), db.ForeignKey('client.id'), index=True)
+    # Bill-to details as issued; the Client keeps the latest ones
+    client_name = db.Column(db.String(200), nullable=False)
+    client_email = db.Column(db.String(120))
+    client_address = db.Column(db.Text)
+    issue_date = db.Column(db.Date, nullable=False)
+    due_date = db.Column(db.Date, nullable=False)
+    currency = db.Column(db.String(3), default='USD')
+    subtotal = db.Column(db.Float, default=0.0)
+    tax_rate = db.Column(db.Float, default=0.0)
+    tax_amount = db.Column(db.Float, default=0.0)
+    total = db.Column(db.Float, default=0.0)
+    notes = db.Column(db.Text)
+    status = db.Column(db.String(20), default='draft')
+    template_style = db.Column(db.String(20), default='modern')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Set on invoices generated from a RecurringInvoice. Not a foreign key, so
+    # removing a schedule leaves the invoices it produced alone.
+    recurring_invoice_id = db.Column(db.String(36))
+    recurring_period = db.Column(db.Date)
+    items = db.relationship('InvoiceItem', backref='invoice', lazy=True, cascade='all, delete-orphan')
+    client = db.relationship('Client', back_populates='invoices')
+    
+    __table_args__ = (
+        # One invoice per schedule and period, however often the scheduler runs
+        db.Index('ix_invoice_recurring_period', 'recurring_invoice_id', 'recurring_period', unique=True),
+        # The overdue sweeper and aging refresh select on these
+        db.Index('ix_invoice_status_due_date', 'status', 'due_date'),
+        # A user's invoices newest first: dashboard and API keyset pages
+        db.Index('ix_invoice_user_created', 'user_id', 'created_at', 'id'),
+    )
+
+    def get_currency_info(self):
+        """Get currency information"""
+        return CURRENCIES.get(self.currency, CURRENCIES['USD'])
+
+    def format_amount(self, amount):
+        """Format amount with proper currency symbol and decimal places"""
+        return format_currency(amount, self.currency)
+
+    def convert_to_currency(self, target_currency):
+        """Convert invoice amounts to target currency"""
+        if self.currency == target_currency:
+            return self
+        
+        rate = get_exchange_rate(self.currency, target_currency)
+        converted_invoice = {
+            'subtotal': float(convert_currency(self.subtotal, self.currency, target_currency)),
+            'tax_amount': float(convert_currency(self.tax_amount, self.currency, target_currency)),
+            'total': float(convert_currency(self.total, self.currency, target_currency)),
+            'currency': target_currency,
+            'exchange_rate': rate,
+            'original_currency': self.currency
+        }
+        return converted_invoice
+
+    def to_dict(self, include_items=False):
+        """JSON-serializable representation used by the API"""
+        data = {
+            'id': self.id,
+            'invoice_number': self.invoice_number,
+            'client_id': self.client_id,
+            'client_name': self.client_name,
+            'client_email': self.client_email,
+            'client_address': self.client_address,
+            'issue_date': self.issue_date.isoformat() if self.issue_date else None,
+            'due_date': self.due_date.isoformat() if self.due_date else None,
+            'currency': self.currency,
+            'subtotal': self.subtotal,
+            'tax_rate': self.tax_rate,
+            'tax_amount': self.tax_amount,
+            'total': self.total,
+            'notes': self.notes,
+            'status': self.status,
+            'template_style': self.template_style,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+        if include_items:
+            data['items'] = [item.to_dict() for item in self.items]
+        return data
+
+class InvoiceItem(db.Model):
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    invoice_id = db.Column(db.String(36), db.ForeignKey('invoice.id'), nullable=False, index=True)
+    description = db.Column(db.String(500), nullable=False)
+    quantity = db.Column(db.Float, default=1.0)
+    rate = db.Column(db.Float, nullable=False)
+    amount = db.Column(db.Float, nullable=False)
+
+    def to_dict(self):
+        """JSON-serializable representation used by the API"""
+        return {
+            'id': self.id,
+            'description': self.description,
+            'quantity': self.quantity,
+            'rate': self.rate,
+            'amount': self.amount
+        }
+
+class RecurringInvoice(db.Model):
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = db.Column(db.String(36), db.ForeignKey('user.id'), nullable=False, index=True)
+    template_invoice_id = db.Column(db.String(36), db.ForeignKey('invoice.id'), nullable=False, index=True)
+    frequency = db.Column(db.String(20), nullable=False, default='monthly')
+    start_date = db.Column(db.Date, nullable=False)
+    next_run_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date)
+    due_days = db.Column(db.Integer, default=30)
+    active = db.Column(db.Boolean, default=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    template = db.relationship('Invoice', foreign_keys=[template_invoice_id])
+    
+    __table_args__ = (
+        # The scheduler's due-schedule lookup
+        db.Index('ix_recurring_invoice_due', 'active', 'next_run_date', 'id'),
+    )
+
+    def period_after(self, period):
+        """The period that follows `period` on this schedule"""
+        frequency = RECURRING_FREQUENCIES[self.frequency]
+        if frequency['months']:
+            return add_months(period, frequency['months'], day=self.start_date.day)
+        return period + timedelta(days=frequency['days'])
+
+    def first_period(self, today=None):
+        """The first period after start_date that is not in the past"""
+        today = today or date.today()
+        period = self.period_after(self.start_date)
+        while period < today:
+            period = self.period_after(period)
+        return period
+
+class InvoiceAging(db.Model):
+    """Overdue totals per user and currency, by days past due.
+
+    Rebuilt as a whole by refresh_invoice_aging() so the dashboard reads a
+    few rows instead of scanning invoices.
+    """
+    __tablename__ = 'invoice_aging'
+    user_id = db.Column(db.String(36), db.ForeignKey('user.id'), primary_key=True)
+    currency = db.Column(db.String(3), primary_key=True)
+    days_0_30 = db.Column(db.Float, default=0.0)
+    days_31_60 = db.Column(db.Float, default=0.0)
+    days_61_90 = db.Column(db.Float, default=0.0)
+    days_90_plus = db.Column(db.Float, default=0.0)
+    overdue_count = db.Column(db.Integer, default=0)
+    refreshed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @property
+    def total(self):
+        return sum(getattr(self, column) or 0 for column, _, _, _ in AGING_BUCKETS)
+
+class InvoiceMonthlyRollup(db.Model):
+    """Invoice count and amount per user, month of issue, currency and status.
+
+    Kept current by apply_rollup_deltas() as invoices are written, so
+    analytics read a few rows per month instead of scanning invoices.
+    """
+    __tablename__ = 'invoice_monthly_rollup'
+    user_id = db.Column(db.String(36), db.ForeignKey('user.id'), primary_key=True)
+    month = db.Column(db.Date, primary_key=True)
+    currency = db.Column(db.String(3), primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    invoice_count = db.Column(db.Integer, default=0, nullable=False)
+    total_amount = db.Column(db.Float, default=0.0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class Job(db.Model):
+    """A unit of background work, run by `flask worker` processes (see jobs.py)"""
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    kind = db.Column(db.String(50), nullable=False)
+    user_id = db.Column(db.String(36), db.ForeignKey('user.id'), index=True)
+    payload = db.Column(db.Text)  # JSON
+    status = db.Column(db.String(20), default='queued', nullable=False)  # queued, running, succeeded, failed
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    max_attempts = db.Column(db.Integer, default=5, nullable=False)
+    run_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    locked_by = db.Column(db.String(100))
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    # What the handler returned: JSON, and optionally a file such as a PDF
+    result = db.Column(db.Text)
+    result_data = db.deferred(db.Column(db.LargeBinary))
+    result_type = db.Column(db.String(100))
+    result_name = db.Column(db.String(255))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        # Workers claim the oldest due job of a status
+        db.Index('ix_job_status_run_at', 'status', 'run_at'),
+    )
+    
+    def to_dict(self):
+        """Status representation for polling clients"""
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'run_at': self.run_at.isoformat() if self.run_at else None,
+            'error': self.last_error.strip().splitlines()[-1] if self.last_error else None,
+            'result': json.loads(self.result) if self.result else None,
+            'has_file': self.result_type is not None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+class InvoicePdf(db.Model):
+    """Last PDF rendered for an invoice, reused while its ETag still matches"""
+    __tablename__ = 'invoice_pdf'
+    invoice_id = db.Column(db.String(36), db.ForeignKey('invoice.id'), primary_key=True)
+    etag = db.Column(db.String(64), nullable=False)
+    data = db.deferred(db.Column(db.LargeBinary, nullable=False))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class InvoiceEmail(db.Model):
+    """One delivery of an invoice to a recipient, sent by an invoice_email job"""
+    __tablename__ = 'invoice_email'
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    invoice_id = db.Column(db.String(36), db.ForeignKey('invoice.id'), nullable=False, index=True)
+    user_id = db.Column(db.String(36), db.ForeignKey('user.id'), nullable=False)
+    recipient = db.Column(db.String(120), nullable=False)
+    message = db.Column(db.Text)
+    status = db.Column(db.String(20), default='queued', nullable=False)  # queued, sent, failed
+    message_id = db.Column(db.String(255))
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+class Webhook(db.Model):
+    """A user's endpoint for invoice events, delivered by `flask dispatch-webhooks`"""
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = db.Column(db.String(36), db.ForeignKey('user.id'), nullable=False, index=True)
+    url = db.Column(db.String(500), nullable=False)
+    secret = db.Column(db.String(64), nullable=False)  # HMAC key for the signature header
+    events = db.Column(db.String(200), nullable=False)  # comma-separated WEBHOOK_EVENTS keys
+    active = db.Column(db.Boolean, default=True, nullable=False)
+    last_delivery_at = db.Column(db.DateTime)
+    last_status_code = db.Column(db.Integer)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def event_list(self):
+        return self.events.split(',')
+
+class WebhookDelivery(db.Model):
+    """One event waiting for, or done with, delivery to one webhook"""
+    __tablename__ = 'webhook_delivery'
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    webhook_id = db.Column(db.String(36), db.ForeignKey('webhook.id'), nullable=False, index=True)
+    event = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # the event as JSON, sent as-is
+    status = db.Column(db.String(20), default='pending', nullable=False)  # pending, sending, delivered, failed
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    locked_at = db.Column(db.DateTime)
+    last_status_code = db.Column(db.Integer)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    delivered_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        # The dispatcher claims due deliveries of a status
+        db.Index('ix_webhook_delivery_status_next', 'status', 'next_attempt_at'),
+    )
+
+class SchemaVersion(db.Model):
+    __tablename__ = 'schema_version'
+    version = db.Column(db.Integer, primary_key=True)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# Read models
+# List views only show a handful of invoice columns. Selecting just those
+# into plain tuples skips loading notes and addresses, building ORM
+# instances and tracking them in the session's identity map.
+class InvoiceRow(namedtuple('InvoiceRow', ['id', 'invoice_number', 'client_id', 'client_name',
+                                           'issue_date', 'due_date', 'total', 'currency', 'status'])):
+    """Read-only invoice columns for list views"""
+    __slots__ = ()
+    
+    def format_amount(self, amount):
+        return format_currency(amount, self.currency)
+
+def invoice_list_query(user_id):
+    """Select the InvoiceRow columns of a user's invoices; add filters and order_by as needed"""
+    invoice = Invoice.__table__
+    return db.select(*[invoice.c[field] for field in InvoiceRow._fields]).where(invoice.c.user_id == user_id)
+
+def invoice_rows(query, batch_size=None):
+    """Run a projected invoice query, yielding InvoiceRow tuples.
+
+    With a batch size, rows are fetched batch by batch from a server-side
+    cursor instead of all at once.
+    """
+    if batch_size:
+        query = query.execution_options(yield_per=batch_size)
+    return map(InvoiceRow._make, db.session.execute(query))
+
+def invoice_item_rows(invoice_id, batch_size=500):
+    """An invoice's items as (description, quantity, rate, amount) tuples, fetched batch by batch"""
+    query = (
+        db.select(InvoiceItem.description, InvoiceItem.quantity, InvoiceItem.rate, InvoiceItem.amount)
+        .where(InvoiceItem.invoice_id == invoice_id)
+        .execution_options(yield_per=batch_size)
+    )
+    return map(tuple, db.session.execute(query))
+
+# Keep client rollups current on every ORM write to an invoice. Bulk
+# inserts bypass these and call refresh_client_rollups() themselves.
+@event.listens_for(Invoice, 'after_insert')
+@event.listens_for(Invoice, 'after_delete')
+def refresh_invoice_client(mapper, connection, invoice):
+    refresh_client_rollups([invoice.client_id], connection)
+
+@event.listens_for(Invoice, 'after_update')
+def refresh_changed_invoice_client(mapper, connection, invoice):
+    state = inspect(invoice)
+    if not any(state.attrs[attr].history.has_changes()
+               for attr in ('client_id', 'status', 'total', 'currency', 'issue_date')):
+        return
+    refresh_client_rollups({invoice.client_id, *state.attrs.client_id.history.deleted}, connection)
+
+# Recurring invoices
+RECURRING_FREQUENCIES = {
+    'weekly': {'name': 'Weekly', 'months': 0, 'days': 7, 'number_format': '%Y-%m-%d'},
+    'monthly': {'name': 'Monthly', 'months': 1, 'days': 0, 'number_format': '%Y-%m'},
+    'quarterly': {'name': 'Quarterly', 'months': 3, 'days': 0, 'number_format': '%Y-%m'},
+    'yearly': {'name': 'Yearly', 'months': 12, 'days': 0, 'number_format': '%Y'}
+}
+
+def add_months(d, months, day=None):
+    """Shift a date by whole months, clamping the day to the month's length"""
+    year, month = divmod(d.year * 12 + d.month - 1 + months, 12)
+    month += 1
+    return date(year, month, min(day or d.day, calendar.monthrange(year, month)[1]))
+
+def generate_recurring_invoices(run_date=None, chunk_size=500):
+    """Create the invoices of every recurring schedule due by `run_date`.
+
+    Due schedules are read in (next_run_date, id) keyset-paginated chunks
+    off the (active, next_run_date, id) index and their invoices inserted in
+    bulk, one transaction per chunk. Missed periods are caught up. A schedule whose
+    owner is at their tier's monthly limit stays due and is retried on the
+    next run. Periods that already have an invoice are skipped, so re-runs
+    are harmless. Returns a dict of counts.
+    """
+    run_date = run_date or date.today()
+    summary = {'schedules': 0, 'generated': 0, 'already_generated': 0, 'over_limit': 0, 'ended': 0}
+    last_date, last_id = date.min, ''
+    # Over-limit schedules that caught up some periods move later in the
+    # order but are still due; don't handle them twice in one run
+    held = set()
+    
+    while True:
+        begin_write()
+        rows = db.session.scalars(
+            db.select(RecurringInvoice)
+            .where(RecurringInvoice.active.is_(True),
+                   RecurringInvoice.next_run_date <= run_date,
+                   db.or_(RecurringInvoice.next_run_date > last_date,
+                          db.and_(RecurringInvoice.next_run_date == last_date, RecurringInvoice.id > last_id)))
+            .order_by(RecurringInvoice.next_run_date, RecurringInvoice.id)
+            .limit(chunk_size)
+            .options(selectinload(RecurringInvoice.template).selectinload(Invoice.items))
+            .with_for_update(skip_locked=True, of=RecurringInvoice)
+        ).all()
+        if rows:
+            last_date, last_id = rows[-1].next_run_date, rows[-1].id
+        schedules = [schedule for schedule in rows if schedule.id not in held]
+        if not schedules:
+            db.session.commit()
+            if len(rows) < chunk_size:
+                break
+            continue
+        summary['schedules'] += len(schedules)
+        
+        user_ids = {s.user_id for s in schedules}
+        tiers = {user_id: effective_tier(tier_name, expires) for user_id, tier_name, expires in db.session.execute(
+            db.select(User.id, User.membership_tier, User.subscription_expires).where(User.id.in_(user_ids))
+        )}
+        used = dict(db.session.execute(
+            db.select(Invoice.user_id, db.func.count(Invoice.id))
+            .where(Invoice.user_id.in_(user_ids), Invoice.created_at >= start_of_month())
+            .group_by(Invoice.user_id)
+        ).all())
+        existing = set(db.session.execute(
+            db.select(Invoice.recurring_invoice_id, Invoice.recurring_period)
+            .where(Invoice.recurring_invoice_id.in_([s.id for s in schedules]),
+                   Invoice.recurring_period >= min(s.next_run_date for s in schedules))
+        ).all())
+        
+        now = datetime.utcnow()
+        invoice_rows, item_rows = [], []
+        for schedule in schedules:
+            template = schedule.template
+            period = schedule.next_run_date
+            while period <= run_date and schedule.active:
+                if template is None or (schedule.end_date and period > schedule.end_date):
+                    schedule.active = False
+                    summary['ended'] += 1
+                    break
+                if (schedule.id, period) in existing:
+                    summary['already_generated'] += 1
+                elif not within_invoice_limit(tiers.get(schedule.user_id, entitlements().default),
+                                              used.get(schedule.user_id, 0)):
+                    summary['over_limit'] += 1
+                    break
+                else:
+                    invoice_id = str(uuid.uuid4())
+                    number_suffix = period.strftime(RECURRING_FREQUENCIES[schedule.frequency]['number_format'])
+                    invoice_rows.append({
+                        'id': invoice_id, 'user_id': schedule.user_id,
+                        'invoice_number': f'{template.invoice_number}-{number_suffix}'[:50],
+                        'client_name': template.client_name, 'client_email': template.client_email,
+                        'client_address': template.client_address,
+                        'issue_date': period, 'due_date': period + timedelta(days=schedule.due_days or 0),
+                        'currency': template.currency, 'subtotal': template.subtotal,
+                        'tax_rate': template.tax_rate, 'tax_amount': template.tax_amount, 'total': template.total,
+                        'notes': template.notes, 'status': 'pending', 'template_style': template.template_style,
+                        'created_at': now, 'updated_at': now,
+                        'recurring_invoice_id': schedule.id, 'recurring_period': period,
+                        'client_id': template.client_id
+                    })
+                    item_rows.extend({
+                        'id': str(uuid.uuid4()), 'invoice_id': invoice_id, 'description': item.description,
+                        'quantity': item.quantity, 'rate': item.rate, 'amount': item.amount
+                    } for item in template.items)
+                    used[schedule.user_id] = used.get(schedule.user_id, 0) + 1
+                    summary['generated'] += 1
+                period = schedule.period_after(period)
+            if schedule.active and schedule.next_run_date < period <= run_date:
+                held.add(schedule.id)
+            schedule.next_run_date = period
+        
+        if invoice_rows:
+            db.session.execute(db.insert(Invoice), invoice_rows)
+        if item_rows:
+            db.session.execute(db.insert(InvoiceItem), item_rows)
+        if invoice_rows:
+            refresh_client_rollups({row['client_id'] for row in invoice_rows})
+            apply_rollup_deltas((row['user_id'], row['issue_date'], row['currency'], row['status'], 1, row['total'])
+                                for row in invoice_rows)
+            emit_invoice_events(('invoice.created', row['user_id'], invoice_event_data(row)) for row in invoice_rows)
+        db.session.commit()
+        
+        if len(rows) < chunk_size:
+            break
+    return summary
+
+# Overdue invoices
+# Sent and pending invoices become overdue once their due date has passed
+OUTSTANDING_STATUSES = ('sent', 'pending')
+
+# (column, label, first day, last day) of days past due
+AGING_BUCKETS = [
+    ('days_0_30', '0–30 days', 0, 30),
+    ('days_31_60', '31–60 days', 31, 60),
+    ('days_61_90', '61–90 days', 61, 90),
+    ('days_90_plus', '90+ days', 91, None)
+]
+
+def mark_overdue_invoices(today=None):
+    """Flip outstanding invoices past their due date to overdue.
+
+    One UPDATE ... RETURNING per outstanding status, over the (status,
+    due_date) index. The returned rows are exactly the invoices the UPDATE
+    changed, with their previous status known, so the rollups and webhook
+    events stay in step with it while other writers are busy. Databases
+    without UPDATE ... RETURNING lock the rows with SELECT ... FOR UPDATE
+    first. Returns the number of invoices changed.
+    """
+    today = today or date.today()
+    now = datetime.utcnow()
+    columns = [Invoice.user_id] + [getattr(Invoice, field) for field in WEBHOOK_INVOICE_FIELDS]
+    begin_write()
+    moved = []
+    for status in OUTSTANDING_STATUSES:
+        due = db.and_(Invoice.status == status, Invoice.due_date < today)
+        update = (db.update(Invoice).values(status='overdue', updated_at=now)
+                  .execution_options(synchronize_session=False))
+        if db.engine.dialect.update_returning:
+            rows = db.session.execute(update.where(due).returning(*columns)).all()
+        else:
+            rows = db.session.execute(db.select(*columns).where(due).with_for_update()).all()
+            if rows:
+                db.session.execute(update.where(Invoice.id.in_([row.id for row in rows])))
+        moved.extend((status, row) for row in rows)
+    
+    # Bulk UPDATEs skip the mapper events, so move the rollups and emit events by hand
+    apply_rollup_deltas([(row.user_id, row.issue_date, row.currency, status, -1, -(row.total or 0))
+                         for status, row in moved] +
+                        [(row.user_id, row.issue_date, row.currency, 'overdue', 1, row.total or 0)
+                         for status, row in moved])
+    emit_invoice_events(('invoice.status_changed', row.user_id,
+                         invoice_event_data({**row._mapping, 'status': 'overdue'}, previous_status=status))
+                        for status, row in moved)
+    db.session.commit()
+    return len(moved)
+
+def refresh_invoice_aging(today=None):
+    """Rebuild invoice_aging from the overdue invoices with one INSERT ... SELECT"""
+    today = today or date.today()
+    
+    def bucket_total(first_day, last_day):
+        condition = Invoice.due_date <= today - timedelta(days=first_day)
+        if last_day is not None:
+            condition = db.and_(condition, Invoice.due_date >= today - timedelta(days=last_day))
+        return db.func.coalesce(db.func.sum(db.case((condition, Invoice.total), else_=0)), 0)
+    
+    columns = ['user_id', 'currency'] + [column for column, _, _, _ in AGING_BUCKETS] + ['overdue_count', 'refreshed_at']
+    currency = db.func.coalesce(Invoice.currency, 'USD')
+    rows = (
+        db.select(Invoice.user_id, currency,
+                  *[bucket_total(first, last) for _, _, first, last in AGING_BUCKETS],
+                  db.func.count(Invoice.id), db.literal(datetime.utcnow(), db.DateTime))
+        .where(Invoice.status == 'overdue')
+        .group_by(Invoice.user_id, currency)
+    )
+    begin_write()
+    db.session.execute(db.delete(InvoiceAging))
+    result = db.session.execute(db.insert(InvoiceAging).from_select(columns, rows))
+    db.session.commit()
+    return result.rowcount
+
+# Monthly analytics rollups
+def month_of(day):
+    return day.replace(day=1)
+
+def apply_rollup_deltas(deltas, connection=None):
+    """Add (user_id, issue_date, currency, status, count, amount) deltas to the rollups.
+
+    Deltas for the same month are merged first, then written with one
+    upsert per row.
+    """
+    merged = {}
+    for user_id, issue_date, currency, status, count, amount in deltas:
+        key = (user_id, month_of(issue_date), currency or 'USD', status or 'draft')
+        totals = merged.setdefault(key, [0, 0.0])
+        totals[0] += count
+        totals[1] += amount or 0
+    now = datetime.utcnow()
+    rows = [{'user_id': user_id, 'month': month, 'currency': currency, 'status': status,
+             'invoice_count': count, 'total_amount': amount, 'updated_at': now}
+            for (user_id, month, currency, status), (count, amount) in merged.items()
+            if count or amount]
+    if not rows:
+        return
+    
+    connection = connection or db.session
+    table = InvoiceMonthlyRollup.__table__
+    bind = connection if connection is not db.session else db.session.get_bind(InvoiceMonthlyRollup)
+    dialect = bind.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        statement = insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.user_id, table.c.month, table.c.currency, table.c.status],
+            set_={
+                'invoice_count': table.c.invoice_count + statement.excluded.invoice_count,
+                'total_amount': table.c.total_amount + statement.excluded.total_amount,
+                'updated_at': statement.excluded.updated_at
+            }
+        )
+        connection.execute(statement, rows)
+        return
+    
+    for row in rows:
+        key = db.and_(table.c.user_id == row['user_id'], table.c.month == row['month'],
+                      table.c.currency == row['currency'], table.c.status == row['status'])
+        result = connection.execute(
+            db.update(table).where(key).values(
+                invoice_count=table.c.invoice_count + row['invoice_count'],
+                total_amount=table.c.total_amount + row['total_amount'],
+                updated_at=row['updated_at']
+            )
+        )
+        if not result.rowcount:
+            connection.execute(db.insert(table), row)
+
+def rebuild_monthly_rollups(batch_size=10000):
+    """Recompute every rollup row from the invoices in the current transaction.
+
+    Used by the schema migration, after bulk seeding and to correct drift.
+    Returns the number of rollup rows written.
+    """
+    invoice = Invoice.__table__
+    db.session.execute(db.delete(InvoiceMonthlyRollup))
+    rows = db.session.execute(
+        db.select(invoice.c.user_id, invoice.c.issue_date, invoice.c.currency, invoice.c.status, invoice.c.total)
+        .execution_options(yield_per=batch_size)
+    )
+    totals = {}
+    for user_id, issue_date, currency, status, total in rows:
+        key = (user_id, month_of(issue_date), currency or 'USD', status or 'draft')
+        entry = totals.setdefault(key, [0, 0.0])
+        entry[0] += 1
+        entry[1] += total or 0
+    apply_rollup_deltas((user_id, month, currency, status, count, amount)
+                        for (user_id, month, currency, status), (count, amount) in totals.items())
+    return len(totals)
+
+ROLLUP_ATTRIBUTES = ('user_id', 'issue_date', 'currency', 'status', 'total')
+
+def rollup_key(state, committed):
+    """The invoice's (user_id, issue_date, currency, status, total), as loaded or as changed"""
+    values = []
+    for attr in ROLLUP_ATTRIBUTES:
+        history = state.attrs[attr].history
+        if committed and history.deleted:
+            values.append(history.deleted[0])
+        else:
+            values.append(state.attrs[attr].value)
+    return values
+
+@event.listens_for(Invoice, 'after_insert')
+def add_invoice_to_rollups(mapper, connection, invoice):
+    user_id, issue_date, currency, status, total = rollup_key(inspect(invoice), committed=False)
+    apply_rollup_deltas([(user_id, issue_date, currency, status, 1, total)], connection)
+
+@event.listens_for(Invoice, 'after_update')
+def move_invoice_between_rollups(mapper, connection, invoice):
+    state = inspect(invoice)
+    if not any(state.attrs[attr].history.has_changes() for attr in ROLLUP_ATTRIBUTES):
+        return
+    old = rollup_key(state, committed=True)
+    new = rollup_key(state, committed=False)
+    apply_rollup_deltas([(*old[:4], -1, -(old[4] or 0)), (*new[:4], 1, new[4])], connection)
+
+@event.listens_for(Invoice, 'after_delete')
+def remove_invoice_from_rollups(mapper, connection, invoice):
+    user_id, issue_date, currency, status, total = rollup_key(inspect(invoice), committed=True)
+    apply_rollup_deltas([(user_id, issue_date, currency, status, -1, -(total or 0))], connection)
+
+# Webhook events
+# Deliveries are written in the same transaction as the invoice change, so
+# an event is queued exactly when the change commits. Bulk writes bypass
+# the mapper events and call emit_invoice_events() themselves.
+WEBHOOK_EVENTS = {
+    'invoice.created': 'Invoice created',
+    'invoice.status_changed': 'Invoice status changed'
+}
+WEBHOOK_INVOICE_FIELDS = ('id', 'invoice_number', 'client_id', 'client_name', 'client_email',
+                          'issue_date', 'due_date', 'currency', 'total', 'status')
+
+def invoice_event_data(values, previous_status=None):
+    """Webhook payload for an invoice, from a mapping of its columns"""
+    data = {field: values.get(field) for field in WEBHOOK_INVOICE_FIELDS}
+    if previous_status is not None:
+        data['previous_status'] = previous_status
+    return data
+
+def webhook_event(event_type, data, now=None):
+    """An event as sent to endpoints, serialised once for all its deliveries"""
+    now = now or datetime.utcnow()
+    return json.dumps({'id': str(uuid.uuid4()), 'type': event_type,
+                       'created_at': now.isoformat() + 'Z', 'data': data}, default=str)
+
+def emit_invoice_events(events, connection=None, chunk_size=1000):
+    """Queue (event type, user_id, data) events for the users' subscribed webhooks"""
+    connection = connection or db.session
+    webhook = Webhook.__table__
+    events = list(events)
+    now = datetime.utcnow()
+    for start in range(0, len(events), chunk_size):
+        chunk = events[start:start + chunk_size]
+        subscriptions = {}
+        for webhook_id, user_id, subscribed in connection.execute(
+            db.select(webhook.c.id, webhook.c.user_id, webhook.c.events)
+            .where(webhook.c.user_id.in_({user_id for _, user_id, _ in chunk}), webhook.c.active.is_(True))
+        ):
+            subscriptions.setdefault(user_id, []).append((webhook_id, subscribed.split(',')))
+        rows = []
+        for event_type, user_id, data in chunk:
+            hooks = [webhook_id for webhook_id, subscribed in subscriptions.get(user_id, ())
+                     if event_type in subscribed]
+            if not hooks:
+                continue
+            payload = webhook_event(event_type, data, now)
+            rows.extend({'id': str(uuid.uuid4()), 'webhook_id': webhook_id, 'event': event_type,
+                         'payload': payload, 'status': 'pending', 'attempts': 0,
+                         'next_attempt_at': now, 'created_at': now}
+                        for webhook_id in hooks)
+        if rows:
+            connection.execute(db.insert(WebhookDelivery.__table__), rows)
+
+@event.listens_for(Invoice, 'after_insert')
+def emit_invoice_created(mapper, connection, invoice):
+    data = invoice_event_data(inspect(invoice).dict)
+    emit_invoice_events([('invoice.created', invoice.user_id, data)], connection)
+
+@event.listens_for(Invoice, 'after_update')
+def emit_invoice_status_changed(mapper, connection, invoice):
+    history = inspect(invoice).attrs.status.history
+    if not history.has_changes():
+        return
+    data = invoice_event_data(inspect(invoice).dict, previous_status=history.deleted[0] if history.deleted else 'draft')
+    emit_invoice_events([('invoice.status_changed', invoice.user_id, data)], connection)
+
+# Schema versioning
+# Bump SCHEMA_VERSION whenever the models change. New tables are created by
+# db.create_all(); changes to existing tables and data go in a migration
+# step registered for the version that introduces them.
+SCHEMA_VERSION = 12
+MIGRATIONS = {}
+
+def migration(version):
+    """Register an upgrade step that brings the schema to `version`"""
+    def decorator(f):
+        MIGRATIONS[version] = f
+        return f
+    return decorator
+
+def get_schema_version():
+    """Get the schema version recorded in the database, or None if not initialized"""
+    try:
+        return db.session.query(db.func.max(SchemaVersion.version)).scalar()
+    except (OperationalError, ProgrammingError):
+        db.session.rollback()
+        return None
+
+def upgrade_schema():
+    """Create missing tables and apply pending migrations. Returns the new version."""
+    current = get_schema_version()
+    if current is None:
+        # Databases created before versioning already hold the version 1 tables
+        current = 1 if db.inspect(db.engine).has_table('user') else 0
+    
+    db.create_all()
+    if current == 0:
+        # Fresh database: create_all() built the current schema directly
+        current = SCHEMA_VERSION
+    
+    for version in range(current + 1, SCHEMA_VERSION + 1):
+        begin_write()
+        step = MIGRATIONS.get(version)
+        if step:
+            step()
+        db.session.add(SchemaVersion(version=version))
+        db.session.commit()
+        current = version
+    
+    if not db.session.get(SchemaVersion, current):
+        begin_write()
+        db.session.add(SchemaVersion(version=current))
+        db.session.commit()
+    return current
+
+@migration(2)
+def add_recurring_invoice_columns():
+    """Invoices record the recurring schedule and period that produced them"""
+    db.session.execute(db.text('ALTER TABLE invoice ADD COLUMN recurring_invoice_id VARCHAR(36)'))
+    db.session.execute(db.text('ALTER TABLE invoice ADD COLUMN recurring_period DATE'))
+    db.session.execute(db.text(
+        'CREATE UNIQUE INDEX ix_invoice_recurring_period ON invoice (recurring_invoice_id, recurring_period)'
+    ))
+
+@migration(3)
+def add_invoice_status_due_date_index():
+    """Index for the overdue sweeper; the invoice_aging table comes from create_all()"""
+    db.session.execute(db.text('CREATE INDEX ix_invoice_status_due_date ON invoice (status, due_date)'))
+
+@migration(4)
+def add_invoice_clients():
+    """Link invoices to the new client table, deduplicating their bill-to details"""
+    db.session.execute(db.text('ALTER TABLE invoice ADD COLUMN client_id VARCHAR(36) REFERENCES client (id)'))
+    db.session.execute(db.text('CREATE INDEX ix_invoice_client_id ON invoice (client_id)'))
+    backfill_invoice_clients()
+
+@migration(5)
+def build_monthly_rollups():
+    """Fill the new invoice_monthly_rollup table from existing invoices"""
+    rebuild_monthly_rollups()
+
+@migration(6)
+def add_invoice_listing_indexes():
+    """Index a user's invoices by creation time, and items by invoice"""
+    db.session.execute(db.text('CREATE INDEX ix_invoice_user_created ON invoice (user_id, created_at, id)'))
+    db.session.execute(db.text('CREATE INDEX ix_invoice_item_invoice_id ON invoice_item (invoice_id)'))
+
+@migration(10)
+def add_user_subscription_expires_index():
+    """Index for the subscription expiry sweeper"""
+    db.session.execute(db.text('CREATE INDEX ix_user_subscription_expires ON "user" (subscription_expires)'))
+
+@migration(11)
+def extend_recurring_invoice_due_index():
+    """The recurring generator pages due schedules by (next_run_date, id)"""
+    db.session.execute(db.text('DROP INDEX ix_recurring_invoice_due'))
+    db.session.execute(db.text(
+        'CREATE INDEX ix_recurring_invoice_due ON recurring_invoice (active, next_run_date, id)'
+    ))
+
+@migration(12)
+def split_client_rollups_by_currency():
+    """Client amounts move to client_currency_rollup, one row per currency.
+
+    The client table only has the old columns if it was created before
+    version 12; upgrades from before version 4 get it from create_all().
+    """
+    columns = {column['name'] for column in db.inspect(db.session.connection()).get_columns('client')}
+    for column in ('outstanding', 'lifetime_value'):
+        if column in columns:
+            db.session.execute(db.text(f'ALTER TABLE client DROP COLUMN {column}'))
+    refresh_client_rollups()
+
+# The tables as they were before schema versioning, with a little data, for
+# checking that upgrade_schema() brings such a database to SCHEMA_VERSION
+VERSION_1_SCHEMA = (
+    """CREATE TABLE user (
+        id VARCHAR(36) NOT NULL,
+        email VARCHAR(120) NOT NULL,
+        password_hash VARCHAR(255) NOT NULL,
+        company_name VARCHAR(200),
+        default_currency VARCHAR(3),
+        membership_tier VARCHAR(20),
+        subscription_expires DATETIME,
+        is_active BOOLEAN,
+        failed_login_attempts INTEGER,
+        last_login_attempt DATETIME,
+        created_at DATETIME,
+        updated_at DATETIME,
+        PRIMARY KEY (id)
+    )""",
+    'CREATE UNIQUE INDEX ix_user_email ON user (email)',
+    """CREATE TABLE invoice (
+        id VARCHAR(36) NOT NULL,
+        user_id VARCHAR(36) NOT NULL,
+        invoice_number VARCHAR(50) NOT NULL,
+        client_name VARCHAR(200) NOT NULL,
+        client_email VARCHAR(120),
+        client_address TEXT,
+        issue_date DATE NOT NULL,
+        due_date DATE NOT NULL,
+        currency VARCHAR(3),
+        subtotal FLOAT,
+        tax_rate FLOAT,
+        tax_amount FLOAT,
+        total FLOAT,
+        notes TEXT,
+        status VARCHAR(20),
+        template_style VARCHAR(20),
+        created_at DATETIME,
+        updated_at DATETIME,
+        PRIMARY KEY (id),
+        FOREIGN KEY(user_id) REFERENCES user (id)
+    )""",
+    """CREATE TABLE invoice_item (
+        id VARCHAR(36) NOT NULL,
+        invoice_id VARCHAR(36) NOT NULL,
+        description VARCHAR(500) NOT NULL,
+        quantity FLOAT,
+        rate FLOAT NOT NULL,
+        amount FLOAT NOT NULL,
+        PRIMARY KEY (id),
+        FOREIGN KEY(invoice_id) REFERENCES invoice (id)
+    )""",
+    """INSERT INTO user (id, email, password_hash, default_currency, membership_tier, is_active,
+                         failed_login_attempts, created_at, updated_at)
+       VALUES ('u1', 'check@example.com', '-', 'USD', 'free', 1, 0, '2024-01-01', '2024-01-01')""",
+    """INSERT INTO invoice (id, user_id, invoice_number, client_name, client_email, issue_date, due_date,
+                            currency, subtotal, tax_rate, tax_amount, total, status, created_at, updated_at)
+       VALUES ('i1', 'u1', 'INV-1', 'Acme', 'billing@acme.test', '2024-01-01', '2024-01-31',
+               'USD', 100, 0, 0, 100, 'sent', '2024-01-01', '2024-01-01'),
+              ('i2', 'u1', 'INV-2', 'Acme', 'billing@acme.test', '2024-02-01', '2024-02-29',
+               'EUR', 50, 0, 0, 50, 'paid', '2024-02-01', '2024-02-01')""",
+    """INSERT INTO invoice_item (id, invoice_id, description, quantity, rate, amount)
+       VALUES ('t1', 'i1', 'Work', 1, 100, 100), ('t2', 'i2', 'Work', 1, 50, 50)"""
+)
+
+def schema_differences():
+    """Tables, columns and indexes that differ between the models and the database"""
+    inspector = db.inspect(db.session.connection())
+    differences = []
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            differences.append(f'{table.name}: table missing')
+            continue
+        expected = set(table.columns.keys())
+        actual = {column['name'] for column in inspector.get_columns(table.name)}
+        differences += [f'{table.name}.{name}: column missing' for name in sorted(expected - actual)]
+        differences += [f'{table.name}.{name}: column not in the models' for name in sorted(actual - expected)]
+        expected = {index.name for index in table.indexes}
+        actual = {index['name'] for index in inspector.get_indexes(table.name)}
+        differences += [f'{table.name}: index {name} missing' for name in sorted(expected - actual)]
+    return differences
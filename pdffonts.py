@@ -0,0 +1,146 @@
+# pdffonts.py - Unicode fonts for invoice PDFs
+"""
+ReportLab's built-in Helvetica only draws the Windows-1252 characters, so
+symbols such as ₹, ₩ or ₫ come out as blank boxes. Invoices whose text
+fits in Helvetica keep using it: nothing is embedded and the PDF is
+unchanged. Any other invoice is drawn in the first TrueType font from
+PDF_FONTS that has the most of its characters.
+
+TrueType fonts are parsed and registered with ReportLab the first time a
+process needs one, then kept; a forked worker inherits them. ReportLab
+embeds only the glyphs a document actually uses, so a PDF carries a few
+kilobytes of font subset rather than the whole file.
+
+A currency symbol the chosen font can't draw is replaced with its ISO
+code ("SAR 1,200.00") rather than printed as a box.
+
+PDF_FONTS is a list of regular-weight .ttf paths separated by os.pathsep.
+The bold face is looked for next to each file (DejaVuSans-Bold.ttf,
+NotoSans-Bold.ttf, arialbd.ttf); the regular face stands in when there is
+none. Paths that don't exist are skipped.
+"""
+import logging
+import os
+import threading
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FONT_PATHS = (
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',      # Debian, Ubuntu (fonts-dejavu-core)
+    '/usr/share/fonts/dejavu-sans-fonts/DejaVuSans.ttf',    # Fedora
+    '/usr/share/fonts/TTF/DejaVuSans.ttf',                  # Arch
+    '/usr/share/fonts/truetype/noto/NotoSans-Regular.ttf',  # Debian, Ubuntu (fonts-noto-core)
+    '/Library/Fonts/Arial Unicode.ttf',                     # macOS
+    'C:/Windows/Fonts/arial.ttf'
+)
+
+# Ways a bold face is named next to its regular one
+BOLD_VARIANTS = (('-Regular.ttf', '-Bold.ttf'), ('.ttf', '-Bold.ttf'), ('.ttf', 'bd.ttf'))
+
+# Control characters (newlines in addresses and notes) are never drawn
+CONTROL_CHARACTERS = frozenset(map(chr, range(32)))
+
+
+class PdfFont(namedtuple('PdfFont', ['regular', 'bold', 'glyphs'])):
+    """Registered regular and bold font names and the characters they can draw"""
+    __slots__ = ()
+
+    def covers(self, text):
+        return set(text) <= self.glyphs
+
+    def currency_symbol(self, currency):
+        """The currency's symbol, or its code when this font can't draw the symbol"""
+        return currency['symbol'] if self.covers(currency['symbol']) else f"{currency['code']} "
+
+
+HELVETICA = PdfFont('Helvetica', 'Helvetica-Bold', frozenset(bytes(range(256)).decode('cp1252', errors='ignore')))
+
+
+def bold_path(path):
+    for suffix, bold_suffix in BOLD_VARIANTS:
+        if path.endswith(suffix):
+            candidate = path[:-len(suffix)] + bold_suffix
+            if os.path.isfile(candidate):
+                return candidate
+    return None
+
+
+def register_font(path):
+    """Parse a TrueType font (and its bold face) and register them with ReportLab"""
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+
+    name = os.path.splitext(os.path.basename(path))[0].replace(' ', '')
+    regular = TTFont(name, path)
+    pdfmetrics.registerFont(regular)
+    bold_name = name
+    bold_file = bold_path(path)
+    if bold_file:
+        bold_name = os.path.splitext(os.path.basename(bold_file))[0].replace(' ', '')
+        pdfmetrics.registerFont(TTFont(bold_name, bold_file))
+    # Lets <b> in Paragraph markup find the bold face
+    pdfmetrics.registerFontFamily(name, normal=name, bold=bold_name, italic=name, boldItalic=bold_name)
+    return PdfFont(name, bold_name, frozenset(map(chr, regular.face.charToGlyph)))
+
+
+class FontManager:
+    """The configured TrueType fonts, registered on first use in each process"""
+
+    def __init__(self, paths=DEFAULT_FONT_PATHS):
+        self.paths = tuple(path for path in paths if os.path.isfile(path))
+        self.fonts = None
+        self._lock = threading.Lock()
+
+    @property
+    def signature(self):
+        """Identifies the font set, for cache keys of rendered PDFs"""
+        return tuple(os.path.basename(path) for path in self.paths)
+
+    def load(self):
+        if self.fonts is None:
+            with self._lock:
+                if self.fonts is None:
+                    fonts = []
+                    for path in self.paths:
+                        try:
+                            fonts.append(register_font(path))
+                        except Exception as e:
+                            logger.error(f'Font load error for {path}: {str(e)}')
+                    self.fonts = fonts
+        return self.fonts
+
+    def select(self, texts):
+        """The font for a document showing `texts`.
+
+        Helvetica when it can draw every character; otherwise the TrueType
+        font missing the fewest characters, earlier paths winning ties.
+        """
+        chars = set()
+        for text in texts:
+            if text:
+                chars.update(str(text))
+        chars -= CONTROL_CHARACTERS
+        if chars <= HELVETICA.glyphs:
+            return HELVETICA
+        fonts = self.load()
+        if not fonts:
+            return HELVETICA
+        return min(fonts, key=lambda font: len(chars - font.glyphs))
+
+
+_manager = FontManager()
+
+
+def configure_fonts(paths=None):
+    """Use the TrueType fonts at `paths` (or the defaults) in this process"""
+    global _manager
+    _manager = FontManager(paths or DEFAULT_FONT_PATHS)
+    if not _manager.paths:
+        logger.warning('No PDF_FONTS found; invoices with non-Latin text will use Helvetica')
+    return _manager
+
+
+def pdf_fonts():
+    """The font manager in use"""
+    return _manager
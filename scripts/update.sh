@@ -29,11 +29,6 @@ sleep 30
 
 # Run any migrations or updates
 echo "Running database migrations..."
-docker-compose exec web python -c "
-from app import app, db
-with app.app_context():
-    db.create_all()
-    print('Database updated successfully')
-"
+docker-compose exec web flask --app app init-db
 
 echo "✅ Update completed successfully!"
\ No newline at end of file
@@ -0,0 +1,240 @@
+# throttling.py - Login brute-force protection for the Invoice Generator
+"""
+Failed logins are counted in sliding windows per account (email) and per
+client IP. Once either window is full, login() refuses the attempt before
+loading the user or hashing anything, so a credential-stuffing run costs a
+couple of counter lookups per request instead of a password hash.
+
+Windows live in Redis when LOGIN_THROTTLE_REDIS_URL is set, shared by every
+worker, and in process memory otherwise. A Redis outage falls back to
+memory rather than locking everyone out.
+
+Unknown emails are checked against a dummy hash, so they take as long as
+real accounts and response times don't reveal which emails exist.
+
+User.failed_login_attempts and last_login_attempt are written behind: the
+request only updates an in-memory buffer, flushed every
+LOGIN_COUNTER_FLUSH_INTERVAL seconds with one UPDATE per user.
+"""
+import atexit
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from models import db, User, begin_write
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+STORE_RETRY_SECONDS = 30
+
+
+class MemoryWindow:
+    """Sliding-window event log per key, in this process"""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._events = {}
+        self._lock = threading.Lock()
+
+    def _prune(self, events, since):
+        while events and events[0] <= since:
+            events.popleft()
+
+    def count(self, key, window, now):
+        with self._lock:
+            events = self._events.get(key)
+            if not events:
+                return 0, 0.0
+            self._prune(events, now - window)
+            return len(events), (events[0] + window - now) if events else 0.0
+
+    def add(self, key, window, now):
+        with self._lock:
+            if key not in self._events and len(self._events) >= self.max_keys:
+                # Drop keys whose windows have emptied; a flood of new keys can't grow this forever
+                for stale in [k for k, events in self._events.items() if not events or events[-1] <= now - window]:
+                    del self._events[stale]
+                if len(self._events) >= self.max_keys:
+                    self._events.pop(next(iter(self._events)))
+            events = self._events.setdefault(key, deque())
+            self._prune(events, now - window)
+            events.append(now)
+
+    def reset(self, key):
+        with self._lock:
+            self._events.pop(key, None)
+
+
+class RedisWindow:
+    """Sliding-window event log per key in a Redis sorted set, shared by all workers"""
+
+    def __init__(self, client, prefix='invoicer:login:'):
+        self.client = client
+        self.prefix = prefix
+
+    def count(self, key, window, now):
+        key = self.prefix + key
+        pipe = self.client.pipeline()
+        pipe.zremrangebyscore(key, 0, now - window)
+        pipe.zcard(key)
+        pipe.zrange(key, 0, 0, withscores=True)
+        _, count, oldest = pipe.execute()
+        return count, (oldest[0][1] + window - now) if oldest else 0.0
+
+    def add(self, key, window, now):
+        key = self.prefix + key
+        pipe = self.client.pipeline()
+        pipe.zadd(key, {f'{now}:{secrets.token_hex(4)}': now})
+        pipe.zremrangebyscore(key, 0, now - window)
+        pipe.expire(key, int(window) + 1)
+        pipe.execute()
+
+    def reset(self, key):
+        self.client.delete(self.prefix + key)
+
+
+class LoginCounters:
+    """Write-behind buffer for User.failed_login_attempts and last_login_attempt"""
+
+    def __init__(self, app, interval):
+        self.app = app
+        self.interval = interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def failure(self, user_id, at):
+        self._record(user_id, at, reset=False)
+
+    def success(self, user_id, at):
+        self._record(user_id, at, reset=True)
+
+    def _record(self, user_id, at, reset):
+        with self._lock:
+            failures, _, _ = self._pending.get(user_id, (0, None, False))
+            self._pending[user_id] = (0 if reset else failures + 1, at, reset)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='login-counters', daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f'Login counter flush error: {str(e)}')
+
+    def flush(self):
+        """Write the buffered counters; returns how many users were updated"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        user = User.__table__
+        resets = [{'uid': user_id, 'at': at, 'failures': failures}
+                  for user_id, (failures, at, reset) in pending.items() if reset]
+        increments = [{'uid': user_id, 'at': at, 'failures': failures}
+                      for user_id, (failures, at, reset) in pending.items() if not reset]
+        with self.app.app_context():
+            begin_write()
+            # updated_at is left alone: it versions the user's cached pages
+            for rows, failures in ((resets, db.bindparam('failures')),
+                                   (increments, db.func.coalesce(user.c.failed_login_attempts, 0) + db.bindparam('failures'))):
+                if rows:
+                    db.session.execute(
+                        db.update(user).where(user.c.id == db.bindparam('uid'))
+                        .values(failed_login_attempts=failures, last_login_attempt=db.bindparam('at'),
+                                updated_at=user.c.updated_at),
+                        rows
+                    )
+            db.session.commit()
+        return len(pending)
+
+
+class LoginThrottle:
+    """Account and IP login throttle; see the module docstring"""
+
+    def __init__(self, app):
+        config = app.config
+        self.window = config['LOGIN_THROTTLE_WINDOW']
+        self.account_limit = config['LOGIN_ACCOUNT_MAX_FAILURES']
+        self.ip_limit = config['LOGIN_IP_MAX_FAILURES']
+        self.memory = MemoryWindow()
+        self.store = self.memory
+        url = config['LOGIN_THROTTLE_REDIS_URL']
+        if url and redis is not None:
+            self.store = RedisWindow(redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5))
+        self.store_down_until = 0.0
+        self.counters = LoginCounters(app, config['LOGIN_COUNTER_FLUSH_INTERVAL'])
+        self.pid = os.getpid()
+
+    def _call(self, method, *args):
+        if self.store is self.memory or time.monotonic() < self.store_down_until:
+            return getattr(self.memory, method)(*args)
+        try:
+            return getattr(self.store, method)(*args)
+        except Exception as e:
+            # Don't wait on a dead server for every login; try it again later
+            self.store_down_until = time.monotonic() + STORE_RETRY_SECONDS
+            logger.warning(f'Login throttle store unavailable, using memory for {STORE_RETRY_SECONDS}s: {str(e)}')
+            return getattr(self.memory, method)(*args)
+
+    def keys(self, email, ip):
+        return ((f'account:{email}', self.account_limit), (f'ip:{ip}', self.ip_limit))
+
+    def retry_after(self, email, ip, now=None):
+        """Seconds until this email/IP may try again, or 0 if it may now"""
+        now = now or time.time()
+        wait = 0.0
+        for key, limit in self.keys(email, ip):
+            count, resets_in = self._call('count', key, self.window, now)
+            if count >= limit:
+                wait = max(wait, resets_in)
+        return wait
+
+    def failure(self, email, ip, user=None, now=None):
+        now = now or time.time()
+        for key, _ in self.keys(email, ip):
+            self._call('add', key, self.window, now)
+        if user is not None:
+            self.counters.failure(user.id, datetime.utcfromtimestamp(now))
+
+    def success(self, email, ip, user, now=None):
+        now = now or time.time()
+        self._call('reset', f'account:{email}')
+        self.counters.success(user.id, datetime.utcfromtimestamp(now))
+
+
+def login_throttle(app=None):
+    """The app's throttle for this process"""
+    app = app or current_app._get_current_object()
+    throttle = app.extensions.get('login_throttle')
+    if throttle is None or throttle.pid != os.getpid():
+        throttle = app.extensions['login_throttle'] = LoginThrottle(app)
+    return throttle
+
+
+_dummy_hash = None
+
+
+def dummy_password_check(password):
+    """Spend as long as checking a real password would, for emails with no account"""
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = generate_password_hash(secrets.token_urlsafe(16))
+    check_password_hash(_dummy_hash, password)
+    return False
@@ -0,0 +1,323 @@
+# webhooks.py - Webhook delivery for the Invoice Generator
+"""
+Invoice changes queue WebhookDelivery rows in the same transaction that
+makes them (see emit_invoice_events() in models.py); requests never talk
+to a customer's endpoint. `flask dispatch-webhooks` runs an asyncio loop
+that claims due deliveries, groups them per endpoint into batches of up to
+WEBHOOK_BATCH_SIZE events and POSTs them over a shared, keep-alive httpx
+connection pool. Each dispatcher keeps at most WEBHOOK_CONCURRENCY requests
+in flight per endpoint, so one slow receiver can't hold up the others.
+
+Each request body is {"events": [...]}, signed with the webhook's secret:
+
+    X-Invoicer-Timestamp: <unix seconds>
+    X-Invoicer-Signature: sha256=<hex HMAC-SHA256 of "<timestamp>.<body>">
+
+A 2xx marks the batch delivered. Anything else is retried with exponential
+backoff up to WEBHOOK_MAX_ATTEMPTS, except 410 Gone, which turns the webhook
+off. With more than one request in flight per endpoint, events may arrive
+out of order; each carries its id and created_at.
+
+Endpoints are checked for public addresses when a webhook is saved and
+again on every new connection: the dispatcher resolves the host itself,
+refuses private addresses and connects to the address it checked, so a DNS
+record changed after the first check can't point deliveries inward. TLS is
+still verified against the URL's hostname.
+
+Database work runs on a single thread beside the event loop.
+"""
+import asyncio
+import hashlib
+import hmac
+import ipaddress
+import socket
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+from flask import current_app
+
+from jobs import retry_delay
+from models import db, Webhook, WebhookDelivery, begin_write
+
+try:
+    import httpcore
+    import httpx
+except ImportError:
+    httpx = None
+
+WEBHOOKS_AVAILABLE = httpx is not None
+
+WebhookBatch = namedtuple('WebhookBatch', ['webhook_id', 'url', 'secret', 'delivery_ids', 'payloads'])
+
+
+def sign(secret, timestamp, body):
+    """Hex HMAC-SHA256 of "<timestamp>.<body>"; receivers recompute it to verify"""
+    return hmac.new(secret.encode(), f'{timestamp}.'.encode() + body, hashlib.sha256).hexdigest()
+
+
+def signed_headers(secret, body, timestamp=None):
+    timestamp = int(timestamp or time.time())
+    return {
+        'Content-Type': 'application/json',
+        'X-Invoicer-Timestamp': str(timestamp),
+        'X-Invoicer-Signature': f'sha256={sign(secret, timestamp, body)}'
+    }
+
+
+def is_public_address(address):
+    ip = ipaddress.ip_address(address.split('%')[0])
+    return not (ip.is_private or ip.is_loopback or ip.is_link_local or ip.is_reserved or ip.is_multicast)
+
+
+def default_port(parts):
+    return parts.port or (443 if parts.scheme == 'https' else 80)
+
+
+def webhook_url_error(url):
+    """Why `url` can't be used as an endpoint, or None if it can.
+
+    Hosts resolving to private, loopback or link-local addresses are refused
+    unless WEBHOOK_ALLOW_PRIVATE is set, so a webhook can't be used to reach
+    internal services.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        return 'Webhook URLs must start with http:// or https://'
+    if current_app.config['WEBHOOK_ALLOW_PRIVATE']:
+        return None
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(parts.hostname, default_port(parts))}
+    except (socket.gaierror, UnicodeError):
+        return f'Could not resolve {parts.hostname}'
+    if not all(map(is_public_address, addresses)):
+        return 'Webhook URLs must point at a public address'
+    return None
+
+
+if WEBHOOKS_AVAILABLE:
+    class PublicAddressBackend(httpcore.AsyncNetworkBackend):
+        """Resolves hosts itself and only connects to public addresses"""
+
+        def __init__(self):
+            self.backend = httpcore.AnyIOBackend()
+
+        async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+            loop = asyncio.get_running_loop()
+            try:
+                infos = await asyncio.wait_for(loop.getaddrinfo(host, port, type=socket.SOCK_STREAM), timeout)
+            except (OSError, UnicodeError, asyncio.TimeoutError) as e:
+                raise httpcore.ConnectError(f'Could not resolve {host}: {e}') from e
+            addresses = [info[4][0] for info in infos]
+            if not addresses or not all(map(is_public_address, addresses)):
+                raise httpcore.ConnectError(f'{host} does not resolve to a public address')
+            return await self.backend.connect_tcp(addresses[0], port, timeout=timeout,
+                                                  local_address=local_address, socket_options=socket_options)
+
+        async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+            raise httpcore.ConnectError('Webhooks are not delivered over unix sockets')
+
+        async def sleep(self, seconds):
+            await self.backend.sleep(seconds)
+
+
+    class PublicAddressTransport(httpx.AsyncHTTPTransport):
+        """httpx transport whose connections are pinned to checked public addresses"""
+
+        def __init__(self, limits):
+            super().__init__(limits=limits)
+            self._pool = httpcore.AsyncConnectionPool(
+                ssl_context=httpx.create_ssl_context(),
+                max_connections=limits.max_connections,
+                max_keepalive_connections=limits.max_keepalive_connections,
+                keepalive_expiry=limits.keepalive_expiry,
+                network_backend=PublicAddressBackend()
+            )
+
+
+def claim_batches(in_flight):
+    """Mark due deliveries as sending and group them into per-endpoint batches.
+
+    `in_flight` counts the batches already being sent per webhook; no more
+    are claimed for an endpoint than its free concurrency slots allow.
+    """
+    config = current_app.config
+    now = datetime.utcnow()
+    begin_write()
+    rows = db.session.execute(
+        db.select(WebhookDelivery.id, WebhookDelivery.webhook_id, WebhookDelivery.payload)
+        .where(WebhookDelivery.status == 'pending', WebhookDelivery.next_attempt_at <= now)
+        .order_by(WebhookDelivery.next_attempt_at, WebhookDelivery.created_at)
+        .limit(config['WEBHOOK_CLAIM_LIMIT'])
+        .with_for_update(skip_locked=True)
+    ).all()
+    grouped = {}
+    for delivery_id, webhook_id, payload in rows:
+        grouped.setdefault(webhook_id, []).append((delivery_id, payload))
+    webhooks = {webhook.id: webhook for webhook in
+                Webhook.query.filter(Webhook.id.in_(list(grouped)), Webhook.active.is_(True))}
+
+    batches, claimed, orphaned = [], [], []
+    size = config['WEBHOOK_BATCH_SIZE']
+    for webhook_id, deliveries in grouped.items():
+        webhook = webhooks.get(webhook_id)
+        if webhook is None:
+            orphaned.extend(delivery_id for delivery_id, _ in deliveries)
+            continue
+        slots = max(0, config['WEBHOOK_CONCURRENCY'] - in_flight.get(webhook_id, 0))
+        for start in range(0, min(len(deliveries), slots * size), size):
+            chunk = deliveries[start:start + size]
+            batches.append(WebhookBatch(webhook_id, webhook.url, webhook.secret,
+                                        [delivery_id for delivery_id, _ in chunk],
+                                        [payload for _, payload in chunk]))
+            claimed.extend(delivery_id for delivery_id, _ in chunk)
+    if claimed:
+        db.session.execute(
+            db.update(WebhookDelivery).where(WebhookDelivery.id.in_(claimed))
+            .values(status='sending', locked_at=now, attempts=WebhookDelivery.attempts + 1)
+            .execution_options(synchronize_session=False)
+        )
+    if orphaned:
+        db.session.execute(
+            db.update(WebhookDelivery).where(WebhookDelivery.id.in_(orphaned))
+            .values(status='failed', last_error='Webhook was disabled')
+            .execution_options(synchronize_session=False)
+        )
+    db.session.commit()
+    return batches
+
+
+def batch_body(batch):
+    # Payloads are stored as JSON already; join them instead of re-encoding
+    return ('{"events":[' + ','.join(batch.payloads) + ']}').encode()
+
+
+async def post_batch(client, batch):
+    """POST one batch; returns (batch, status code or None, error or None)"""
+    body = batch_body(batch)
+    headers = {**signed_headers(batch.secret, body), 'X-Invoicer-Delivery': batch.delivery_ids[0]}
+    try:
+        response = await client.post(batch.url, content=body, headers=headers)
+    except httpx.HTTPError as e:
+        return batch, None, f'{type(e).__name__}: {e}'[:1000]
+    if 200 <= response.status_code < 300:
+        return batch, response.status_code, None
+    return batch, response.status_code, f'HTTP {response.status_code}'
+
+
+def record_results(results):
+    """Store the outcome of finished batches; failures are rescheduled or given up"""
+    config = current_app.config
+    now = datetime.utcnow()
+    begin_write()
+    for batch, status_code, error in results:
+        webhook = db.session.get(Webhook, batch.webhook_id)
+        if webhook is None:
+            continue  # deleted while the batch was out, along with its deliveries
+        webhook.last_delivery_at = now
+        webhook.last_status_code = status_code
+        webhook.last_error = error
+        if error is None:
+            db.session.execute(
+                db.update(WebhookDelivery).where(WebhookDelivery.id.in_(batch.delivery_ids))
+                .values(status='delivered', delivered_at=now, locked_at=None,
+                        last_status_code=status_code, last_error=None)
+                .execution_options(synchronize_session=False)
+            )
+            continue
+        # The receiver says the endpoint is gone for good
+        if status_code == 410:
+            webhook.active = False
+        for delivery in WebhookDelivery.query.filter(WebhookDelivery.id.in_(batch.delivery_ids)):
+            delivery.locked_at = None
+            delivery.last_status_code = status_code
+            delivery.last_error = error
+            if webhook.active and delivery.attempts < config['WEBHOOK_MAX_ATTEMPTS']:
+                delivery.status = 'pending'
+                delivery.next_attempt_at = now + timedelta(seconds=retry_delay(
+                    delivery.attempts, config['WEBHOOK_BACKOFF_BASE'], config['WEBHOOK_BACKOFF_MAX']))
+            else:
+                delivery.status = 'failed'
+    db.session.commit()
+
+
+def recover_stale_deliveries():
+    """Requeue deliveries left sending by a dispatcher that died; prune old ones"""
+    config = current_app.config
+    now = datetime.utcnow()
+    begin_write()
+    recovered = db.session.execute(
+        db.update(WebhookDelivery)
+        .where(WebhookDelivery.status == 'sending',
+               WebhookDelivery.locked_at < now - timedelta(seconds=config['WEBHOOK_TIMEOUT'] * 4))
+        .values(status='pending', next_attempt_at=now, locked_at=None)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.execute(
+        db.delete(WebhookDelivery)
+        .where(WebhookDelivery.status.in_(('delivered', 'failed')),
+               WebhookDelivery.created_at < now - timedelta(days=config['WEBHOOK_RETENTION_DAYS']))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return recovered
+
+
+def call_in_app(app, f, *args):
+    with app.app_context():
+        return f(*args)
+
+
+async def dispatch(app, burst=False, should_stop=lambda: False):
+    """Deliver webhooks until stopped. Returns {'delivered': n, 'failed': n} batch counts.
+
+    With `burst` it returns once nothing is due or in flight instead of
+    polling every WEBHOOK_POLL_INTERVAL seconds.
+    """
+    if not WEBHOOKS_AVAILABLE:
+        raise RuntimeError('Webhook delivery needs httpx: pip install httpx')
+    config = app.config
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='webhooks-db')
+
+    def in_db_thread(f, *args):
+        return loop.run_in_executor(executor, call_in_app, app, f, *args)
+
+    in_flight, tasks, outcome = Counter(), set(), Counter()
+    last_recovery = 0.0
+    limits = httpx.Limits(max_connections=config['WEBHOOK_MAX_CONNECTIONS'],
+                          max_keepalive_connections=config['WEBHOOK_MAX_CONNECTIONS'])
+    if config['WEBHOOK_ALLOW_PRIVATE']:
+        transport = httpx.AsyncHTTPTransport(limits=limits)
+    else:
+        transport = PublicAddressTransport(limits)
+    client = httpx.AsyncClient(timeout=config['WEBHOOK_TIMEOUT'], transport=transport, follow_redirects=False,
+                               headers={'User-Agent': 'Invoicer-Webhooks/1.0'})
+    try:
+        while True:
+            if not should_stop():
+                if time.monotonic() - last_recovery > config['WEBHOOK_TIMEOUT']:
+                    await in_db_thread(recover_stale_deliveries)
+                    last_recovery = time.monotonic()
+                for batch in await in_db_thread(claim_batches, dict(in_flight)):
+                    in_flight[batch.webhook_id] += 1
+                    tasks.add(asyncio.create_task(post_batch(client, batch)))
+            if not tasks:
+                if burst or should_stop():
+                    break
+                await asyncio.sleep(config['WEBHOOK_POLL_INTERVAL'])
+                continue
+            done, tasks = await asyncio.wait(tasks, timeout=config['WEBHOOK_POLL_INTERVAL'],
+                                             return_when=asyncio.FIRST_COMPLETED)
+            results = [task.result() for task in done]
+            for batch, status_code, error in results:
+                in_flight[batch.webhook_id] -= 1
+                outcome['delivered' if error is None else 'failed'] += 1
+            if results:
+                await in_db_thread(record_results, results)
+    finally:
+        await client.aclose()
+        executor.shutdown()
+    return dict(outcome)
@@ -0,0 +1,5 @@
+# wsgi.py - WSGI entry point for production servers (gunicorn wsgi:app)
+from app import create_app, verify_schema
+
+app = create_app()
+verify_schema(app)